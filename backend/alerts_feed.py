@@ -0,0 +1,394 @@
+import bisect
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from evidence_index import NOTICES_PAGE, SOURCE_ROOT, notice_key, read_notices
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# One feed behind fake.html and noti.html: the official notifications from
+# noti.html and the fakes our pipelines debunked, newest first. It is kept
+# materialized in memory and updated incrementally (new verdict rows are
+# tailed from the verdict store, noti.html is re-read when it changes), and
+# each distinct page is serialized and compressed once per change, so a
+# poll that finds nothing new costs a dict lookup or a 304.
+ALERT_CONFIDENCE = ("HIGH", "MEDIUM")
+MAX_FAKES = int(os.getenv("ALERTS_MAX_FAKES", 500))
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# The store and noti.html are checked for changes at most this often (seconds)
+REFRESH_INTERVAL = float(os.getenv("ALERTS_REFRESH", 1.0))
+# Long-polls hold a worker thread; past this many, polls are turned away
+# (FeedBusy) and told when to come back
+MAX_WAITERS = int(os.getenv("ALERTS_MAX_WAITERS", 64))
+BUSY_RETRY_AFTER = 5
+MAX_WAIT = float(os.getenv("ALERTS_MAX_WAIT", 25))
+RENDER_CACHE = 64
+MIN_COMPRESS_BYTES = 512
+
+_MONTHS = {m: i for i, m in enumerate(
+    ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"), 1)}
+
+
+class FeedBusy(RuntimeError):
+    """Every long-poll slot is taken; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after=BUSY_RETRY_AFTER):
+        super().__init__(f"{MAX_WAITERS} long-polls already waiting")
+        self.retry_after = retry_after
+
+
+# --- CURSORS ---
+
+def _cursor(key):
+    return f"{key[0]}.{key[1]}"
+
+
+def parse_cursor(cursor):
+    """"<ms>.<item id>" (or just a unix time in ms) -> sort key.
+    ValueError if malformed."""
+    ms, _, item_id = str(cursor).partition(".")
+    return int(ms), item_id
+
+
+def _notice_time(fields):
+    try:
+        day = datetime.date(int(fields["year"]), _MONTHS[fields["month"].upper()], int(fields["day"]))
+    except (KeyError, ValueError):
+        return 0.0
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _iso_date(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).date().isoformat()
+
+
+# --- HTTP HELPERS ---
+
+def negotiate(accept_encoding):
+    """Best content coding we can produce for an Accept-Encoding header."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match (weak comparison, any content coding) against our tag."""
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        tag = tag[2:] if tag.startswith("W/") else tag
+        if tag.strip('"').split("-")[0] == base:
+            return True
+    return False
+
+
+class Rendered:
+    """One serialized response body, compressed lazily once per coding."""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+        self.empty = not payload.get("items")
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, accept_encoding):
+        """(content coding or None, body, ETag) for a request."""
+        coding = negotiate(accept_encoding) if len(self.body) >= MIN_COMPRESS_BYTES else None
+        if coding is None:
+            return None, self.body, self.etag
+        with self._lock:
+            body = self._encoded.get(coding)
+            if body is None:
+                if coding == "br":
+                    body = brotli.compress(self.body, quality=9)
+                else:
+                    body = gzip.compress(self.body, compresslevel=9, mtime=0)
+                self._encoded[coding] = body
+        # A strong tag names one exact byte sequence, so each coding has its own
+        return coding, body, f'{self.etag[:-1]}-{coding}"'
+
+
+# --- FEED ---
+
+class AlertsFeed:
+    """Notifications and debunked fakes, ordered by (time, id).
+
+    Items carry a `cursor`. Pages walk back from the newest item
+    (`cursor=` the last one seen); `since=` returns what is newer than a
+    cursor, oldest first, and can wait for it (long-poll). Notifications
+    are dated by their publication day, fakes by their latest verdict.
+    A fake checked again moves to the top with the new verdict instead of
+    appearing twice. Since-polling only sees items dated after the cursor,
+    so a notice added to noti.html with an older date shows up in pages
+    (and changes their ETag) but not in a since-poll.
+    """
+
+    def __init__(self, store=None, root=SOURCE_ROOT, max_fakes=MAX_FAKES):
+        self.store = store
+        self.path = os.path.join(root, NOTICES_PAGE)
+        self.max_fakes = max_fakes
+        self._items = {}   # id -> item
+        self._order = []   # sorted (ms, id)
+        self._fakes = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._refreshing = threading.Lock()
+        self._waiters = threading.BoundedSemaphore(MAX_WAITERS)
+        self._notices_stamp = None
+        self._last_row = 0
+        self._checked = 0.0
+        self._rendered = {}
+        self.version = 0
+        self.renders = 0
+        self.served = 0
+        self.refresh(force=True)
+        if store is not None:
+            store.on_commit(self._committed)
+
+    # --- MAINTENANCE ---
+
+    def _committed(self):
+        # Runs on the verdict store's writer thread: only mark the feed stale
+        # and wake the long-polls, which refresh it themselves
+        self._checked = 0.0
+        with self._changed:
+            self._changed.notify_all()
+
+    def refresh(self, force=False):
+        """Applies new verdict rows and noti.html edits. Cheap when nothing changed."""
+        now = time.monotonic()
+        if not force and now - self._checked < REFRESH_INTERVAL:
+            return
+        # One thread refreshes; the others serve what is there
+        if not self._refreshing.acquire(blocking=force):
+            return
+        try:
+            self._checked = now
+            changes = self._refresh_notices() + self._tail_store()
+            if changes:
+                with self._lock:
+                    for item in changes:
+                        self._put(item)
+                    self._trim()
+                    self.version += 1
+                    self._rendered.clear()
+                    self._changed.notify_all()
+        finally:
+            self._refreshing.release()
+
+    def _refresh_notices(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._notices_stamp:
+            return []
+        self._notices_stamp = stamp
+        changes = []
+        current = set()
+        for fields in read_notices(os.path.dirname(self.path)):
+            item = {
+                "id": notice_key(fields["name"]),
+                "kind": "notification",
+                "title": fields["name"],
+                "category": fields.get("category", ""),
+                "summary": fields.get("summary", []),
+                "url": fields.get("pdf_url", ""),
+            }
+            ts = _notice_time(fields)
+            item["date"] = _iso_date(ts) if ts else None
+            current.add(item["id"])
+            old = self._items.get(item["id"])
+            if old is None or {k: v for k, v in old.items() if k != "cursor"} != item:
+                changes.append(dict(item, _ts=ts))
+        for item_id, item in list(self._items.items()):
+            if item["kind"] == "notification" and item_id not in current:
+                changes.append({"id": item_id, "_removed": True})
+        return changes
+
+    def _tail_store(self):
+        if self.store is None:
+            return []
+        if self._last_row == 0:
+            # Cold start: only the newest verdicts can still make the feed
+            rows = self.store.recent(self.max_fakes * 4, verdict="FAKE")[::-1]
+        else:
+            rows = self.store.after(self._last_row, verdict="FAKE")
+        changes = []
+        for row in rows:
+            self._last_row = max(self._last_row, row["id"])
+            if row["confidence"] not in ALERT_CONFIDENCE or not (row["claim_hash"] or row["image_hash"]):
+                continue
+            item_id = f"fake:{row['claim_hash']}" if row["claim_hash"] else f"fake:image:{row['image_hash']}"
+            previous = next((c for c in reversed(changes) if c["id"] == item_id), None) or self._items.get(item_id)
+            sources = row["sources"] or []
+            changes.append({
+                "id": item_id,
+                "kind": "fake",
+                "title": row["claim"],
+                "verdict": row["verdict"],
+                "type": row["type"],
+                "confidence": row["confidence"],
+                "reasoning": row["reasoning"],
+                "sources": [sources] if isinstance(sources, str) else sources,
+                "date": _iso_date(row["created_at"]),
+                "checks": (previous or {}).get("checks", 0) + 1,
+                "_ts": row["created_at"],
+            })
+        return changes
+
+    def _put(self, item):
+        old = self._items.pop(item["id"], None)
+        if old is not None:
+            key = parse_cursor(old["cursor"])
+            del self._order[bisect.bisect_left(self._order, key)]
+            self._fakes -= old["kind"] == "fake"
+        if item.get("_removed"):
+            return
+        key = (int(item.pop("_ts") * 1000), item["id"])
+        item["cursor"] = _cursor(key)
+        bisect.insort(self._order, key)
+        self._items[item["id"]] = item
+        self._fakes += item["kind"] == "fake"
+
+    def _trim(self):
+        i = 0
+        while self._fakes > self.max_fakes and i < len(self._order):
+            item = self._items[self._order[i][1]]
+            if item["kind"] == "fake":
+                del self._order[i]
+                del self._items[item["id"]]
+                self._fakes -= 1
+            else:
+                i += 1
+
+    # --- READS ---
+
+    def _render(self, key, build):
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is None:
+                if len(self._rendered) >= RENDER_CACHE:
+                    self._rendered.clear()
+                rendered = self._rendered[key] = Rendered(build())
+                self.renders += 1
+            self.served += 1
+            return rendered
+
+    def _matching(self, keys, kind):
+        for key in keys:
+            item = self._items[key[1]]
+            if kind is None or item["kind"] == kind:
+                yield item
+
+    def _head(self, kind):
+        return next((item["cursor"] for item in self._matching(reversed(self._order), kind)), None)
+
+    def head(self, kind=None):
+        """Cursor of the newest item ("0" when empty): where polling starts."""
+        self.refresh()
+        with self._lock:
+            return self._head(kind) or "0"
+
+    def page(self, kind=None, limit=PAGE_SIZE, cursor=None):
+        """Newest first, starting below `cursor` (or at the top)."""
+        self.refresh()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        before = parse_cursor(cursor) if cursor else None
+
+        def build():
+            end = bisect.bisect_left(self._order, before) if before else len(self._order)
+            items = []
+            for item in self._matching(reversed(self._order[:end]), kind):
+                items.append(item)
+                if len(items) == limit:
+                    break
+            return {
+                "items": items,
+                "next": items[-1]["cursor"] if len(items) == limit else None,
+                "head": self._head(kind),
+            }
+
+        return self._render(("page", kind, limit, cursor), build)
+
+    def since(self, cursor, kind=None, limit=MAX_PAGE_SIZE):
+        """Items newer than `cursor`, oldest first; `head` is the cursor to poll with next."""
+        self.refresh()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        after = parse_cursor(cursor)
+
+        def build():
+            start = bisect.bisect_right(self._order, after)
+            items = []
+            for item in self._matching(self._order[start:], kind):
+                items.append(item)
+                if len(items) == limit:
+                    break
+            return {"items": items, "head": items[-1]["cursor"] if items else cursor,
+                    "more": len(items) == limit}
+
+        return self._render(("since", kind, limit, cursor), build)
+
+    def wait(self, cursor, kind=None, limit=MAX_PAGE_SIZE, timeout=MAX_WAIT):
+        """Long-poll: `since()`, but waits up to `timeout` seconds for news.
+        Raises FeedBusy when MAX_WAITERS polls are already waiting."""
+        rendered = self.since(cursor, kind, limit)
+        if not rendered.empty or timeout <= 0:
+            return rendered
+        if not self._waiters.acquire(blocking=False):
+            raise FeedBusy()
+        try:
+            deadline = time.monotonic() + min(timeout, MAX_WAIT)
+            while rendered.empty and time.monotonic() < deadline:
+                version = self.version
+                with self._changed:
+                    # Woken when our own writer commits or another poll
+                    # refreshed; other processes' verdicts are picked up by
+                    # the refresh on the next pass
+                    if self.version == version and self._checked:
+                        self._changed.wait(min(REFRESH_INTERVAL, max(0.0, deadline - time.monotonic())))
+                rendered = self.since(cursor, kind, limit)
+            return rendered
+        finally:
+            self._waiters.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "fakes": self._fakes,
+                "notifications": len(self._items) - self._fakes,
+                "version": self.version,
+                "renders": self.renders,
+                "served": self.served,
+                "brotli": brotli is not None,
+            }
@@ -1,20 +1,20 @@
-import os
-import json
-import PIL.Image
 from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from image_cache import dhash
+from image_ingest import ImageRejected, MAX_UPLOAD_BYTES, load_upload
+from llm_provider import build_provider
+from verdict_store import shared_store
+from verdicts import VERDICT_SCHEMA, read_verdict
 
 load_dotenv()
 app = Flask(__name__)
 
 # Wide open CORS for development
 CORS(app, resources={r"/*": {"origins": "*"}})
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=API_KEY)
+llm = build_provider()
 
 @app.route('/analyze-media', methods=['POST', 'OPTIONS'])
 def analyze_media():
@@ -33,22 +33,18 @@ def analyze_media():
         if not image_file:
             return jsonify({"error": "No image uploaded"}), 400
 
-        temp_path = "temp_analysis.png"
-        image_file.save(temp_path)
-        img = PIL.Image.open(temp_path)
+        img = load_upload(image_file)
 
         # 1. Vision Analysis
-        vlm_res = client.models.generate_content(
-            model="gemini-2.0-flash", 
-            contents=[img, "Identify deepfake artifacts, lighting inconsistencies, or AI generation signs."]
+        vlm_res = llm.generate(
+            "Identify deepfake artifacts, lighting inconsistencies, or AI generation signs.",
+            image=img
         )
 
         # 2. Grounding Search
-        search_tool = types.Tool(google_search=types.GoogleSearch())
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=f"Fact check: {text_claim}. Use this image description as context: {vlm_res.text}",
-            config=types.GenerateContentConfig(tools=[search_tool])
+        response = llm.generate(
+            f"Fact check: {text_claim}. Use this image description as context: {vlm_res.text}",
+            search=True
         )
 
         # 3. Final JSON formatting
@@ -59,12 +55,15 @@ def analyze_media():
         Classify confidence as either 'HIGH' or 'MEDIUM' or 'LOW' based on detection certainty strictly
         No markdown formatting.
         """
-        verdict_res = client.models.generate_content(model="gemini-2.0-flash", contents=final_prompt)
+        verdict_res = llm.generate(final_prompt, response_schema=VERDICT_SCHEMA)
         
-        # Parse text to JSON
-        raw_text = verdict_res.text.strip().replace('```json', '').replace('```', '')
-        return jsonify(json.loads(raw_text))
+        # Parse text to JSON (tolerates truncated or sloppy output)
+        report, _ = read_verdict(verdict_res.text)
+        shared_store().record("app", report, claim=text_claim, image_hash=dhash(img), model=verdict_res.model)
+        return jsonify(report)
 
+    except ImageRejected as e:
+        return jsonify({"verdict": "ERROR", "reasoning": str(e)}), e.status
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"verdict": "ERROR", "reasoning": str(e)}), 500
@@ -0,0 +1,558 @@
+import asyncio
+import os
+import random
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, Response, g, jsonify, request
+
+import main
+import media_frames
+import metrics
+from image_ingest import ImageRejected, MAX_UPLOAD_BYTES
+from scheduler import RateLimited
+from singleflight import TooManyWaiters
+
+# Async serving mode: `python asgi.py` (or `hypercorn asgi:app`) instead of
+# `gunicorn main:app`. /chat, /chat/stream and /analyze-media run here on
+# the event loop with async model calls, so one worker holds as many
+# in-flight upstream calls as the route limits below allow. Every other
+# route is main.py's Flask app, run on its own thread pool. Both modes
+# share main.py's caches, scheduler, stores and prompts.
+#
+# `python asgi.py` drains on SIGTERM before hypercorn closes connections.
+# Under `hypercorn asgi:app` the drain runs at lifespan shutdown, after
+# hypercorn's own --graceful-timeout, so set that to ASGI_DRAIN_SECONDS.
+ROUTE_LIMITS = {
+    "chat": int(os.getenv("ASGI_CHAT_CONCURRENCY", 256)),
+    "chat_stream": int(os.getenv("ASGI_STREAM_CONCURRENCY", 256)),
+    "analyze": int(os.getenv("ASGI_ANALYZE_CONCURRENCY", 128)),
+}
+# How long a request may wait for a free slot on its route before a 429
+ADMISSION_WAIT = float(os.getenv("ASGI_ADMISSION_WAIT", 2))
+# On SIGTERM: stop admitting, then wait this long for in-flight requests
+DRAIN_SECONDS = float(os.getenv("ASGI_DRAIN_SECONDS", 30))
+# Threads for the blocking bits of the async routes (image decoding,
+# forensics, backends without native async calls)
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", 64))
+# Threads for the Flask routes. Long-polls and SSE there (/alerts, job
+# events) hold a thread each, so they get their own pool rather than
+# starving the async routes of theirs.
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 32))
+# Longest we wait for queued verdict writes at shutdown
+FLUSH_SECONDS = float(os.getenv("ASGI_FLUSH_SECONDS", 10))
+
+quart_app = Quart(__name__)
+quart_app.config["MAX_CONTENT_LENGTH"] = max(MAX_UPLOAD_BYTES, media_frames.MAX_MEDIA_BYTES) + 64 * 1024
+llm = main.llm
+
+
+# --- ADMISSION AND DRAINING ---
+
+class Busy(RuntimeError):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RouteGate:
+    """Bounded concurrency for one route. Requests wait up to
+    ADMISSION_WAIT for a slot; none are admitted once draining starts."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._slots = asyncio.Semaphore(limit)
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def enter(self):
+        if _draining.is_set():
+            raise Busy("Server is restarting. Please retry shortly.", 503, 2)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), ADMISSION_WAIT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Busy("The forensic lab is busy right now. Please retry shortly.", 429, 2) from None
+        self.active += 1
+        self.admitted += 1
+
+    def leave(self):
+        self.active -= 1
+        self._slots.release()
+        if _draining.is_set() and not _in_flight():
+            _drained.set()
+
+    async def __aenter__(self):
+        await self.enter()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.leave()
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "admitted": self.admitted, "rejected": self.rejected}
+
+
+gates = {name: RouteGate(name, limit) for name, limit in ROUTE_LIMITS.items()}
+_draining = asyncio.Event()
+_drained = asyncio.Event()
+
+
+def _in_flight():
+    return sum(gate.active for gate in gates.values())
+
+
+async def drain(timeout=DRAIN_SECONDS):
+    """Stops admitting requests, waits for the admitted ones to finish and
+    flushes the verdict store."""
+    _draining.set()
+    if _in_flight():
+        print(f"⏳ Draining {_in_flight()} in-flight requests (up to {timeout:.0f}s)...")
+        try:
+            await asyncio.wait_for(_drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Drain timed out with {_in_flight()} requests still running.")
+    await _flush(FLUSH_SECONDS)
+
+
+async def _flush(timeout):
+    # On a daemon thread rather than to_thread: if the writer is wedged,
+    # asyncio.run would otherwise wait on the executor forever at exit.
+    loop = asyncio.get_running_loop()
+    flushed = asyncio.Event()
+
+    def run():
+        try:
+            main.verdict_store.flush()
+        finally:
+            try:
+                loop.call_soon_threadsafe(flushed.set)
+            except RuntimeError:
+                pass  # the loop has already closed
+
+    threading.Thread(target=run, name="verdict-flush", daemon=True).start()
+    try:
+        await asyncio.wait_for(flushed.wait(), timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Verdict store did not flush within {timeout:.0f}s; unwritten verdicts are lost.")
+
+
+# --- TRACING (as in main.py) ---
+
+@quart_app.before_serving
+async def _startup():
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+    )
+
+
+@quart_app.after_serving
+async def _shutdown():
+    # Lifespan shutdown: the only hook `hypercorn asgi:app` gives us. After
+    # serve()'s own drain this finds nothing in flight and just re-flushes.
+    await drain()
+
+
+@quart_app.before_request
+async def _start_trace():
+    candidate = request.headers.get("X-Request-Id", "")
+    g.trace_id = candidate if main._TRACE_ID_RE.match(candidate) else uuid.uuid4().hex[:16]
+    g.started = time.monotonic()
+    g.timings = {}
+
+
+@quart_app.after_request
+async def _finish_trace(response):
+    elapsed = time.monotonic() - g.started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    response.headers["X-Request-Id"] = g.trace_id
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    if _draining.is_set():
+        response.headers["Connection"] = "close"
+    metrics.log_event(
+        "request", trace_id=g.trace_id, method=request.method, path=request.path,
+        status=response.status_code, duration_ms=round(elapsed * 1000, 1), timings=main._ms(g.timings),
+    )
+    return response
+
+
+def _preflight():
+    response = Response("")
+    response.headers["Access-Control-Allow-Headers"] = "*"
+    response.headers["Access-Control-Allow-Methods"] = "*"
+    return response
+
+
+def _error_response(reasoning, status, retry_after=None):
+    metrics.count_verdict({"verdict": "ERROR"}, "error")
+    response = jsonify({"verdict": "ERROR", "reasoning": reasoning, "sources": random.choice(main.OFFICIAL_SOURCES)})
+    response.status_code = status
+    if retry_after:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def _report_response(report, timings):
+    timings["total"] = time.monotonic() - g.started
+    response = jsonify(report)
+    response.headers["Server-Timing"] = main._server_timing(timings)
+    return response
+
+
+# --- CHAT ---
+
+@quart_app.route('/chat', methods=['POST', 'OPTIONS'])
+async def handle_chat():
+    if request.method == 'OPTIONS':
+        return _preflight()
+    try:
+        async with gates["chat"]:
+            data = await request.get_json(silent=True) or {}
+            user_input = data.get("message", "")
+            if not user_input:
+                return jsonify({"reply": "Please enter a message."}), 400
+            local = main._faq_answer(user_input)
+            if local:
+                return jsonify(local)
+            response = await llm.agenerate(user_input, **main.CHAT_OPTIONS)
+            main._faq_miss(user_input, response.text)
+            return jsonify({"reply": response.text})
+    except (Busy, RateLimited) as e:
+        response = jsonify({"reply": "⚠️ The assistant is busy right now. Please try again in a moment."})
+        response.status_code = getattr(e, "status", 429)
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    except Exception as e:
+        print(f"Chat Error: {e}")
+        return jsonify({"reply": "⚠️ System Error: Unable to process chat request."}), 500
+
+
+@quart_app.route('/chat/stream', methods=['POST', 'OPTIONS'])
+async def handle_chat_stream():
+    if request.method == 'OPTIONS':
+        return _preflight()
+    data = await request.get_json(silent=True) or {}
+    user_input = data.get("message", "")
+    if not user_input:
+        return jsonify({"reply": "Please enter a message."}), 400
+    local = main._faq_answer(user_input)
+    if local:
+        body = main._sse({"delta": local["reply"]}) + main._sse({"faq": local["faq"]}, event="done")
+        return Response(body.encode("utf-8"), mimetype="text/event-stream")
+    gate = gates["chat_stream"]
+    try:
+        await gate.enter()
+    except Busy as e:
+        response = jsonify({"reply": "⚠️ The assistant is busy right now. Please try again in a moment."})
+        response.status_code = e.status
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+
+    # The slot is held until the stream ends, not just until we return.
+    # A client that goes away cancels this generator, which closes the
+    # upstream stream and stops generation.
+    async def events():
+        upstream = None
+        try:
+            upstream = llm.astream(user_input, **main.CHAT_OPTIONS)
+            parts = []
+            async for text in upstream:
+                parts.append(text)
+                yield main._sse({"delta": text}).encode("utf-8")
+            yield main._sse({}, event="done").encode("utf-8")
+            main._faq_miss(user_input, "".join(parts))
+        except asyncio.CancelledError:
+            print("Chat stream: client disconnected, stopping generation.")
+            raise
+        except RateLimited as e:
+            yield main._sse({"reply": "⚠️ The assistant is busy right now. Please try again in a moment.",
+                             "retry_after": e.retry_after}, event="error").encode("utf-8")
+        except Exception as e:
+            print(f"Chat Stream Error: {e}")
+            yield main._sse({"reply": "⚠️ System Error: Unable to process chat request."}, event="error").encode("utf-8")
+        finally:
+            if upstream is not None:
+                await upstream.aclose()
+            gate.leave()
+
+    response = Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.timeout = None
+    return response
+
+
+# --- FORENSIC LAB ---
+
+async def _atimed(timings, name, awaitable):
+    started = time.monotonic()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = time.monotonic() - started
+        metrics.STAGE_SECONDS.observe(timings[name], stage=name)
+
+
+async def _call(call):
+    prompt, options = call
+    return await llm.agenerate(prompt, **options)
+
+
+async def _stage(timings, name, label, call, budget, fallback):
+    """Text of one evidence call; `fallback` if it misses its budget (the
+    upstream call is cancelled, unlike a thread we stop waiting for)."""
+    try:
+        result = await asyncio.wait_for(_atimed(timings, name, _call(call)), budget)
+        return result.text
+    except asyncio.TimeoutError:
+        print(f"⏱️ {label} stage missed its deadline, continuing without it.")
+        return fallback
+
+
+async def _gather_evidence(text_claim, img, timings, deadline, official, forensic):
+    """main._gather_evidence with both calls awaited side by side."""
+    search_context = "No text claim provided."
+    img, vlm_analysis = main._plan_image_scan(text_claim, img, forensic)
+    if not main.CONCURRENT_STAGES:
+        if img is not None:
+            vlm_analysis = (await _atimed(timings, "vlm", _call(main._scan_image_call(img, deadline, forensic)))).text
+        if text_claim:
+            call = main._search_claim_call(text_claim, vlm_analysis, deadline, official)
+            search_context = (await _atimed(timings, "search", _call(call))).text
+        return search_context, vlm_analysis
+
+    stages = []
+    if img is not None:
+        stages.append(_stage(timings, "vlm", "Image scan", main._scan_image_call(img, deadline, forensic),
+                             main.VLM_TIMEOUT, "No evidence from image scan (timed out)."))
+    if text_claim:
+        stages.append(_stage(timings, "search", "Search", main._search_claim_call(text_claim, None, deadline, official),
+                             main.SEARCH_TIMEOUT, "No evidence from search (timed out)."))
+    results = await asyncio.gather(*stages)
+    if img is not None:
+        vlm_analysis = results.pop(0)
+    if text_claim:
+        search_context = results.pop(0)
+    return search_context, vlm_analysis
+
+
+async def run_analysis(text_claim, img, image_hash, claim_key, timings, forensic=None):
+    """main.run_analysis, step for step, with async model calls."""
+    deadline = time.monotonic() + main.ANALYZE_DEADLINE
+    complete = False
+
+    official, confident = main._index_stage(text_claim, timings)
+    if confident and img is None:
+        result = await _atimed(timings, "local", _call(main._documents_call(text_claim, official, deadline)))
+        report, complete = main._timed(timings, "parse", main._parse_report, result, "local")
+        if main._keep_local_verdict(report, complete, result, text_claim, image_hash, timings, forensic):
+            return report
+        complete = False
+
+    if main._one_pass_applies(text_claim, img):
+        stage = "vlm" if img is not None else "search"
+        if img is not None:
+            metrics.VLM_CALLS.inc(mode="short" if forensic is not None and forensic["strong"] else "full")
+        call = main._one_pass_call(text_claim, img, deadline, official, forensic)
+        result = await _atimed(timings, stage, _call(call))
+        report, complete = main._timed(timings, "parse", main._parse_report, result, stage)
+        vlm_analysis = result.text if img is not None else "No image provided."
+        search_context = result.text if text_claim else "No text claim provided."
+    else:
+        search_context, vlm_analysis = await _gather_evidence(text_claim, img, timings, deadline, official, forensic)
+
+    if not complete:
+        final_prompt = main._synthesis_prompt(search_context, official, vlm_analysis, forensic)
+        result = await _atimed(timings, "synthesis", _call(main._synthesis_call(final_prompt, deadline)))
+        report, complete = main._timed(timings, "parse", main._parse_report, result, "synthesis")
+
+    main._keep_verdict(report, complete, result, text_claim, image_hash, claim_key, timings, forensic)
+    return report
+
+
+async def run_media_analysis(text_claim, scenes, stats, media_key, timings):
+    """main.run_media_analysis: every frame batch and the search awaited side by side."""
+    deadline = time.monotonic() + main.ANALYZE_DEADLINE
+    official, _ = main._index_stage(text_claim, timings)
+    batches = media_frames.batches(scenes)
+    metrics.VLM_CALLS.inc(len(batches), mode="batched")
+    stages = [_stage(timings, "vlm", "Frame scan", main._frames_call(batch, deadline),
+                     main.VLM_TIMEOUT, "No evidence from image scan (timed out).") for batch in batches]
+    if text_claim:
+        stages.append(_stage(timings, "search", "Search", main._search_claim_call(text_claim, None, deadline, official),
+                             main.SEARCH_TIMEOUT, "No evidence from search (timed out)."))
+    answers = await asyncio.gather(*stages)
+    search_context = answers.pop() if text_claim else "No text claim provided."
+
+    final_prompt = main._synthesis_prompt(search_context, official, media_frames.aggregate(scenes, stats, answers), None)
+    result = await _atimed(timings, "synthesis", _call(main._synthesis_call(final_prompt, deadline)))
+    report, complete = main._timed(timings, "parse", main._parse_report, result, "synthesis")
+    main._keep_media_verdict(report, complete, result, text_claim, scenes, stats, media_key, timings)
+    return report
+
+
+# Identical requests in flight share one run, as with main.inflight, and
+# with the same cap on callers waiting for one key
+_inflight = {}  # key -> [task, waiters]
+_rejected = 0
+
+
+async def _run_shared(key, timings, run, *args):
+    global _rejected
+    entry = _inflight.get(key)
+    shared = entry is not None
+    if shared:
+        if entry[1] >= main.inflight.max_waiters:
+            _rejected += 1
+            raise TooManyWaiters(f"{entry[1]} requests already waiting on this key")
+        entry[1] += 1
+    else:
+        task = asyncio.ensure_future(run(*args))
+        entry = _inflight[key] = [task, 0]
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    waited = time.monotonic()
+    try:
+        # shield: a caller that goes away must not cancel the others' run
+        report = await asyncio.shield(entry[0])
+    finally:
+        if shared:
+            entry[1] -= 1
+    if shared:
+        timings["coalesced"] = time.monotonic() - waited
+    return main._public_report(report, shared)
+
+
+async def _analyze_shared(text_claim, img, image_hash, claim_key, timings, forensic):
+    return await _run_shared(f"{image_hash}|{claim_key}", timings,
+                             run_analysis, text_claim, img, image_hash, claim_key, timings, forensic)
+
+
+async def _analyze_media_set(text_claim, images, videos, timings, trace_id):
+    # Reading, decoding (on main.media_pool) and forensics block; keep them off the loop
+    scenes, stats, media_key, cached = await asyncio.to_thread(
+        main._prepare_media, text_claim, images, videos, timings, trace_id
+    )
+    if cached:
+        return dict(main._cached_report(cached), media=stats)
+    report = await _run_shared(media_key, timings, run_media_analysis, text_claim, scenes, stats, media_key, timings)
+    return dict(report, media=stats)
+
+
+@quart_app.route('/analyze-media', methods=['POST', 'OPTIONS'])
+async def analyze_media():
+    if request.method == 'OPTIONS':
+        return _preflight()
+
+    timings = g.timings
+    try:
+        async with gates["analyze"]:
+            form = await request.form
+            files = await request.files
+            uploads = main._media_uploads(files)
+            if uploads:
+                report = await _analyze_media_set(form.get('text', ''), *uploads, timings, g.trace_id)
+                return _report_response(report, timings)
+            # Decoding, registry/cache lookups and forensics are CPU work
+            text_claim, img, image_hash, claim_key, forensic, cached = await asyncio.to_thread(
+                main._prepare_analysis, form.get('text', ''), files.get('image'), timings, g.trace_id
+            )
+            if cached:
+                return _report_response(main._cached_report(cached), timings)
+            report = await _analyze_shared(text_claim, img, image_hash, claim_key, timings, forensic)
+            return _report_response(report, timings)
+
+    except Busy as e:
+        return _error_response(str(e), e.status, retry_after=e.retry_after)
+    except ImageRejected as e:
+        return _error_response(str(e), e.status)
+    except TooManyWaiters:
+        return _error_response("This item is being checked for many users right now. Please retry shortly.", 429,
+                               retry_after=2)
+    except RateLimited as e:
+        return _error_response("The forensic lab is busy right now. Please retry shortly.", 429, retry_after=e.retry_after)
+    except Exception as e:
+        print(f"Error: {e}")
+        return _error_response("System failed to process partial input.", 500)
+
+
+@quart_app.route('/asgi/stats', methods=['GET'])
+async def asgi_stats():
+    return jsonify({
+        "routes": {name: gate.stats() for name, gate in gates.items()},
+        "inflight": len(_inflight),
+        "inflight_rejected": _rejected,
+        "draining": _draining.is_set(),
+    })
+
+
+# --- DISPATCH ---
+
+ASYNC_PATHS = {"/chat", "/chat/stream", "/analyze-media", "/asgi/stats"}
+
+
+class WSGIRoutes(AsyncioWSGIMiddleware):
+    """hypercorn's WSGI middleware, on `executor` instead of the loop's default."""
+
+    def __init__(self, wsgi_app, executor, max_body_size):
+        super().__init__(wsgi_app, max_body_size=max_body_size)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+
+        def call_soon(func, *args):
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        await self.wsgi_app(scope, receive, send, partial(loop.run_in_executor, self.executor), call_soon)
+
+
+_wsgi = WSGIRoutes(
+    main.app,
+    ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi"),
+    # As main.app's MAX_CONTENT_LENGTH: /jobs/analyze-media takes albums and videos
+    max_body_size=max(MAX_UPLOAD_BYTES, media_frames.MAX_MEDIA_BYTES) + 64 * 1024,
+)
+
+
+async def app(scope, receive, send):
+    """The ASGI application: async routes here, everything else to Flask."""
+    if scope["type"] == "http" and scope["path"] not in ASYNC_PATHS:
+        return await _wsgi(scope, receive, send)
+    return await quart_app(scope, receive, send)
+
+
+def serve():
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 5000))}"]
+    config.graceful_timeout = 5  # connections left after our own drain
+    config.keep_alive_timeout = 75
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        async def shutdown_trigger():
+            await stop.wait()
+            print("🛑 Shutdown requested, draining...")
+            await drain()
+
+        await hypercorn_serve(app, config, shutdown_trigger=shutdown_trigger)
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    serve()
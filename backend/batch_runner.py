@@ -0,0 +1,229 @@
+"""Batch fact-checking over exported claim files.
+
+    python batch_runner.py flagged.jsonl -o verdicts.jsonl --pipeline gemini \
+        --concurrency 4 --rpm 60
+
+Input is JSONL ({"id": ..., "claim": ...} per line; "text" also accepted)
+or CSV with a claim/text column. Results are appended to the output JSONL
+as they finish and every finished id goes to a checkpoint file, so running
+the same command again after an interruption skips what is already done.
+"""
+import argparse
+import csv
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llm_provider import parse_json_response
+from verdicts import VERDICTS
+
+
+# --- INPUT ---
+
+def _claim_id(row, claim):
+    given = row.get("id")
+    if given not in (None, ""):
+        return str(given)
+    return hashlib.sha1(claim.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def read_claims(path):
+    """Yields (claim_id, claim) pairs without loading the whole file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            claim = (row.get("claim") or row.get("text") or "").strip()
+            if claim:
+                yield _claim_id(row, claim), claim
+
+
+def count_claims(path, skip=()):
+    """Distinct claims still to check: blank and repeated rows are skipped by the run too."""
+    return len({claim_id for claim_id, _ in read_claims(path) if claim_id not in skip})
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+# --- PIPELINES ---
+
+def _load_llama_module():
+    # The Llama script's file name is not importable with a plain import
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        "fakevsfactusingmetallama", os.path.join(here, "fakevsfactusingmetallama.py.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_pipeline(name):
+    """Returns (check(claim) -> raw verdict text, upstream calls per claim)."""
+    if name == "llama":
+        llama = _load_llama_module()
+        return (lambda claim: llama.fact_check_pipeline(claim, pipeline="batch")), 1
+    import maintextfactfake
+    # query generation + ~4 searches + final verdict
+    return (lambda claim: maintextfactfake.fact_check_pipeline(claim, pipeline="batch")), 6
+
+
+def parse_verdict(raw):
+    """Best-effort JSON from a model answer; falls back to the raw text."""
+    if raw is None:
+        return None
+    try:
+        return parse_json_response(raw)
+    except ValueError:
+        return raw
+
+
+def is_verdict(result):
+    """True for a usable verdict; error payloads and unparsed text are failures."""
+    return (isinstance(result, dict) and "error" not in result
+            and str(result.get("verdict", "")).strip().upper() in VERDICTS)
+
+
+# --- RATE LIMITING AND PROGRESS ---
+
+class RateLimiter:
+    """Token bucket over upstream requests per minute, shared by all workers."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, float(per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        cost = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, ok):
+        with self.lock:
+            self.done += 1
+            self.failed += 0 if ok else 1
+            elapsed = time.monotonic() - self.started
+            rate = self.done / elapsed if elapsed else 0.0
+            remaining = max(0, self.total - self.done)
+            eta = remaining / rate if rate else float("inf")
+            print(f"📊 {self.done}/{self.total} done ({self.failed} failed) | "
+                  f"{rate * 60:.1f} claims/min | ETA {_fmt_seconds(eta)}", file=sys.stderr)
+
+
+def _fmt_seconds(seconds):
+    if seconds == float("inf"):
+        return "--:--"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}"
+
+
+# --- RUNNER ---
+
+def run_batch(input_path, output_path, pipeline="gemini", concurrency=4, rpm=60, checkpoint_path=None):
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    finished = load_checkpoint(checkpoint_path)
+    check, calls_per_claim = load_pipeline(pipeline)
+    limiter = RateLimiter(rpm)
+
+    total = count_claims(input_path, skip=finished)
+    progress = Progress(total)
+    print(f"▶️ {total} claims to check, {len(finished)} already in checkpoint.", file=sys.stderr)
+
+    write_lock = threading.Lock()
+    # Bounds how far reading runs ahead of the workers
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+
+    with open(output_path, "a", encoding="utf-8") as out, open(checkpoint_path, "a", encoding="utf-8") as ckpt:
+
+        def work(claim_id, claim):
+            try:
+                limiter.acquire(calls_per_claim)
+                started = time.monotonic()
+                record = {"id": claim_id, "claim": claim}
+                try:
+                    record["result"] = parse_verdict(check(claim))
+                    ok = is_verdict(record["result"])
+                except Exception as e:
+                    record["error"] = str(e)
+                    ok = False
+                record["elapsed"] = round(time.monotonic() - started, 3)
+
+                with write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    # Only successful claims are checkpointed; failures retry next run
+                    if ok:
+                        ckpt.write(claim_id + "\n")
+                        ckpt.flush()
+                progress.update(ok)
+            finally:
+                in_flight.release()
+
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        seen = set()
+        try:
+            for claim_id, claim in read_claims(input_path):
+                if claim_id in finished or claim_id in seen:
+                    continue
+                seen.add(claim_id)
+                in_flight.acquire()
+                pool.submit(work, claim_id, claim)
+            pool.shutdown(wait=True)
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrupted; finishing in-flight claims. Re-run to resume.", file=sys.stderr)
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fact-check a JSONL/CSV file of claims.")
+    parser.add_argument("input", help="claims file (.jsonl or .csv)")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="results JSONL (appended)")
+    parser.add_argument("--pipeline", choices=["gemini", "llama"], default="gemini")
+    parser.add_argument("--concurrency", type=int, default=4, help="claims checked at once")
+    parser.add_argument("--rpm", type=int, default=60, help="upstream model requests per minute, all workers")
+    parser.add_argument("--checkpoint", help="defaults to <output>.checkpoint")
+    args = parser.parse_args()
+    # Pipeline calls queue behind interactive traffic in the shared scheduler
+    os.environ.setdefault("LLM_PRIORITY", "batch")
+
+    progress = run_batch(args.input, args.output, args.pipeline, args.concurrency, args.rpm, args.checkpoint)
+    elapsed = time.monotonic() - progress.started
+    print(f"✅ {progress.done} claims in {_fmt_seconds(elapsed)} ({progress.failed} failed) -> {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
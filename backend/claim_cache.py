@@ -0,0 +1,359 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+# Two claims whose feature sets overlap at least this much (Jaccard) share a verdict
+SIMILARITY_THRESHOLD = float(os.getenv("CLAIM_CACHE_SIMILARITY", 0.8))
+CACHE_TTL = int(os.getenv("CLAIM_CACHE_TTL", 6 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("CLAIM_CACHE_MAX_ENTRIES", 100_000))
+CACHE_MAX_BYTES = int(os.getenv("CLAIM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# MinHash / LSH layout: 16 bands of 4 rows. A pair at Jaccard 0.8 becomes a
+# candidate with probability ~0.9998, a pair at 0.3 with ~0.12.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# --- CANONICALIZATION ---
+
+# Devanagari -> Latin, close to how people type Hinglish on WhatsApp
+_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "श": "sh",
+    "ष": "sh", "स": "s", "ह": "h",
+}
+_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo",
+    "ऋ": "ri", "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au",
+}
+_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au",
+}
+_NASALS = {"ं": "n", "ँ": "n", "ः": "h"}
+_VIRAMA = "्"
+_NUKTA = "़"
+
+_TOKEN_RE = re.compile(r"[0-9a-zऀ-ॿ]+")
+_DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
+
+# Negations are deliberately absent: "postponed" and "not postponed" must differ
+_STOPWORDS = {
+    # English
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "am", "of", "in",
+    "on", "at", "to", "for", "by", "with", "from", "and", "or", "that", "this",
+    "it", "its", "as", "has", "have", "had", "will", "would", "i", "you", "we",
+    "they", "he", "she", "my", "our", "your", "their", "his", "her", "about",
+    "so", "very", "just", "now", "saw", "news", "viral", "heard", "claim",
+    "claims", "says", "said", "today", "really", "true", "fake", "please",
+    "check", "tell", "me", "us", "there", "here", "what", "which", "who",
+    # Hinglish (romanised and transliterated Devanagari land on the same forms)
+    "hai", "hain", "ha", "h", "ki", "ka", "ke", "ko", "se", "me", "mein",
+    "men", "ne", "ye", "yeh", "yah", "wo", "woh", "vah", "aur", "bhi", "tha",
+    "thi", "the", "kya", "par", "pe", "ek", "ji", "sach", "jhooth", "khabar",
+    "kar", "diya", "gaya", "gayi", "raha", "rahi", "rahe", "hua", "hui",
+}
+
+
+def transliterate(token):
+    """Romanises a Devanagari token; Latin tokens pass through unchanged."""
+    if not _DEVANAGARI_RE.search(token):
+        return token
+    out = []
+    chars = list(token.replace(_NUKTA, ""))  # क़ -> क, close enough for matching
+    for i, ch in enumerate(chars):
+        if ch in _CONSONANTS:
+            out.append(_CONSONANTS[ch])
+            nxt = chars[i + 1] if i + 1 < len(chars) else ""
+            after = chars[i + 2] if i + 2 < len(chars) else ""
+            # Inherent 'a': dropped before a matra/virama, at the word end, and
+            # mid-word before a consonant carrying its own vowel (अनिश्चितकाल
+            # is typed "anishchitkal", not "anishchitakal")
+            if not nxt or nxt in _MATRAS or nxt == _VIRAMA:
+                continue
+            if i > 0 and chars[i - 1] != _VIRAMA and nxt in _CONSONANTS and after in _MATRAS:
+                continue
+            out.append("a")
+        elif ch in _MATRAS:
+            out.append(_MATRAS[ch])
+        elif ch in _VOWELS:
+            out.append(_VOWELS[ch])
+        elif ch in _NASALS:
+            out.append(_NASALS[ch])
+        elif "0" <= ch <= "9" or "a" <= ch <= "z":
+            out.append(ch)
+        elif unicodedata.category(ch) == "Nd":
+            out.append(str(unicodedata.digit(ch)))
+    return "".join(out)
+
+
+def fold_spelling(token):
+    """Folds common Hinglish spelling variants (chunaav/chunav, vote/wote)."""
+    token = token.replace("ph", "f").replace("w", "v").replace("ee", "i").replace("oo", "u")
+    token = re.sub(r"([aeiou])y([aeiou])", r"\1\2", token)  # liye/lie, gaye/gae
+    return re.sub(r"(.)\1+", r"\1", token)
+
+
+_STOPWORDS = {fold_spelling(w) for w in _STOPWORDS}
+_NEGATIONS = {fold_spelling(w) for w in ("not", "no", "never", "nahi", "nahin", "na", "mat", "nhi")}
+# Words that carry a claim's facts: "5 phases" is not "7 phases", "April 29"
+# is not "April 19". Claims must agree on these exactly, like on negation.
+_QUANTITIES = {fold_spelling(w) for w in (
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "eleven", "twelve", "fifteen", "twenty", "thirty", "fifty", "hundred", "thousand",
+    "lakh", "lakhs", "crore", "crores", "million", "billion", "first", "second", "third",
+    "half", "double", "teen", "char", "panch", "chhe", "saat", "aath", "nau", "das", "sau", "hazar",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug",
+    "sep", "sept", "oct", "nov", "dec",
+)}
+_WORD_RE = re.compile(r"\S+")
+_SENTENCE_END = (".", "!", "?", ":", "|", "।")
+
+
+def tokenize(text):
+    """Unicode-normalised, transliterated, spelling-folded tokens minus stopwords."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = []
+    for raw in _TOKEN_RE.findall(text):
+        token = fold_spelling(transliterate(raw))
+        if token and token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def canonical_key(text):
+    """Order-insensitive canonical form: sorted unique content tokens."""
+    return " ".join(sorted(set(tokenize(text))))
+
+
+def is_negated(tokens):
+    """Odd number of negations. Claims that disagree on this never match."""
+    return sum(token in _NEGATIONS for token in tokens) % 2 == 1
+
+
+def has_digit(token):
+    return any("0" <= ch <= "9" for ch in token)
+
+
+def anchors(text):
+    """(quantities, names) a claim must share with any claim it is matched to.
+
+    Quantities are numbers, dates and number words, compared exactly. Names
+    are capitalised words that do not start a sentence ("Rajya" Sabha, not
+    "Lok" Sabha); they may be misspelt, but must be there.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    quantities, names = set(), set()
+    starts_sentence = True
+    for word in _WORD_RE.findall(text):
+        capitalised = word.lstrip("\"'(*#@[-")[:1].isupper()
+        for token in tokenize(word):
+            if has_digit(token) or token in _QUANTITIES:
+                quantities.add(token)
+            elif capitalised and not starts_sentence:
+                names.add(token)
+        starts_sentence = word.endswith(_SENTENCE_END)
+    return quantities, names
+
+
+def same_word(a, b):
+    """Same token, or a misspelling of it (half their trigrams shared)."""
+    if a == b:
+        return True
+    if has_digit(a) or has_digit(b):
+        return False
+    grams_a, grams_b = features([a]) - {a}, features([b]) - {b}
+    return bool(grams_a | grams_b) and len(grams_a & grams_b) / len(grams_a | grams_b) >= 0.5
+
+
+def _unmatched(tokens, other):
+    return [t for t in tokens if not any(same_word(t, o) for o in other)]
+
+
+def anchors_agree(tokens, claim_anchors, other_tokens, other_anchors):
+    """True if two texts have the same quantities and each one's names
+    appear (possibly misspelt) in the other."""
+    if claim_anchors[0] != other_anchors[0]:
+        return False
+    return not (_unmatched(claim_anchors[1], other_tokens) or _unmatched(other_anchors[1], tokens))
+
+
+def claims_agree(tokens, claim_anchors, other_tokens, other_anchors):
+    """True unless two similar claims differ in a fact: a quantity, a name,
+    or a word swapped for another ("Lok" Sabha -> "Rajya" Sabha). A word
+    only one of them has ("breaking", "confirmed") is not a disagreement."""
+    if not anchors_agree(tokens, claim_anchors, other_tokens, other_anchors):
+        return False
+    return not (_unmatched(tokens, other_tokens) and _unmatched(other_tokens, tokens))
+
+
+def features(tokens):
+    """Shingles for similarity: whole tokens, their consonant skeletons and
+    character trigrams. Skeletons absorb vowel/schwa differences between
+    romanised and transliterated spellings (anishchitkal/anishchitakal).
+    Numbers are kept whole: "2024" and "2029" share no shingle."""
+    feats = set(tokens)
+    for token in tokens:
+        if has_digit(token):
+            continue
+        padded = f"^{token}$"
+        feats.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        skeleton = re.sub(r"[aeiouy]", "", token)
+        if len(skeleton) > 1:
+            feats.add("#" + skeleton)
+    return feats
+
+
+def minhash(feats):
+    hashes = [zlib.crc32(f.encode("utf-8")) for f in feats]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ClaimCache:
+    """Verdict cache for text claims with exact and near-duplicate lookup.
+
+    An exact hit on the canonical key is a single dict lookup. Otherwise
+    MinHash LSH buckets give candidates, which are confirmed with the true
+    Jaccard similarity of their feature sets before a verdict is reused.
+    A near match must also agree on negation, numbers, dates and names
+    (see `anchors`): those are what a fact-check is about.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 ttl=CACHE_TTL, threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # canonical key -> entry dict
+        self._bands = [{} for _ in range(BANDS)]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+
+    def get(self, claim):
+        started = time.perf_counter()
+        key = canonical_key(claim)
+        with self._lock:
+            entry = self._live(key)
+            if entry is None and key:
+                entry = self._nearest(key, anchors(claim))
+                if entry is not None:
+                    self.near_hits += 1
+
+            if entry is not None:
+                self._entries.move_to_end(entry["key"])
+                self.hits += 1
+                verdict = entry["verdict"]
+            else:
+                self.misses += 1
+                verdict = None
+            self._lookup_seconds += time.perf_counter() - started
+        return verdict
+
+    def put(self, claim, verdict):
+        key = canonical_key(claim)
+        if not key:
+            return
+        tokens = key.split()
+        feats = features(tokens)
+        signature = minhash(feats)
+        size = (len(json.dumps(verdict, ensure_ascii=False)) + len(key)
+                + sum(sys.getsizeof(f) for f in feats) + 8 * NUM_PERM)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "key": key,
+                "verdict": verdict,
+                "features": feats,
+                "negated": is_negated(tokens),
+                "anchors": anchors(claim),
+                "signature": signature,
+                "expires_at": time.time() + self.ttl,
+                "size": size,
+            }
+            for band, bucket in zip(self._bands, self._band_keys(signature)):
+                band.setdefault(bucket, set()).add(key)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] < time.time():
+            self._drop(key)
+            return None
+        return entry
+
+    def _nearest(self, key, claim_anchors):
+        tokens = key.split()
+        feats = features(tokens)
+        negated = is_negated(tokens)
+        candidates = set()
+        for band, bucket in zip(self._bands, self._band_keys(minhash(feats))):
+            candidates.update(band.get(bucket, ()))
+
+        best, best_score = None, self.threshold
+        for other in candidates:
+            entry = self._live(other)
+            if entry is None or entry["negated"] != negated:
+                continue
+            if not claims_agree(tokens, claim_anchors, entry["key"].split(), entry["anchors"]):
+                continue
+            score = jaccard(feats, entry["features"])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    @staticmethod
+    def _band_keys(signature):
+        return [tuple(signature[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        for band, bucket in zip(self._bands, self._band_keys(entry["signature"])):
+            keys = band.get(bucket)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del band[bucket]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_lookup_ms": round(self._lookup_seconds * 1000 / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,188 @@
+import math
+import os
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from claim_cache import anchors, anchors_agree, is_negated, jaccard, tokenize
+from scheduler import CHARS_PER_TOKEN
+
+# Evidence packed into the final verdict prompt, in estimated tokens
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", 1200))
+# Two passages sharing this much of their word 3-shingles, or of their
+# content words, say the same thing (unless one of them is negated, or they
+# differ in a number, date or name: then they may contradict each other)
+DUPLICATE_THRESHOLD = float(os.getenv("EVIDENCE_DUPLICATE_THRESHOLD", 0.5))
+PARAPHRASE_THRESHOLD = float(os.getenv("EVIDENCE_PARAPHRASE_THRESHOLD", 0.6))
+MIN_PASSAGE_WORDS = 6
+SHINGLE = 3
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+|\n+")
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "si"}
+
+
+# --- URLS ---
+
+def canonical_url(url):
+    """Scheme/host lowercased, www., fragment, default port, tracking
+    parameters and trailing slash dropped, remaining parameters sorted."""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    if not parts.scheme or not parts.netloc:
+        return url.strip()
+    scheme, host = parts.scheme.lower(), parts.netloc.lower()
+    default_port = {"http": ":80", "https": ":443"}.get(scheme)
+    if default_port and host.endswith(default_port):
+        host = host[:-len(default_port)]
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def cited_sources(sources, known):
+    """Keeps the model's cited URLs that appear in the evidence (`known`,
+    canonical), plus any non-URL entry such as "Not Found As it is Fake"."""
+    if isinstance(sources, str):
+        sources = [sources]
+    known = set(known)
+    kept = []
+    for source in sources or []:
+        if not isinstance(source, str):
+            continue
+        if not source.startswith(("http://", "https://")):
+            kept.append(source)
+        elif canonical_url(source) in known:
+            kept.append(canonical_url(source))
+    return kept
+
+
+# --- PASSAGES ---
+
+def split_passages(text):
+    """Sentences (and bullet lines), with fragments too short to stand on
+    their own merged into the next one."""
+    passages = []
+    pending = ""
+    for piece in _SENTENCE_RE.split(text or ""):
+        piece = _BULLET_RE.sub("", piece).strip()
+        if not piece:
+            continue
+        pending = f"{pending} {piece}".strip()
+        if len(pending.split()) >= MIN_PASSAGE_WORDS:
+            passages.append(pending)
+            pending = ""
+    if pending:
+        if passages and len(pending.split()) < MIN_PASSAGE_WORDS:
+            passages[-1] = f"{passages[-1]} {pending}"
+        else:
+            passages.append(pending)
+    return passages
+
+
+def shingles(tokens, size=SHINGLE):
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _same_fact(a, b):
+    if a["negated"] != b["negated"]:
+        return False
+    if not anchors_agree(a["tokens"], a["anchors"], b["tokens"], b["anchors"]):
+        return False
+    return (jaccard(a["shingles"], b["shingles"]) >= DUPLICATE_THRESHOLD
+            or jaccard(a["words"], b["words"]) >= PARAPHRASE_THRESHOLD)
+
+
+def compact(claim, results, budget=EVIDENCE_TOKEN_BUDGET):
+    """Deduplicated, ranked evidence packed into `budget` tokens.
+
+    `results` is a list of (query, text, urls) from the searches. Each
+    passage keeps its provenance: the queries whose answers contained it
+    (or a near-duplicate of it) and those answers' grounding URLs. Returns
+    a dict with the prompt `text`, the numbered `sources` it cites, the
+    kept `passages` and before/after sizes.
+    """
+    passages = []
+    chars_in = 0
+    duplicates = 0
+    for qi, (query, text, urls) in enumerate(results):
+        if not text:
+            continue
+        chars_in += len(text)
+        canonical = [canonical_url(u) for u in urls or []]
+        for position, sentence in enumerate(split_passages(text)):
+            tokens = tokenize(sentence)
+            passage = {
+                "text": sentence, "tokens": tokens, "shingles": shingles(tokens), "words": set(tokens),
+                "negated": is_negated(tokens), "anchors": anchors(sentence), "queries": {qi}, "urls": set(canonical), "position": position,
+            }
+            twin = next((p for p in passages if _same_fact(passage, p)), None)
+            if twin is not None:
+                # Same fact from another answer: corroboration, not new text
+                duplicates += 1
+                twin["queries"].add(qi)
+                twin["urls"].update(canonical)
+                continue
+            passages.append(passage)
+
+    # BM25-style relevance to the claim over this small collection, plus a
+    # bonus for facts several answers agree on and for leading sentences.
+    # Passages sharing no word with the claim are left out.
+    claim_terms = set(tokenize(claim))
+    n = len(passages)
+    avg_len = sum(len(p["tokens"]) for p in passages) / n if n else 0.0
+    df = {t: sum(t in p["tokens"] for p in passages) for t in claim_terms}
+    for p in passages:
+        score = 0.0
+        for term in claim_terms:
+            tf = p["tokens"].count(term)
+            if tf:
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(p["tokens"]) / (avg_len or 1)))
+        p["relevant"] = score > 0 or not claim_terms
+        p["score"] = score * (1 + 0.25 * (len(p["queries"]) - 1)) + 0.1 / (1 + p["position"])
+
+    # Greedy by score; a passage also pays for the source lines it adds
+    kept = []
+    sources = []
+    used = 0
+    for p in sorted(passages, key=lambda p: p["score"], reverse=True):
+        if not p["relevant"]:
+            continue
+        new_urls = [u for u in sorted(p["urls"]) if u not in sources]
+        cost = (len(p["text"]) + 8 * len(p["urls"])) // CHARS_PER_TOKEN + 4
+        cost += sum(len(u) // CHARS_PER_TOKEN + 3 for u in new_urls)
+        if used + cost > budget:
+            continue
+        kept.append(p)
+        sources.extend(new_urls)
+        used += cost
+    lines = []
+    for i, p in enumerate(kept, 1):
+        refs = ", ".join(f"S{sources.index(u) + 1}" for u in sorted(p["urls"]))
+        lines.append(f"[{i}] {p['text']}" + (f" ({refs})" if refs else ""))
+    if sources:
+        lines.append("Sources:")
+        lines.extend(f"S{i}: {url}" for i, url in enumerate(sources, 1))
+    text = "\n".join(lines)
+    return {
+        "text": text,
+        "sources": sources,
+        "passages": [
+            {"text": p["text"], "score": round(p["score"], 3),
+             "queries": [results[q][0] for q in sorted(p["queries"])], "urls": sorted(p["urls"])}
+            for p in kept
+        ],
+        "stats": {
+            "passages": n, "duplicates": duplicates, "kept": len(kept),
+            "tokens_in": chars_in // CHARS_PER_TOKEN, "tokens_out": len(text) // CHARS_PER_TOKEN,
+        },
+    }
@@ -0,0 +1,469 @@
+import argparse
+import contextlib
+import fcntl
+import glob
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+
+from claim_cache import tokenize
+
+# Offline index over the official material we already ship: the circulars
+# and manifestos (PDF) and the notification records in noti.html.
+#
+# On disk it is a list of immutable segments. Each `update()` indexes only
+# documents that are new or changed since the last run into one new segment
+# and tombstones the chunks of changed or deleted ones; past MAX_SEGMENTS
+# everything live is merged into a single segment. Postings and chunk texts
+# are memory-mapped, so opening the index at startup costs next to nothing.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.getenv("EVIDENCE_INDEX_DIR", os.path.join(BACKEND_DIR, "evidence_index"))
+SOURCE_ROOT = os.getenv("EVIDENCE_SOURCE_ROOT", os.path.join(BACKEND_DIR, "..", "frontend"))
+PDF_GLOBS = ("circulars/*.pdf", "manifesto/*.pdf")
+NOTICES_PAGE = "noti.html"
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 30
+MAX_SEGMENTS = 8
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# A passage is trusted on its own (no web search) when it covers most of the
+# claim's content words with a strong score. Short claims never qualify.
+CONFIDENT_SCORE = float(os.getenv("EVIDENCE_CONFIDENT_SCORE", 8.0))
+CONFIDENT_COVERAGE = float(os.getenv("EVIDENCE_CONFIDENT_COVERAGE", 0.75))
+CONFIDENT_MIN_TERMS = 3
+# Below this share of the claim's words a passage is noise, not evidence
+RELEVANT_COVERAGE = float(os.getenv("EVIDENCE_RELEVANT_COVERAGE", 0.5))
+
+_NOTICE_RE = re.compile(r"\{\s*day:.*?pdf_url:\s*\"[^\"]*\"\s*\}", re.DOTALL)
+_FIELD_RE = re.compile(r"(\w+):\s*(\"(?:[^\"\\]|\\.)*\"|\[[^\]]*\])")
+
+
+# --- SOURCES ---
+
+class Document:
+    """One source document. `load()` returns its text (done only if it changed)."""
+
+    def __init__(self, key, title, url, kind, fingerprint, load):
+        self.key = key
+        self.title = title
+        self.url = url
+        self.kind = kind
+        self.fingerprint = fingerprint
+        self.load = load
+
+
+def _pdf_text(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        print(f"⚠️ pypdf not installed, skipping {path}")
+        return ""
+    try:
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    except Exception as e:
+        print(f"⚠️ Could not read {path}: {e}")
+        return ""
+
+
+def pdf_documents(root=SOURCE_ROOT):
+    for pattern in PDF_GLOBS:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            stat = os.stat(path)
+            yield Document(
+                key=f"pdf:{rel}",
+                title=rel,
+                url=rel,
+                kind="circular" if rel.startswith("circulars/") else "manifesto",
+                fingerprint=f"{stat.st_size}:{stat.st_mtime_ns}",
+                load=lambda path=path: _pdf_text(path),
+            )
+
+
+def read_notices(root=SOURCE_ROOT):
+    """The `notices` records hard-coded in noti.html, as field dicts."""
+    path = os.path.join(root, NOTICES_PAGE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        page = f.read()
+    notices = []
+    for block in _NOTICE_RE.findall(page):
+        fields = {name: json.loads(value) for name, value in _FIELD_RE.findall(block)}
+        if "name" in fields:
+            notices.append(fields)
+    return notices
+
+
+def notice_key(name):
+    return "notice:" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+
+def notice_documents(root=SOURCE_ROOT):
+    """The noti.html notices, one document each."""
+    for fields in read_notices(root):
+        date = f"{fields.get('day', '')} {fields.get('month', '')} {fields.get('year', '')}".strip()
+        text = f"{fields['name']}. {fields.get('category', '')}. {date}. " + " ".join(fields.get("summary", []))
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        yield Document(
+            key=notice_key(fields["name"]),
+            title=fields["name"],
+            url=fields.get("pdf_url", ""),
+            kind="notification",
+            fingerprint=digest,
+            load=lambda text=text: text,
+        )
+
+
+def default_documents(root=SOURCE_ROOT):
+    yield from pdf_documents(root)
+    yield from notice_documents(root)
+
+
+def chunk_text(text, words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    tokens = text.split()
+    if not tokens:
+        return []
+    step = max(1, words - overlap)
+    return [" ".join(tokens[i:i + words]) for i in range(0, max(1, len(tokens) - overlap), step)]
+
+
+# --- SEGMENTS ---
+
+def _atomic_write(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_segment(directory, name, chunks):
+    """chunks: dicts with doc, title, url, kind, text, tokens."""
+    postings = {}
+    for cid, chunk in enumerate(chunks):
+        for term, tf in Counter(chunk["tokens"]).items():
+            postings.setdefault(term, []).append((cid, tf))
+
+    flat = array("I")
+    terms = {}
+    for term in sorted(postings):
+        terms[term] = [len(flat) // 2, len(postings[term])]
+        for cid, tf in postings[term]:
+            flat.extend((cid, tf))
+
+    blob = bytearray()
+    meta = []
+    for chunk in chunks:
+        encoded = chunk["text"].encode("utf-8")
+        meta.append({
+            "doc": chunk["doc"], "title": chunk["title"], "url": chunk["url"], "kind": chunk["kind"],
+            "offset": len(blob), "length": len(encoded), "dl": len(chunk["tokens"]),
+        })
+        blob.extend(encoded)
+
+    base = os.path.join(directory, name)
+    _atomic_write(base + ".postings", flat.tobytes())
+    _atomic_write(base + ".text", bytes(blob))
+    _atomic_write(base + ".terms.json", json.dumps(terms).encode("utf-8"))
+    _atomic_write(base + ".chunks.json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+
+class Segment:
+    def __init__(self, directory, name):
+        base = os.path.join(directory, name)
+        self.name = name
+        with open(base + ".terms.json", encoding="utf-8") as f:
+            self.terms = json.load(f)
+        with open(base + ".chunks.json", encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        self._postings_map = _map(base + ".postings")
+        self._text_map = _map(base + ".text")
+        self.postings = memoryview(self._postings_map).cast("I") if self._postings_map else []
+
+    def postings_for(self, term):
+        entry = self.terms.get(term)
+        if entry is None:
+            return
+        start, count = entry
+        for i in range(start, start + count):
+            yield self.postings[2 * i], self.postings[2 * i + 1]
+
+    def text(self, cid):
+        chunk = self.chunks[cid]
+        return bytes(self._text_map[chunk["offset"]:chunk["offset"] + chunk["length"]]).decode("utf-8")
+
+    def chunk_records(self):
+        """Every chunk with its text and tokens again, for merging segments."""
+        for cid, chunk in enumerate(self.chunks):
+            text = self.text(cid)
+            yield cid, dict(chunk, text=text, tokens=tokenize(f"{chunk['title']} {text}"))
+
+
+@contextlib.contextmanager
+def _index_lock(directory, shared=False):
+    # Several gunicorn workers may update the same index at startup; loaders
+    # share the lock, so none reads a manifest whose segments are being removed
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# --- INDEX ---
+
+class EvidenceIndex:
+    """BM25 over chunks of official documents, in memory-mapped segments."""
+
+    def __init__(self, directory=INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "docs": {}, "deleted": {}, "next": 0}
+
+    def _load(self):
+        with _index_lock(self.directory, shared=True):
+            manifest = self._read_manifest()
+            segments = [Segment(self.directory, name) for name in manifest["segments"]]
+        deleted = {name: set(ids) for name, ids in manifest["deleted"].items()}
+        live = [(seg, cid) for seg in segments for cid in range(len(seg.chunks))
+                if cid not in deleted.get(seg.name, ())]
+        with self._lock:
+            self.manifest = manifest
+            self.segments = segments
+            self.deleted = deleted
+            self.size = len(live)
+            self.avgdl = (sum(seg.chunks[cid]["dl"] for seg, cid in live) / len(live)) if live else 0.0
+
+    def update(self, documents=None):
+        """Indexes new and changed documents; returns (added, removed) doc counts."""
+        documents = list(default_documents() if documents is None else documents)
+        with _index_lock(self.directory):
+            manifest = self._read_manifest()
+            seen = set()
+            new_chunks = []
+            added = removed = 0
+
+            for doc in documents:
+                seen.add(doc.key)
+                entry = manifest["docs"].get(doc.key)
+                if entry and entry["fingerprint"] == doc.fingerprint:
+                    continue
+                if entry:
+                    self._tombstone(manifest, entry)
+                text = doc.load()
+                pieces = chunk_text(text)
+                if not pieces:
+                    # Not recorded, so the next update tries again (e.g. once
+                    # pypdf is installed)
+                    print(f"⚠️ No extractable text in {doc.title} (scanned PDF?)")
+                    if entry:
+                        del manifest["docs"][doc.key]
+                        removed += 1
+                    continue
+                first = len(new_chunks)
+                for piece in pieces:
+                    new_chunks.append({
+                        "doc": doc.key, "title": doc.title, "url": doc.url, "kind": doc.kind,
+                        "text": piece, "tokens": tokenize(f"{doc.title} {piece}"),
+                    })
+                manifest["docs"][doc.key] = {
+                    "fingerprint": doc.fingerprint, "segment": None, "chunks": [first, len(new_chunks)],
+                }
+                added += 1
+
+            for key in [k for k in manifest["docs"] if k not in seen]:
+                self._tombstone(manifest, manifest["docs"].pop(key))
+                removed += 1
+
+            if new_chunks:
+                name = f"seg{manifest['next']:05d}"
+                manifest["next"] += 1
+                write_segment(self.directory, name, new_chunks)
+                manifest["segments"].append(name)
+                for entry in manifest["docs"].values():
+                    if entry["segment"] is None:
+                        entry["segment"] = name
+
+            if added or removed:
+                stale = self._merge(manifest) if len(manifest["segments"]) > MAX_SEGMENTS else []
+                _atomic_write(self._manifest_path(), json.dumps(manifest, indent=1).encode("utf-8"))
+                # Only once no manifest names them any more
+                for name in stale:
+                    for suffix in (".postings", ".text", ".terms.json", ".chunks.json"):
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(os.path.join(self.directory, name + suffix))
+        self._load()
+        return added, removed
+
+    @staticmethod
+    def _tombstone(manifest, entry):
+        if entry["segment"] is None:
+            return
+        start, end = entry["chunks"]
+        ids = set(manifest["deleted"].get(entry["segment"], ())) | set(range(start, end))
+        manifest["deleted"][entry["segment"]] = sorted(ids)
+
+    def _merge(self, manifest):
+        """Rewrites every live chunk into one segment; returns the names of
+        the old ones, whose files the caller removes."""
+        chunks = []
+        docs = {}
+        for name in manifest["segments"]:
+            segment = Segment(self.directory, name)
+            dead = set(manifest["deleted"].get(name, ()))
+            for cid, record in segment.chunk_records():
+                if cid in dead:
+                    continue
+                span = docs.setdefault(record["doc"], [len(chunks), len(chunks)])
+                span[1] = len(chunks) + 1
+                chunks.append(record)
+        name = f"seg{manifest['next']:05d}"
+        manifest["next"] += 1
+        write_segment(self.directory, name, chunks)
+        old = manifest["segments"]
+        manifest["segments"] = [name]
+        manifest["deleted"] = {}
+        for key, span in docs.items():
+            if key in manifest["docs"]:
+                manifest["docs"][key].update(segment=name, chunks=span)
+        return old
+
+    def search(self, query, k=5):
+        """Top passages for a claim: dicts with score, coverage, title, url, kind, text."""
+        terms = set(tokenize(query))
+        with self._lock:
+            segments, deleted, size, avgdl = self.segments, self.deleted, self.size, self.avgdl
+        if not terms or not size:
+            return []
+
+        df = {t: sum(seg.terms[t][1] for seg in segments if t in seg.terms) for t in terms}
+        scores = {}
+        matched = {}
+        for term in terms:
+            if not df[term]:
+                continue
+            idf = math.log(1 + (size - df[term] + 0.5) / (df[term] + 0.5))
+            for seg in segments:
+                dead = deleted.get(seg.name, ())
+                for cid, tf in seg.postings_for(term):
+                    if cid in dead:
+                        continue
+                    dl = seg.chunks[cid]["dl"]
+                    key = (seg, cid)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+                    matched[key] = matched.get(key, 0) + 1
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        results = []
+        for (seg, cid), score in best:
+            chunk = seg.chunks[cid]
+            results.append({
+                "score": round(score, 3),
+                "coverage": round(matched[(seg, cid)] / len(terms), 3),
+                "title": chunk["title"],
+                "url": chunk["url"],
+                "kind": chunk["kind"],
+                "text": seg.text(cid),
+            })
+        return results
+
+    def lookup(self, claim, k=3):
+        """(passages, confident) for the pipelines: only passages relevant to
+        the claim; confident means the top one is strong enough to check the
+        claim against without a web search."""
+        passages = [p for p in self.search(claim, k) if p["coverage"] >= RELEVANT_COVERAGE]
+        terms = set(tokenize(claim))
+        confident = bool(
+            passages
+            and len(terms) >= CONFIDENT_MIN_TERMS
+            and passages[0]["score"] >= CONFIDENT_SCORE
+            and passages[0]["coverage"] >= CONFIDENT_COVERAGE
+        )
+        return passages, confident
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self.manifest["docs"]),
+                "chunks": self.size,
+                "segments": len(self.segments),
+                "terms": sum(len(seg.terms) for seg in self.segments),
+            }
+
+
+def format_passages(passages):
+    """Passages as a prompt block, each labelled with where it comes from."""
+    return "\n".join(
+        f"[{p['kind']}: {p['title']}{' - ' + p['url'] if p['url'] else ''}]\n{p['text']}"
+        for p in passages
+    )
+
+
+def open_index(directory=INDEX_DIR, refresh=True):
+    """Opens the index, first picking up any new or changed documents."""
+    index = EvidenceIndex(directory)
+    if refresh:
+        started = time.monotonic()
+        added, removed = index.update()
+        if added or removed:
+            print(f"📚 Evidence index: +{added}/-{removed} documents in {time.monotonic() - started:.1f}s")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline evidence index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="index new and changed documents")
+    query = sub.add_parser("search", help="top passages for a claim")
+    query.add_argument("claim")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = open_index()
+        print(json.dumps(index.stats()))
+        return
+    index = open_index(refresh=False)
+    started = time.perf_counter()
+    passages, confident = index.lookup(args.claim, args.k)
+    elapsed = (time.perf_counter() - started) * 1000
+    for p in passages:
+        print(f"{p['score']:7.3f} {p['coverage']:.2f} {p['title']}\n        {p['text'][:160]}")
+    print(f"confident={confident} ({elapsed:.2f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
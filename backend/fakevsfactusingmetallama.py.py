@@ -3,15 +3,19 @@ import os
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from huggingface_hub import InferenceClient
 from serpapi import GoogleSearch
+from claim_cache import ClaimCache
+from llm_provider import HFProvider, strip_json_fences
+from verdict_store import shared_store
+from verdicts import read_verdict
 
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 
 MODEL_ID = "meta-llama/Llama-3.3-70B-Instruct"
-client = InferenceClient(api_key=HF_TOKEN)
+llm = HFProvider(token=HF_TOKEN, model=MODEL_ID) if HF_TOKEN else None
+claim_cache = ClaimCache()
 
 def get_google_evidence(claim):
     search_params = {
@@ -32,7 +36,12 @@ def get_google_evidence(claim):
     except Exception:
         return "", []
 
-def fact_check_pipeline(claim):
+def fact_check_pipeline(claim, pipeline="llama"):
+    """Checks one claim; verdicts go to the verdict store labelled `pipeline`."""
+    cached = claim_cache.get(claim)
+    if cached:
+        return cached
+
     # CRITICAL: Tell the LLM what year it is
     current_date = "January 10, 2026"
     
@@ -68,22 +77,24 @@ def fact_check_pipeline(claim):
     """
 
     try:
-        response = client.chat_completion(
-            model=MODEL_ID,
-            messages=[
-                {"role": "system", "content": system_instruction},
-                {"role": "user", "content": user_prompt}
-            ],
+        if llm is None:
+            raise ValueError("HF_TOKEN not found in environment variables")
+        response = llm.generate(
+            user_prompt,
+            system=system_instruction,
             max_tokens=400,
             temperature=0.1
         )
         
-        output = response.choices[0].message.content.strip()
-        
         # Strip potential markdown backticks
-        if output.startswith("```"):
-            output = output.strip("`").replace("json", "", 1).strip()
-            
+        output = strip_json_fences(response.text)
+
+        report, complete = read_verdict(output)
+        shared_store().record(pipeline, report, claim=claim, model=response.model, urls=found_urls)
+        # Only whole verdicts are cached; a truncated or garbled answer would
+        # otherwise be served to every matching claim for the full TTL
+        if complete:
+            claim_cache.put(claim, output)
         return output
 
     except Exception as e:
@@ -0,0 +1,326 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+from claim_cache import canonical_key, features, fold_spelling, is_negated, same_word, tokenize
+
+# Vetted answers to the questions /chat gets most, answered without a model
+# call. Each entry lists the question as people ask it (several phrasings
+# and languages), the answer, an optional official source and an optional
+# `expires` date (YYYY-MM-DD) after which it is no longer served. Entries
+# promoted from past conversations (see `promote` below) carry
+# "origin": "promoted".
+FAQ_PATH = os.getenv("FAQ_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq.json"))
+# Questions that went to the model, with its answer: the raw material for
+# promotion. FAQ_LOG= (empty) turns the log off.
+FAQ_LOG = os.getenv("FAQ_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq_log.jsonl"))
+# TF-IDF cosine a question needs to be answered from the index, and its lead
+# over the best other entry, so a question between two entries goes to the model
+MATCH_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", 0.7))
+MATCH_MARGIN = float(os.getenv("FAQ_MARGIN", 0.1))
+# Share of the question's words the matched question must also have (exactly
+# or as a misspelling). All of them by default: one extra word is often the
+# verb, and "delete my name from the voter list" is not "check my name in
+# the voter list", however close the cosine.
+MIN_COVERAGE = float(os.getenv("FAQ_COVERAGE", 1.0))
+# The file is checked for changes at most this often (seconds), on lookup
+RELOAD_INTERVAL = float(os.getenv("FAQ_RELOAD", 2))
+# Longer messages carry their own context; they are not looked up or logged
+MAX_QUESTION_CHARS = 200
+
+# Question words carry no topic; "how to register" and "register" are one question
+_QUESTION_WORDS = {fold_spelling(w) for w in (
+    "how", "can", "could", "do", "does", "did", "should", "when", "where", "why", "whom", "whose",
+    "explain", "mean", "means", "meaning", "know", "want", "need", "get", "pls", "plz",
+    "kaise", "kese", "kab", "kahan", "kaha", "kyu", "kyon", "kaun", "kitni", "kitna", "matlab",
+    "hota", "hoti", "hote", "hoga", "hogi", "kare", "karein", "karen", "karna", "karte", "sakte",
+    "sakta", "sakti", "batao", "bataiye", "bhai",
+)}
+
+
+def question_tokens(text):
+    return [t for t in tokenize(text) if t not in _QUESTION_WORDS]
+
+
+def coverage(tokens, other):
+    """Share of `tokens` found in `other`, allowing misspellings."""
+    words = set(tokens)
+    return sum(any(same_word(t, o) for o in other) for t in words) / len(words) if words else 0.0
+
+
+class FAQIndex:
+    """TF-IDF lookup over the FAQ questions.
+
+    A question whose canonical form equals one of an entry's questions is a
+    match outright. Otherwise it is compared by cosine similarity of
+    IDF-weighted features (the claim cache's tokens, consonant skeletons and
+    character trigrams, which absorb Hinglish spellings and typos) against
+    every listed question sharing a feature with it. A negated question
+    never matches its plain form.
+
+    The whole index is rebuilt when the file changes (IDF is global, and
+    the file is small); lookups keep using the old one until the swap.
+    """
+
+    def __init__(self, path=FAQ_PATH, threshold=MATCH_THRESHOLD, margin=MATCH_MARGIN, log_path=FAQ_LOG):
+        self.path = path
+        self.threshold = threshold
+        self.margin = margin
+        self.log_path = log_path
+        # entries, canonical key -> id, [(id, tokens, vector, negated)], feature -> [variant], idf
+        self._index = ({}, {}, [], {}, {})
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0.0
+        self.reloads = 0
+        self.hits = 0
+        self.misses = 0
+        self.logged = 0
+        self.entry_hits = {}
+        self._lookup_seconds = 0.0
+        self.reload()
+
+    # --- LOADING ---
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+        self.reload()
+
+    def reload(self):
+        """Rebuilds the index if the file changed; True if it did."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stamp, entries = None, {}
+        else:
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp:
+                return False
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    entries = {entry["id"]: entry for entry in json.load(f) if entry.get("answer")}
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # Half-written or invalid edit: keep serving the last good version
+                print(f"⚠️ FAQ index not reloaded: {e}")
+                self._stamp = stamp
+                return False
+        if stamp == self._stamp:
+            return False
+
+        keys = {}
+        variants = []
+        for entry_id, entry in entries.items():
+            for question in entry.get("questions", []):
+                tokens = question_tokens(question)
+                if not tokens:
+                    continue
+                keys[" ".join(sorted(set(tokens)))] = entry_id
+                variants.append((entry_id, set(tokens), features(tokens), is_negated(tokens)))
+        df = {}
+        for _, _, feats, _ in variants:
+            for feat in feats:
+                df[feat] = df.get(feat, 0) + 1
+        idf = {feat: math.log((len(variants) + 1) / (count + 1)) + 1 for feat, count in df.items()}
+        vectors = []
+        postings = {}
+        for i, (entry_id, tokens, feats, negated) in enumerate(variants):
+            vectors.append((entry_id, tokens, self._vector(feats, idf, len(variants)), negated))
+            for feat in feats:
+                postings.setdefault(feat, []).append(i)
+
+        with self._lock:
+            self._index = (entries, keys, vectors, postings, idf)
+            self._stamp = stamp
+            self.reloads += 1
+        print(f"💬 FAQ index: {len(entries)} entries, {len(vectors)} questions")
+        return True
+
+    @staticmethod
+    def _vector(feats, idf, n):
+        # Binary tf: questions are short. Features the index has never seen
+        # get the highest weight, so an unknown topic lowers the score.
+        unseen = math.log(n + 1) + 1
+        weights = {feat: idf.get(feat, unseen) for feat in feats}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {feat: w / norm for feat, w in weights.items()}
+
+    # --- LOOKUP ---
+
+    def match(self, question):
+        """(entry, score) for a confident match, else (None, best score)."""
+        entries, keys, vectors, postings, idf = self._index
+        tokens = question_tokens(question)
+        if not tokens:
+            return None, 0.0
+        entry_id = keys.get(" ".join(sorted(set(tokens))))
+        if entry_id is not None:
+            return entries[entry_id], 1.0
+
+        query = self._vector(features(tokens), idf, len(vectors))
+        negated = is_negated(tokens)
+        best = {}  # entry id -> (best cosine over its questions, that question's tokens)
+        for i in {i for feat in query for i in postings.get(feat, ())}:
+            entry_id, variant_tokens, vector, variant_negated = vectors[i]
+            if variant_negated != negated:
+                continue
+            score = sum(w * vector.get(feat, 0.0) for feat, w in query.items())
+            if score > best.get(entry_id, (0.0,))[0]:
+                best[entry_id] = (score, variant_tokens)
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+        if not ranked:
+            return None, 0.0
+        entry_id, (score, variant_tokens) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+        if (score >= self.threshold and score - runner_up >= self.margin
+                and coverage(tokens, variant_tokens) >= MIN_COVERAGE):
+            return entries[entry_id], score
+        return None, score
+
+    def answer(self, question):
+        """{"reply", "faq", "score"} for a confidently matched question, or None."""
+        if len(question) > MAX_QUESTION_CHARS:
+            return None
+        self._maybe_reload()
+        started = time.perf_counter()
+        entry, score = self.match(question)
+        if entry is not None and entry.get("expires", "9999") < datetime.date.today().isoformat():
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entry_hits[entry["id"]] = self.entry_hits.get(entry["id"], 0) + 1
+            self._lookup_seconds += time.perf_counter() - started
+        if entry is None:
+            return None
+        reply = entry["answer"]
+        if entry.get("source") and entry["source"] not in reply:
+            reply += f"\n\nSource: {entry['source']}"
+        return {"reply": reply, "faq": entry["id"], "score": round(score, 3)}
+
+    def record_miss(self, question, answer):
+        """Logs a question the model answered, for `faq_index.py candidates`."""
+        if not self.log_path or not answer or len(question) > MAX_QUESTION_CHARS:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "key": canonical_key(question),
+                           "question": question, "answer": answer}, ensure_ascii=False)
+        with self._log_lock:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.logged += 1
+            except OSError as e:
+                print(f"⚠️ FAQ log write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index[0]),
+                "questions": len(self._index[2]),
+                "reloads": self.reloads,
+                "hits": self.hits,
+                "misses": self.misses,
+                # Share of chat questions answered without a model call
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_lookup_ms": round(self._lookup_seconds * 1000 / lookups, 4) if lookups else 0.0,
+                "logged": self.logged,
+                "top": dict(sorted(self.entry_hits.items(), key=lambda item: item[1], reverse=True)[:20]),
+            }
+
+
+# --- PROMOTION ---
+
+def read_log(path=FAQ_LOG):
+    """{canonical key: {"count", "questions", "answer"}} from the miss log."""
+    groups = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not record.get("key"):
+                    continue
+                group = groups.setdefault(record["key"], {"count": 0, "questions": [], "answer": ""})
+                group["count"] += 1
+                if record["question"] not in group["questions"]:
+                    group["questions"].append(record["question"])
+                group["answer"] = record["answer"]  # the latest one
+    except FileNotFoundError:
+        pass
+    return groups
+
+
+def promote(question, entry_id, answer=None, path=FAQ_PATH, log_path=FAQ_LOG):
+    """Adds a logged question (all its logged phrasings) to the FAQ file,
+    with the model's latest answer unless `answer` is given."""
+    group = read_log(log_path).get(canonical_key(question))
+    if group is None and answer is None:
+        raise ValueError(f"{question!r} is not in the log; give --answer to add it anyway")
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        entries = []
+    if any(entry["id"] == entry_id for entry in entries):
+        raise ValueError(f"an entry with id {entry_id!r} already exists")
+    entry = {
+        "id": entry_id,
+        "questions": group["questions"][:8] if group else [question],
+        "answer": answer or group["answer"],
+        "origin": "promoted",
+        "promoted": datetime.date.today().isoformat(),
+    }
+    entries.append(entry)
+    # Write-then-rename, so a running server never reads half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the FAQ index and promote logged questions into it.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="look a question up")
+    check.add_argument("question")
+    candidates = sub.add_parser("candidates", help="most frequent logged questions the index does not answer")
+    candidates.add_argument("--min", type=int, default=3, help="times asked (default 3)")
+    candidates.add_argument("--limit", type=int, default=20)
+    add = sub.add_parser("promote", help="add a logged question and its latest answer to the FAQ")
+    add.add_argument("question")
+    add.add_argument("--id", required=True)
+    add.add_argument("--answer", help="vetted answer to use instead of the logged one")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        index = FAQIndex(log_path="")
+        entry, score = index.match(args.question)
+        print(json.dumps({"faq": entry["id"] if entry else None, "score": round(score, 3)}))
+    elif args.command == "candidates":
+        index = FAQIndex(log_path="")
+        groups = [(key, g) for key, g in read_log().items() if g["count"] >= args.min]
+        groups = [(key, g) for key, g in groups if index.match(g["questions"][0])[0] is None]
+        for key, group in sorted(groups, key=lambda item: item[1]["count"], reverse=True)[:args.limit]:
+            print(f"{group['count']:5d}  {group['questions'][0]}")
+            print(f"       {' '.join(group['answer'].split())[:160]}")
+    else:
+        entry = promote(args.question, args.id, args.answer)
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import io
+import os
+import time
+import numpy as np
+import PIL.Image
+
+# Local forensic pre-pass on the uploaded bytes, before any model call.
+# Every measure is a heuristic: the scores go into the synthesis prompt as
+# evidence next to the VLM's opinion, never straight into a verdict.
+#
+# Uploads up to FORENSICS_MAX_PIXELS are decoded again at full size (luma
+# only), so resampling does not blur pixel-level traces and a JPEG's 8x8
+# block grid is intact; bigger ones are analysed on the model-sized image
+# and skip the double-compression check, which needs that grid.
+FORENSICS_MAX_PIXELS = int(os.getenv("FORENSICS_MAX_PIXELS", 1_500_000))
+ELA_QUALITY = 90
+FFT_SIDE = 512
+# Suspicion at or above this counts as a strong local signal; the pre-pass
+# is only "strong" when two independent measures agree
+STRONG_SUSPICION = float(os.getenv("FORENSICS_STRONG", 0.8))
+# Blocks with less luma variation than this (std, grey levels) are flat:
+# page backgrounds, chat bubbles. They carry no error level or noise to
+# compare, and a rendered screenshot is mostly made of them.
+FLAT_STD = 2.0
+# Share of flat blocks above which an image is rendered graphics, not a photo
+GRAPHIC_FLAT_SHARE = 0.3
+# Floor under the typical block error level, so the ratio to it stays finite
+ELA_MIN_LEVEL = 0.25
+# The noise measure works on 32px blocks; below this side there is not one
+# to measure and the pre-pass is skipped (icons, thin banners)
+MIN_SIDE = 32
+
+# IJG base luminance table (natural order), for estimating JPEG quality
+_BASE_LUMA = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+], dtype=np.float32).reshape(8, 8)
+
+# Orthonormal 8-point DCT-II matrix: block DCT is D @ block @ D.T
+_N = np.arange(8)
+_DCT = np.sqrt(2 / 8) * np.cos((2 * _N[None, :] + 1) * _N[:, None] * np.pi / 16)
+_DCT[0] /= np.sqrt(2)
+_DCT = _DCT.astype(np.float32)
+
+# Low-frequency AC coefficients whose histograms show double quantization
+_DQ_COEFFS = ((0, 1), (1, 0), (1, 1), (0, 2), (2, 0), (1, 2), (2, 1))
+
+
+def _blocks(a, size):
+    """(H, W) -> (H//size, W//size, size, size) view, edges trimmed."""
+    h, w = (a.shape[0] // size) * size, (a.shape[1] // size) * size
+    return a[:h, :w].reshape(h // size, size, w // size, size).swapaxes(1, 2)
+
+
+def _block_mean(a, size):
+    h, w = (a.shape[0] // size) * size, (a.shape[1] // size) * size
+    return a[:h, :w].reshape(h // size, size, w // size, size).mean(axis=(1, 3))
+
+
+def _block_std(a, size):
+    mean = _block_mean(a, size)
+    return np.sqrt(np.maximum(_block_mean(a * a, size) - mean * mean, 0))
+
+
+def _heatmap(grid, cells=4):
+    """Block scores -> `cells` x `cells` digits 0-9, rows joined by '/'."""
+    rows = np.array_split(np.arange(grid.shape[0]), cells)
+    cols = np.array_split(np.arange(grid.shape[1]), cells)
+    coarse = np.array([[grid[np.ix_(r, c)].mean() if len(r) and len(c) else 0.0 for c in cols] for r in rows])
+    top = coarse.max()
+    digits = np.zeros_like(coarse, dtype=int) if top <= 0 else np.rint(coarse / top * 9).astype(int)
+    return "/".join("".join(str(d) for d in row) for row in digits)
+
+
+def _box3(a):
+    """3x3 mean filter, separably from shifted slices of an edge-padded copy."""
+    h, w = a.shape
+    p = np.pad(a, 1, mode="edge")
+    rows = p[:, :w] + p[:, 1:w + 1] + p[:, 2:]
+    return (rows[:h] + rows[1:h + 1] + rows[2:]) * np.float32(1 / 9)
+
+
+# --- MEASURES ---
+
+def jpeg_quality(tables):
+    """Estimated IJG quality (1-100) of a luminance quantization table."""
+    table = np.asarray(tables[0], dtype=np.float32).reshape(8, 8)
+    scale = float(np.mean(table / _BASE_LUMA)) * 100
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return int(np.clip(round(quality), 1, 100))
+
+
+def error_level(luma):
+    """Error-level analysis: difference to a fresh JPEG re-save at ELA_QUALITY.
+
+    A region pasted from another source was compressed a different number
+    of times and stands out against the rest of the picture.
+    """
+    buf = io.BytesIO()
+    PIL.Image.fromarray(luma.astype(np.uint8), "L").save(buf, "JPEG", quality=ELA_QUALITY)
+    resaved = np.asarray(PIL.Image.open(buf), dtype=np.float32)
+    diff = np.abs(luma - resaved)
+    grid = _block_mean(diff, 16)
+    # Flat blocks re-save almost exactly; compared with them, any text or
+    # edge would look like a hotspot
+    textured = _block_std(luma, 16) > FLAT_STD
+    if textured.sum() < 4:
+        textured = np.ones_like(grid, dtype=bool)
+    levels = grid[textured]
+    median = max(float(np.median(levels)), ELA_MIN_LEVEL)
+    hot = textured & (grid > max(3 * median, median + 3 * float(levels.std())))
+    return {
+        "mean": round(float(diff.mean()), 3),
+        "spread": round(float(np.percentile(levels, 99)) / median, 2),
+        "hotspots": round(float(hot.mean()), 4),
+        "heatmap": _heatmap(grid),
+    }
+
+
+def noise_residual(luma):
+    """Sensor-noise consistency: spread of the high-pass residual per block.
+
+    A camera leaves roughly the same noise everywhere; composites and local
+    retouching do not, and generated or heavily smoothed images have almost
+    none.
+    """
+    residual = luma - _box3(luma)
+    grid = _block_std(residual, 32)
+    # Clipped (pure black/white) blocks carry no noise; leave them out
+    texture = _block_std(luma, 32)
+    textured = grid[texture > 1.0]
+    if textured.size < 4:
+        textured = grid.ravel()
+    p5, median, p95 = np.percentile(textured, (5, 50, 95))
+    flat = _block_std(luma, 16) <= FLAT_STD
+    return {
+        "level": round(float(median), 3),
+        "inconsistency": round(float((p95 - p5) / (median + 1e-3)), 3),
+        "flat": round(float(flat.mean()), 3),
+        "heatmap": _heatmap(grid),
+    }, residual
+
+
+def double_quantization(luma, tables):
+    """Roughness of DCT coefficient histograms (median over low frequencies).
+
+    After one compression, coefficients divided by their quantization step
+    follow a smooth, decaying histogram (roughness ~0.05). Recompressing an
+    already compressed image with a different table leaves periodic gaps or
+    peaks in it (0.2 and up). A first pass at higher quality than the last
+    one leaves no trace and is not detected.
+    """
+    q = np.asarray(tables[0], dtype=np.float32).reshape(8, 8)
+    coef = _DCT @ _blocks(luma - 128.0, 8) @ _DCT.T
+    scores = []
+    for u, v in _DQ_COEFFS:
+        k = np.abs(np.rint(coef[..., u, v] / q[u, v])).astype(np.int64).ravel()
+        hist = np.bincount(k[(k >= 1) & (k <= 24)], minlength=25)[1:].astype(np.float32)
+        if hist.sum() < 2000:
+            continue
+        # Distance of each bin from the mean of its neighbours
+        scores.append(float(np.abs(hist[1:-1] - (hist[:-2] + hist[2:]) / 2).sum() / hist.sum()))
+    return round(float(np.median(scores)), 3) if scores else None
+
+
+def spectral_peaks(residual):
+    """Strength of periodic artifacts in the noise residual, by period.
+
+    Transposed convolutions in GAN/diffusion upsamplers repeat every 2 or 4
+    pixels; JPEG blocking repeats every 8 (and therefore also shows at 4 and
+    2). Returns (upsampling peak, grid peak) as ratios over the local
+    spectrum level; only a period-2/4 peak well above the period-8 family
+    points to upsampling.
+    """
+    h, w = residual.shape
+    side = min(FFT_SIDE, h, w) // 8 * 8
+    if side < 64:
+        return None, None
+    top, left = (h - side) // 2, (w - side) // 2
+    crop = residual[top:top + side, left:left + side]
+    window = np.hanning(side).astype(np.float32)
+    # Mean magnitude along each axis: rows for horizontal, columns for vertical
+    profiles = (
+        np.abs(np.fft.rfft(crop * window[None, :], axis=1)).mean(axis=0),
+        np.abs(np.fft.rfft(crop * window[:, None], axis=0)).mean(axis=1),
+    )
+
+    def peak(profile, period):
+        k = int(round(side / period))
+        lo, hi = max(1, k - 8), min(len(profile), k + 9)
+        ring = np.r_[profile[lo:max(lo, k - 1)], profile[min(hi, k + 2):hi]]
+        return float(profile[k] / (np.median(ring) + 1e-6)) if ring.size else 1.0
+
+    upsampling = max(peak(p, period) for p in profiles for period in (2, 4))
+    grid = max(peak(p, period) for p in profiles for period in (8, 8 / 3))
+    return round(upsampling, 2), round(grid, 2)
+
+
+# --- PRE-PASS ---
+
+def _luma(data, img):
+    """(luma array, JPEG tables or None, full size?) for the analysis.
+
+    Full size when the upload is small enough to decode again, the
+    model-sized image otherwise.
+    """
+    tables = None
+    try:
+        original = PIL.Image.open(io.BytesIO(data))
+        if original.format == "JPEG":
+            tables = getattr(original, "quantization", None) or None
+            original.draft("L", original.size)  # skips the colour conversion
+        if original.format != "JPEG" and original.size == img.size:
+            return np.asarray(img.convert("L"), dtype=np.float32), tables, True
+        if original.size[0] * original.size[1] <= FORENSICS_MAX_PIXELS:
+            return np.asarray(original.convert("L"), dtype=np.float32), tables, True
+    except (OSError, SyntaxError, PIL.UnidentifiedImageError):
+        pass
+    return np.asarray(img.convert("L"), dtype=np.float32), tables, False
+
+
+def analyze(data, img):
+    """Upload bytes + decoded image -> dict of scores, signals and suspicion."""
+    started = time.perf_counter()
+    luma, tables, full_size = _luma(data, img)
+    if min(luma.shape) < MIN_SIDE:
+        return {
+            "size": [luma.shape[1], luma.shape[0]],
+            "too_small": True,
+            "ela": None,
+            "noise": None,
+            "jpeg": {"quality": None, "double_compression": None},
+            "spectrum": {"upsampling_peak": None, "grid_peak": None},
+            "graphic": False,
+            "signals": [],
+            "suspicion": 0.0,
+            "strong": False,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    ela = error_level(luma)
+    noise, residual = noise_residual(luma)
+    upsampling, grid = spectral_peaks(residual)
+    report = {
+        "size": [luma.shape[1], luma.shape[0]],
+        "ela": ela,
+        "noise": noise,
+        "jpeg": {
+            "quality": jpeg_quality(tables) if tables else None,
+            "double_compression": double_quantization(luma, tables) if tables and full_size else None,
+        },
+        "spectrum": {"upsampling_peak": upsampling, "grid_peak": grid},
+    }
+
+    # Screenshots, posters and other rendered graphics have no sensor noise
+    # to be consistent about, and their error level follows the contrast of
+    # the text on them rather than compression history. Edited text is left
+    # to the VLM.
+    graphic = noise["flat"] >= GRAPHIC_FLAT_SHARE
+    report["graphic"] = graphic
+
+    # Each signal scores 0..1 and belongs to one measure; the strongest is
+    # the overall suspicion
+    signals = {}  # description -> (measure, score)
+    if not graphic and ela["hotspots"] > 0 and ela["spread"] >= 4:
+        signals["localized error-level hotspot (possible splice)"] = ("ela", min(1.0, (ela["spread"] - 2) / 6))
+    if not graphic and noise["inconsistency"] >= 2.5:
+        signals["inconsistent noise across regions"] = ("noise", min(1.0, (noise["inconsistency"] - 1.5) / 3))
+    if not graphic and noise["level"] < 0.6:
+        signals["almost no sensor noise (synthetic or heavily smoothed)"] = (
+            "noise", min(1.0, (0.8 - noise["level"]) / 0.5))
+    dq = report["jpeg"]["double_compression"]
+    if dq is not None and dq >= 0.15:
+        signals["double JPEG compression"] = ("jpeg", min(1.0, (dq - 0.1) / 0.3))
+    if upsampling and upsampling >= 4 and upsampling >= 1.5 * (grid or 1):
+        signals["periodic upsampling artifacts in the spectrum"] = ("spectrum", min(1.0, (upsampling - 2) / 6))
+
+    suspicion = max((score for _, score in signals.values()), default=0.0)
+    report["signals"] = sorted(signals, key=lambda name: signals[name][1], reverse=True)
+    report["suspicion"] = round(suspicion, 2)
+    # One heuristic alone never settles it: strong needs two measures agreeing
+    report["strong"] = len({measure for measure, score in signals.values() if score >= STRONG_SUSPICION}) >= 2
+    report["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def summarize(report):
+    """Forensic report as a few lines of prompt text."""
+    if report.get("too_small"):
+        return (f"Local forensic pre-pass: skipped, the image is too small "
+                f"({report['size'][0]}x{report['size'][1]} px).")
+    jpeg = report["jpeg"]
+    lines = [
+        f"Local forensic pre-pass (heuristic scores, {report['size'][0]}x{report['size'][1]} px):",
+        f"- Error level: mean {report['ela']['mean']}, hotspot spread {report['ela']['spread']}x, "
+        f"heatmap 4x4 {report['ela']['heatmap']}",
+        f"- Noise residual: level {report['noise']['level']}, inconsistency {report['noise']['inconsistency']}, "
+        f"heatmap 4x4 {report['noise']['heatmap']}"
+        + (" (rendered graphics such as a screenshot: no sensor noise expected, error level follows text contrast)"
+           if report.get("graphic") else ""),
+        f"- JPEG: quality ~{jpeg['quality'] if jpeg['quality'] else 'n/a'}, double compression "
+        f"{jpeg['double_compression'] if jpeg['double_compression'] is not None else 'n/a'}",
+        f"- Spectrum: period-2/4 peak {report['spectrum']['upsampling_peak']}, "
+        f"JPEG grid peak {report['spectrum']['grid_peak']}",
+        f"- Signals: {', '.join(report['signals']) if report['signals'] else 'none'} "
+        f"(suspicion {report['suspicion']})",
+    ]
+    return "\n".join(lines)
@@ -1,19 +1,13 @@
-import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import google.generativeai as genai
+from llm_provider import build_provider
+from session_store import build_history, new_session, record_turn, resolve_session_id, store_from_env
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Crucial for frontend-backend communication
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
-
-genai.configure(api_key=GEMINI_API_KEY)
-
 SYSTEM_PROMPT = """
 You are BharatMat Assistant, an AI-powered civic awareness assistant designed for a
 Voter Awareness & Misinformation Control Platform.
@@ -55,12 +49,10 @@ PRIVACY:
 Your goal is to empower voters with knowledge, not influence them.
 """
 
-# Initialize Model
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash", # Highly efficient for chat
-    system_instruction=SYSTEM_PROMPT
-)
-chat = model.start_chat(history=[])
+# Initialize Model (needs GEMINI_API_KEY unless LLM_PROVIDER says otherwise)
+llm = build_provider(model="gemini-2.5-flash")  # Highly efficient for chat
+# Each browser session gets its own bounded conversation memory
+sessions = store_from_env()
 
 @app.route('/chat', methods=['POST'])
 def handle_chat():
@@ -71,8 +63,13 @@ def handle_chat():
         if not user_input:
             return jsonify({"reply": "Please enter a message."}), 400
 
-        response = chat.send_message(user_input)
-        return jsonify({"reply": response.text})
+        session_id = resolve_session_id(data.get("session_id") or request.headers.get("X-Session-Id"))
+        session = sessions.load(session_id) or new_session()
+
+        response = llm.generate(user_input, system=SYSTEM_PROMPT, history=build_history(session), priority="chat")
+
+        sessions.save(session_id, record_turn(session, user_input, response.text))
+        return jsonify({"reply": response.text, "session_id": session_id})
 
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import combinations
+import PIL.Image
+
+# Near-duplicate lookup settings. Two 64-bit dHashes within HASH_DISTANCE
+# bits are treated as the same picture (re-compressed, resized, lightly cropped).
+HASH_DISTANCE = int(os.getenv("IMAGE_CACHE_DISTANCE", 6))
+CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", 6 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 200_000))
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(img, size=8):
+    """64-bit difference hash: sign of the horizontal gradient on a 9x8 thumbnail."""
+    small = img.convert("L").resize((size + 1, size), PIL.Image.Resampling.LANCZOS)
+    px = small.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (px[offset + col] < px[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit hashes.
+
+    The hash is split into 4 chunks of 16 bits, each with its own exact-match
+    table. If two hashes differ in at most r bits, at least one chunk differs
+    in at most r // 4 bits (pigeonhole), so probing each table with every
+    variant of that chunk within r // 4 flips finds all candidates. With r < 8
+    that is 17 dict lookups per table, independent of the number of entries.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.tables = [{} for _ in range(CHUNKS)]
+        sub = radius // CHUNKS
+        self._flips = [0]
+        for k in range(1, sub + 1):
+            for bits in combinations(range(CHUNK_BITS), k):
+                mask = 0
+                for b in bits:
+                    mask |= 1 << b
+                self._flips.append(mask)
+
+    @staticmethod
+    def _chunks(h):
+        return [(h >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def add(self, h, key):
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            table.setdefault(chunk, set()).add(key)
+
+    def remove(self, h, key):
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            bucket = table.get(chunk)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del table[chunk]
+
+    def candidates(self, h):
+        found = set()
+        for table, chunk in zip(self.tables, self._chunks(h)):
+            for mask in self._flips:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    found.update(bucket)
+        return found
+
+
+class ImageVerdictCache:
+    """Verdict cache keyed by perceptual hash, with TTL and LRU size eviction.
+
+    Entries are keyed by (image hash, claim key) so the same image sent with a
+    different claim is not answered from another claim's verdict.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, distance=HASH_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.distance = distance
+        self._entries = OrderedDict()  # (hash, claim_key) -> (expires_at, verdict)
+        self._index = MultiIndexHash(distance)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+
+    def get(self, h, claim_key=""):
+        """Returns the verdict of the closest live entry, or None."""
+        started = time.perf_counter()
+        now = time.time()
+        best = None
+        with self._lock:
+            for key in self._index.candidates(h):
+                if key[1] != claim_key:
+                    continue
+                dist = hamming(h, key[0])
+                if dist > self.distance or (best and dist >= best[0]):
+                    continue
+                expires_at, _ = self._entries[key]
+                if expires_at < now:
+                    self._drop(key)
+                    continue
+                best = (dist, key)
+
+            if best:
+                self._entries.move_to_end(best[1])
+                verdict = self._entries[best[1]][1]
+                self.hits += 1
+            else:
+                verdict = None
+                self.misses += 1
+            self._lookup_seconds += time.perf_counter() - started
+        return verdict
+
+    def put(self, h, verdict, claim_key=""):
+        key = (h, claim_key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._index.add(h, key)
+            self._entries[key] = (time.time() + self.ttl, verdict)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._index.remove(key[0], key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_lookup_ms": round(self._lookup_seconds * 1000 / lookups, 4) if lookups else 0.0,
+            }
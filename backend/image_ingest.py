@@ -0,0 +1,85 @@
+import io
+import os
+import PIL.Image
+import PIL.ImageOps
+from google.genai import types
+
+# Upload limits. Byte size is checked while reading the stream and the pixel
+# count is checked from the header, both before any pixel data is decoded.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))
+
+# Gemini tiles images into 768x768 crops, so a bigger upload only costs
+# bandwidth and tokens without giving the model more to look at.
+MODEL_IMAGE_SIDE = int(os.getenv("MODEL_IMAGE_SIDE", 768))
+MODEL_JPEG_QUALITY = 90
+
+# Pillow raises DecompressionBombError past 2x this value
+PIL.Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class ImageRejected(ValueError):
+    """Upload that is not a decodable image or is over the size limits."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # Raised in media decoding workers; keep the status across the pickle
+        return type(self), (str(self), self.status)
+
+
+def read_upload(file_storage):
+    """Reads an uploaded file into memory, refusing more than MAX_UPLOAD_BYTES."""
+    data = file_storage.stream.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", 413)
+    if not data:
+        raise ImageRejected("Uploaded image is empty.")
+    return data
+
+
+def decode_image(data):
+    """Decodes image bytes to an RGB image no larger than MODEL_IMAGE_SIDE."""
+    try:
+        img = PIL.Image.open(io.BytesIO(data))  # header only, no pixels yet
+    except PIL.Image.DecompressionBombError:
+        raise ImageRejected("Image has too many pixels.", 413)
+    except (PIL.UnidentifiedImageError, OSError):
+        raise ImageRejected("Uploaded file is not a supported image.")
+
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageRejected("Image has too many pixels.", 413)
+
+    # JPEG can decode straight at a reduced scale, which is much cheaper
+    # than decoding full size and resizing afterwards.
+    img.draft("RGB", (MODEL_IMAGE_SIDE, MODEL_IMAGE_SIDE))
+    try:
+        img = PIL.ImageOps.exif_transpose(img)
+        img.thumbnail((MODEL_IMAGE_SIDE, MODEL_IMAGE_SIDE), PIL.Image.Resampling.LANCZOS)
+    except (OSError, SyntaxError):
+        raise ImageRejected("Uploaded image is corrupt or truncated.")
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def load_upload(file_storage):
+    """Request stream -> decoded, model-sized image. Nothing touches the disk."""
+    return decode_image(read_upload(file_storage))
+
+
+def to_model_part(img):
+    """Encodes an image as a compact JPEG part for generate_content.
+
+    Passing a PIL image directly makes the SDK re-encode it as PNG, which is
+    several times larger for photos.
+    """
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=MODEL_JPEG_QUALITY)
+    return types.Part.from_bytes(data=buf.getvalue(), mime_type="image/jpeg")
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background analysis jobs: a fixed worker pool, a cap on jobs waiting for
+# it, and how long finished jobs stay fetchable.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", 32))
+JOB_TTL = int(os.getenv("JOB_TTL", 15 * 60))
+MAX_JOBS = int(os.getenv("MAX_JOBS", 1000))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(RuntimeError):
+    """Every worker is busy and the waiting line is at JOB_MAX_QUEUE."""
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []  # (event, data), replayed to late subscribers
+        self.changed = threading.Condition()
+
+    @property
+    def terminal(self):
+        return self.status in (DONE, FAILED)
+
+    def emit(self, event, data=None):
+        with self.changed:
+            if event not in (DONE, FAILED):
+                self.stage = event
+            self.events.append((event, data or {}))
+            self.changed.notify_all()
+
+    def events_since(self, index, timeout):
+        """Events after `index`, waiting up to `timeout` if there are none yet.
+
+        A finished job has no more to wait for: a subscriber already past its
+        last event gets that event again, so it sees the end of the stream.
+        """
+        with self.changed:
+            if index >= len(self.events):
+                if self.terminal:
+                    return [self.events[-1]]
+                self.changed.wait(timeout)
+            return self.events[index:]
+
+    def to_dict(self):
+        body = {"job_id": self.id, "status": self.status, "stage": self.stage}
+        if self.status == DONE:
+            body["result"] = self.result
+        elif self.status == FAILED:
+            body["error"] = self.error
+        return body
+
+
+class JobManager:
+    """Runs pipeline calls off the request thread.
+
+    `submit(fn, *args)` returns a Job at once; `fn` is called on the pool
+    with a `progress(event, data)` keyword it can use to report stages.
+    Submissions beyond the queue limit raise QueueFull so the web tier can
+    answer 429 instead of piling up work it cannot finish.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queue=JOB_MAX_QUEUE, ttl=JOB_TTL, max_jobs=MAX_JOBS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0  # queued + running
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self._expire()
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self._pending} jobs already pending")
+            job = Job()
+            self._jobs[job.id] = job
+            self._pending += 1
+            self.submitted += 1
+        job.emit(QUEUED)
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def finished(self, result):
+        """Registers a job that is already done (e.g. answered from cache)."""
+        job = Job()
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self._finish(job, DONE, result=result)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        with job.changed:
+            job.status = RUNNING
+        job.emit(RUNNING)
+        try:
+            result = fn(*args, progress=job.emit, **kwargs)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            with self._lock:
+                self.failed += 1
+            self._finish(job, FAILED, error="System failed to process partial input.")
+        else:
+            self._finish(job, DONE, result=result)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _finish(self, job, status, result=None, error=None):
+        # One critical section: a terminal job always has its final event
+        with job.changed:
+            job.result = result
+            job.error = error
+            job.finished = time.time()
+            job.status = status
+            job.emit(status, job.to_dict())
+
+    def _expire(self):
+        # Caller holds self._lock. Jobs are in creation order, so finished
+        # ones past their TTL (or the count cap) are found from the front.
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            too_many = len(self._jobs) > self.max_jobs
+            if job.terminal and (too_many or now - job.finished > self.ttl):
+                del self._jobs[job_id]
+            elif not too_many and now - job.created <= self.ttl:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "queued": max(0, self._pending - self.workers),
+                "max_queue": self.max_queue,
+                "tracked": len(self._jobs),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "failed": self.failed,
+            }
@@ -0,0 +1,194 @@
+import json
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _is_literal(token):
+    try:
+        json.loads(token)
+    except ValueError:
+        return False
+    return True
+
+
+class JSONExtractor:
+    """Incremental, forgiving reader for the first JSON object in model output.
+
+    Feed it text as it arrives (a whole answer or stream chunks); `partial()`
+    returns the best object the text so far supports. Prose and ``` fences
+    before the object are skipped, a trailing comma before a closing bracket
+    is dropped, and a cut-off object is closed at the last complete value
+    (a string value cut mid-way is kept up to the cut). Anything that is not
+    JSON past that point (single quotes, bare keys) ends the scan; what was
+    read before it is still returned.
+    """
+
+    def __init__(self):
+        self.buf = []
+        self.stack = []
+        self.expect = None       # "key" | "colon" | "value" | "comma"
+        self.in_string = False
+        self.escape = False
+        self.key_string = False
+        self.token = None        # bare number / true / false / null in progress
+        self.after_comma = False
+        self.safe = 0
+        self.safe_stack = []
+        self.started = False
+        self.complete = False
+        self.broken = False
+
+    def feed(self, text):
+        for ch in text:
+            if self.complete or self.broken:
+                break
+            self._step(ch)
+        return self.partial()
+
+    def _mark_safe(self):
+        self.safe = len(self.buf)
+        self.safe_stack = list(self.stack)
+
+    def _value_done(self):
+        self.expect = "comma"
+        self.after_comma = False
+        self._mark_safe()
+
+    def _step(self, ch):
+        if not self.started:
+            if ch == "{":
+                self.started = True
+                self.buf.append(ch)
+                self.stack.append(ch)
+                self.expect = "key"
+                self._mark_safe()
+            return
+
+        if self.in_string:
+            self.buf.append(ch)
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+                if self.key_string:
+                    self.expect = "colon"
+                else:
+                    self._value_done()
+            return
+
+        if self.token is not None:
+            if ch.isalnum() or ch in "+-.":
+                self.token += ch
+                self.buf.append(ch)
+                return
+            token, self.token = self.token, None
+            if not _is_literal(token):  # True, None, NaN, bare words
+                self.broken = True
+                return
+            self._value_done()
+
+        if ch.isspace():
+            self.buf.append(ch)
+            return
+
+        top = self.stack[-1]
+        if ch == '"':
+            self.key_string = top == "{" and self.expect == "key"
+            if not self.key_string and self.expect != "value":
+                self.broken = True
+                return
+            self.in_string = True
+            self.after_comma = False
+            self.buf.append(ch)
+        elif ch in "{[":
+            if self.expect != "value":
+                self.broken = True
+                return
+            self.buf.append(ch)
+            self.stack.append(ch)
+            self.expect = "key" if ch == "{" else "value"
+            self.after_comma = False
+            self._mark_safe()
+        elif ch in "}]":
+            if _CLOSERS[top] != ch or self.expect in ("colon",) or (top == "{" and self.expect == "value"):
+                self.broken = True
+                return
+            if self.after_comma:
+                self._drop_trailing_comma()
+            self.buf.append(ch)
+            self.stack.pop()
+            if not self.stack:
+                self.complete = True
+                self._mark_safe()
+            else:
+                self._value_done()
+        elif ch == ":" and self.expect == "colon":
+            self.buf.append(ch)
+            self.expect = "value"
+        elif ch == "," and self.expect == "comma":
+            self.buf.append(ch)
+            self.expect = "key" if top == "{" else "value"
+            self.after_comma = True
+        elif self.expect == "value" and (ch.isalnum() or ch in "-+."):
+            self.token = ch
+            self.buf.append(ch)
+        else:
+            self.broken = True
+
+    def _drop_trailing_comma(self):
+        while self.buf and self.buf[-1].isspace():
+            self.buf.pop()
+        if self.buf and self.buf[-1] == ",":
+            self.buf.pop()
+        self.after_comma = False
+
+    def _closed(self, text, stack):
+        return text + "".join(_CLOSERS[c] for c in reversed(stack))
+
+    def partial(self):
+        """Best-effort object from the text so far; None before any '{'."""
+        if not self.started:
+            return None
+        candidates = []
+        if self.complete:
+            candidates.append("".join(self.buf))
+        if self.in_string and not self.key_string and not self.broken:
+            text = "".join(self.buf[:-1] if self.escape else self.buf)
+            candidates.append(self._closed(text + '"', self.stack))
+        if self.token is not None and not self.broken:
+            candidates.append(self._closed("".join(self.buf), self.stack))
+        candidates.append(self._closed("".join(self.buf[:self.safe]), self.safe_stack))
+        for text in candidates:
+            try:
+                return json.loads(text)
+            except ValueError:
+                continue
+        return None
+
+
+def extract_json(text, max_starts=5):
+    """Model answer -> dict, recovering what it can from malformed or
+    truncated JSON. Raises ValueError when there is no object at all.
+
+    Tries the first few '{' in the text, since prose before the object can
+    contain braces too, and prefers a complete object over a partial one.
+    """
+    text = text or ""
+    best = None
+    start = text.find("{")
+    tries = 0
+    while start != -1 and tries < max_starts:
+        extractor = JSONExtractor()
+        found = extractor.feed(text[start:])
+        if isinstance(found, dict):
+            if extractor.complete:
+                return found
+            if best is None or len(found) > len(best):
+                best = found
+        start = text.find("{", start + 1)
+        tries += 1
+    if not best:
+        raise ValueError("no JSON object in model answer")
+    return best
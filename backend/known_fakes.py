@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import PIL.Image
+
+from claim_cache import anchors, canonical_key, claims_agree, features, is_negated, jaccard
+from image_cache import MultiIndexHash, dhash, hamming
+
+# Curated registry of misinformation already debunked by ECI or PIB Fact
+# Check. Each record lists the claim as it circulates (several phrasings and
+# languages), 64-bit dHashes of the images that carry it, the verdict and the
+# official source. A match is answered straight from the registry, before
+# any cache or model call.
+REGISTRY_PATH = os.getenv(
+    "KNOWN_FAKES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "known_fakes.json")
+)
+# Stricter than the claim cache (0.8): these verdicts are returned as
+# authoritative. Near matches must also pass the claim cache's guard on
+# numbers, dates and names.
+SIMILARITY_THRESHOLD = float(os.getenv("KNOWN_FAKES_SIMILARITY", 0.9))
+HASH_DISTANCE = int(os.getenv("KNOWN_FAKES_DISTANCE", 6))
+# The file is checked for changes at most this often (seconds), on lookup
+RELOAD_INTERVAL = float(os.getenv("KNOWN_FAKES_RELOAD", 2))
+
+
+def _digest(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class KnownFakes:
+    """Registry lookup by fuzzy claim text or perceptual image hash.
+
+    Claims are matched on the claim cache's canonical tokens: candidates
+    share a token or consonant skeleton with the query (inverted index) and
+    are confirmed by Jaccard similarity of their feature sets; a negated
+    claim never matches its plain form, nor one with different numbers,
+    dates or names. Images go through the same
+    multi-index Hamming search as the image cache.
+
+    Edits to the JSON file are picked up without a restart. Only records
+    whose content changed are removed from and re-added to the indexes.
+    """
+
+    def __init__(self, path=REGISTRY_PATH, threshold=SIMILARITY_THRESHOLD, distance=HASH_DISTANCE):
+        self.path = path
+        self.threshold = threshold
+        self.distance = distance
+        self._records = {}   # id -> (digest, record)
+        self._claims = {}    # canonical key -> {"id", "features", "negated"}
+        self._postings = {}  # token / skeleton -> canonical keys
+        self._images = MultiIndexHash(distance)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0.0
+        self.reloads = 0
+        self.hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+        self.reload()
+
+    # --- LOADING ---
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+        self.reload()
+
+    def reload(self):
+        """Applies the file's changes to the indexes; True if anything changed."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stamp, records = None, {}
+        else:
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp:
+                return False
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    records = {record["id"]: record for record in json.load(f)}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Half-written or invalid edit: keep serving the last good version
+                print(f"⚠️ Known-fakes registry not reloaded: {e}")
+                self._stamp = stamp
+                return False
+        if stamp == self._stamp:
+            return False
+
+        with self._lock:
+            added = changed = removed = 0
+            for record_id in [r for r in self._records if r not in records]:
+                self._remove(record_id)
+                removed += 1
+            for record_id, record in records.items():
+                digest = _digest(record)
+                current = self._records.get(record_id)
+                if current and current[0] == digest:
+                    continue
+                if current:
+                    self._remove(record_id)
+                    changed += 1
+                else:
+                    added += 1
+                self._add(record_id, record, digest)
+            self._stamp = stamp
+            self.reloads += 1
+        if added or changed or removed:
+            print(f"🛡️ Known-fakes registry: +{added} ~{changed} -{removed} entries")
+            if records and not self._image_count():
+                print("⚠️ Known-fakes registry has no image_hashes; images are not pre-screened "
+                      "(add them with `python known_fakes.py hash <images>`)")
+        return bool(added or changed or removed)
+
+    def _add(self, record_id, record, digest):
+        self._records[record_id] = (digest, record)
+        for claim in record.get("claims", []):
+            key = canonical_key(claim)
+            if not key:
+                continue
+            tokens = key.split()
+            feats = features(tokens)
+            self._claims[key] = {"id": record_id, "features": feats, "negated": is_negated(tokens),
+                                 "anchors": anchors(claim)}
+            for term in self._terms(tokens, feats):
+                self._postings.setdefault(term, set()).add(key)
+        for value in record.get("image_hashes", []):
+            self._images.add(int(value, 16), (int(value, 16), record_id))
+
+    def _remove(self, record_id):
+        _, record = self._records.pop(record_id)
+        for claim in record.get("claims", []):
+            key = canonical_key(claim)
+            entry = self._claims.get(key)
+            if entry is None or entry["id"] != record_id:
+                continue
+            del self._claims[key]
+            for term in self._terms(key.split(), entry["features"]):
+                keys = self._postings.get(term)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self._postings[term]
+        for value in record.get("image_hashes", []):
+            self._images.remove(int(value, 16), (int(value, 16), record_id))
+
+    def _image_count(self):
+        return sum(len(record.get("image_hashes", [])) for _, record in self._records.values())
+
+    @staticmethod
+    def _terms(tokens, feats):
+        return set(tokens) | {f for f in feats if f.startswith("#")}
+
+    # --- LOOKUP ---
+
+    def match(self, claim="", image_hash=None):
+        """Registry report for a known fake, or None. Image first, then text."""
+        self._maybe_reload()
+        started = time.perf_counter()
+        with self._lock:
+            record_id = self._match_image(image_hash) if image_hash is not None else None
+            if record_id is None and claim:
+                record_id = self._match_claim(claim)
+            if record_id is None:
+                self.misses += 1
+                report = None
+            else:
+                self.hits += 1
+                report = self._report(self._records[record_id][1])
+            self._lookup_seconds += time.perf_counter() - started
+        return report
+
+    def _match_image(self, h):
+        best = None
+        for value, record_id in self._images.candidates(h):
+            dist = hamming(h, value)
+            if dist <= self.distance and (best is None or dist < best[0]):
+                best = (dist, record_id)
+        return best[1] if best else None
+
+    def _match_claim(self, claim):
+        key = canonical_key(claim)
+        if key in self._claims:
+            return self._claims[key]["id"]
+        tokens = key.split()
+        if not tokens:
+            return None
+        feats = features(tokens)
+        negated = is_negated(tokens)
+        claim_anchors = anchors(claim)
+        candidates = set()
+        for term in self._terms(tokens, feats):
+            candidates.update(self._postings.get(term, ()))
+
+        best, best_score = None, self.threshold
+        for other in candidates:
+            entry = self._claims[other]
+            if entry["negated"] != negated:
+                continue
+            if not claims_agree(tokens, claim_anchors, other.split(), entry["anchors"]):
+                continue
+            score = jaccard(feats, entry["features"])
+            if score >= best_score:
+                best, best_score = entry["id"], score
+        return best
+
+    @staticmethod
+    def _report(record):
+        return {
+            "verdict": record.get("verdict", "FAKE"),
+            "reasoning": record.get("reasoning", ""),
+            "confidence": record.get("confidence", "HIGH"),
+            "type": record.get("type", "Misinformation"),
+            "sources": record.get("source", ""),
+            "known_fake": record["id"],
+        }
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._records),
+                "claims": len(self._claims),
+                "image_hashes": self._image_count(),
+                "reloads": self.reloads,
+                "hits": self.hits,
+                "misses": self.misses,
+                "avg_lookup_ms": round(self._lookup_seconds * 1000 / lookups, 4) if lookups else 0.0,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and query the known-fakes registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    hashes = sub.add_parser("hash", help="dHash of images, for image_hashes in the registry")
+    hashes.add_argument("images", nargs="+")
+    check = sub.add_parser("check", help="look a claim and/or image up")
+    check.add_argument("claim", nargs="?", default="")
+    check.add_argument("--image")
+    args = parser.parse_args()
+
+    if args.command == "hash":
+        for path in args.images:
+            with PIL.Image.open(path) as img:
+                print(f"{dhash(img):016x}  {path}")
+        return
+    image_hash = None
+    if args.image:
+        with PIL.Image.open(args.image) as img:
+            image_hash = dhash(img)
+    print(json.dumps(KnownFakes().match(args.claim, image_hash), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
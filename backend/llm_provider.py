@@ -0,0 +1,537 @@
+import abc
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+HF_MODEL = os.getenv("HF_MODEL", "meta-llama/Llama-3.3-70B-Instruct")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
+HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", 30))
+# Whether the model takes response_schema together with the search tool
+# (older Gemini models reject the combination; the schema is then dropped
+# and the prompt's own JSON instructions have to do)
+GEMINI_SEARCH_SCHEMA = os.getenv("GEMINI_SEARCH_SCHEMA", "0") == "1"
+# How long the primary provider gets before the fallback is tried
+FALLBACK_AFTER = float(os.getenv("LLM_FALLBACK_AFTER", 20))
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+class ProviderError(RuntimeError):
+    """A provider could not produce an answer (error, timeout, unsupported input)."""
+
+
+class LLMResult:
+    """Text answer plus what we know about how it was produced."""
+
+    def __init__(self, text, provider, model, latency=0.0, urls=None, tokens_in=0, tokens_out=0):
+        self.text = text or ""
+        self.provider = provider
+        self.model = model
+        self.latency = latency
+        self.urls = urls or []
+        self.tokens_in = tokens_in
+        self.tokens_out = tokens_out
+
+    def json(self):
+        return parse_json_response(self.text)
+
+
+def strip_json_fences(text):
+    """Removes ```json fences (or a bare ``` block) around a model answer."""
+    text = (text or "").strip()
+    match = _FENCE_RE.search(text)
+    return match.group(1).strip() if match else text
+
+
+def parse_json_response(text):
+    """Model answer -> JSON object. Raises ValueError if there is none.
+
+    Prose around the object, trailing commas and a cut-off ending are
+    tolerated; see json_extract.
+    """
+    body = strip_json_fences(text)
+    try:
+        return json.loads(body)
+    except ValueError:
+        from json_extract import extract_json
+        return extract_json(body)
+
+
+class LLMProvider(abc.ABC):
+    """Common interface over the model backends.
+
+    generate(prompt, system=None, history=None, image=None, search=False,
+             max_tokens=None, temperature=None, timeout=None,
+             response_schema=None) -> LLMResult
+
+    `history` is a list of {"role": "user"|"model", "text": ...} turns that
+    come before `prompt`. `image` is a PIL image, or a list of them for one
+    call over several frames. `search=True` asks for a web-grounded answer
+    where the backend supports it. `response_schema` asks for JSON of that
+    shape where the backend can enforce it; callers still parse leniently,
+    since not every backend or mode can.
+    """
+
+    name = "base"
+
+    def __init__(self, model, timeout):
+        self.model = model
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    def generate(self, prompt, **kwargs):
+        pass
+
+    async def agenerate(self, prompt, **kwargs):
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        """Yields text chunks. Closing the generator stops the upstream call."""
+        yield self.generate(prompt, **kwargs).text
+
+    async def astream(self, prompt, **kwargs):
+        """Async `stream`. By default each chunk of the sync stream is
+        awaited on a worker thread; backends with an async client override it."""
+        upstream = self.stream(prompt, **kwargs)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, upstream, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            await asyncio.to_thread(upstream.close)
+
+
+def call_kind(image=None, search=False, system=None, **_):
+    """vision | search | chat | text: calls of one kind have similar latency."""
+    if image is not None:
+        return "vision"
+    if search:
+        return "search"
+    return "chat" if system else "text"
+
+
+# --- GEMINI (google.genai) ---
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key=None, model=GEMINI_MODEL, timeout=GEMINI_TIMEOUT):
+        super().__init__(model, timeout)
+        from google import genai
+        from google.genai import types
+        self._types = types
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        self.client = genai.Client(api_key=api_key)
+        # Built once; the tool definition never changes between calls
+        self.search_tool = types.Tool(google_search=types.GoogleSearch())
+
+    def _request(self, prompt, system=None, history=None, image=None, search=False,
+                 max_tokens=None, temperature=None, timeout=None, response_schema=None):
+        types = self._types
+        contents = []
+        for turn in history or []:
+            contents.append(types.Content(role=turn["role"], parts=[types.Part.from_text(text=turn["text"])]))
+        parts = []
+        if image is not None:
+            from image_ingest import to_model_part
+            parts.extend(to_model_part(img) for img in (image if isinstance(image, list) else [image]))
+        parts.append(types.Part.from_text(text=prompt))
+        contents.append(types.Content(role="user", parts=parts))
+
+        config = types.GenerateContentConfig(
+            system_instruction=system,
+            max_output_tokens=max_tokens,
+            temperature=temperature,
+            tools=[self.search_tool] if search else None,
+            http_options=types.HttpOptions(timeout=int((timeout or self.timeout) * 1000)),
+        )
+        if response_schema is not None and (GEMINI_SEARCH_SCHEMA or not search):
+            config.response_mime_type = "application/json"
+            config.response_schema = response_schema
+        return contents, config
+
+    def _result(self, response, started):
+        usage = response.usage_metadata
+        return LLMResult(
+            response.text,
+            self.name,
+            self.model,
+            latency=time.monotonic() - started,
+            urls=grounding_urls(response),
+            tokens_in=(usage.prompt_token_count or 0) if usage else 0,
+            tokens_out=(usage.candidates_token_count or 0) if usage else 0,
+        )
+
+    def generate(self, prompt, **kwargs):
+        started = time.monotonic()
+        contents, config = self._request(prompt, **kwargs)
+        try:
+            response = self.client.models.generate_content(model=self.model, contents=contents, config=config)
+        except Exception as e:
+            raise ProviderError(f"gemini: {e}") from e
+        return self._result(response, started)
+
+    async def agenerate(self, prompt, **kwargs):
+        started = time.monotonic()
+        contents, config = self._request(prompt, **kwargs)
+        try:
+            response = await self.client.aio.models.generate_content(model=self.model, contents=contents, config=config)
+        except Exception as e:
+            raise ProviderError(f"gemini: {e}") from e
+        return self._result(response, started)
+
+    def stream(self, prompt, **kwargs):
+        contents, config = self._request(prompt, **kwargs)
+        upstream = self.client.models.generate_content_stream(model=self.model, contents=contents, config=config)
+        try:
+            for chunk in upstream:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            upstream.close()
+
+    async def astream(self, prompt, **kwargs):
+        contents, config = self._request(prompt, **kwargs)
+        upstream = await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        )
+        try:
+            async for chunk in upstream:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            close = getattr(upstream, "aclose", None)
+            if close:
+                await close()
+
+
+def grounding_urls(response):
+    """Web URIs from a grounded response ([] when the model did not search)."""
+    if not response.candidates:
+        return []
+    metadata = response.candidates[0].grounding_metadata
+    if not metadata or not metadata.grounding_chunks:
+        return []
+    return [chunk.web.uri for chunk in metadata.grounding_chunks if chunk.web]
+
+
+# --- LLAMA (HuggingFace Inference) ---
+
+class HFProvider(LLMProvider):
+    """Text-only chat completions. Has no search grounding of its own, so
+    `search=True` answers from the prompt (and any evidence put in it)."""
+
+    name = "hf"
+
+    def __init__(self, token=None, model=HF_MODEL, timeout=HF_TIMEOUT):
+        super().__init__(model, timeout)
+        self.token = token or os.getenv("HF_TOKEN")
+        if not self.token:
+            raise ValueError("HF_TOKEN not found in environment variables")
+
+    def _messages(self, prompt, system=None, history=None, image=None, **_):
+        if image is not None:
+            raise ProviderError(f"hf: {self.model} does not accept images")
+        messages = [{"role": "system", "content": system}] if system else []
+        for turn in history or []:
+            role = "assistant" if turn["role"] == "model" else "user"
+            messages.append({"role": role, "content": turn["text"]})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _call_args(self, kwargs):
+        return {
+            "model": self.model,
+            "max_tokens": kwargs.get("max_tokens") or 512,
+            "temperature": kwargs.get("temperature") if kwargs.get("temperature") is not None else 0.1,
+        }
+
+    def generate(self, prompt, **kwargs):
+        from huggingface_hub import InferenceClient
+        started = time.monotonic()
+        messages = self._messages(prompt, **kwargs)
+        client = InferenceClient(api_key=self.token, timeout=kwargs.get("timeout") or self.timeout)
+        try:
+            response = client.chat_completion(messages=messages, **self._call_args(kwargs))
+        except Exception as e:
+            raise ProviderError(f"hf: {e}") from e
+        return self._result(response, started)
+
+    async def agenerate(self, prompt, **kwargs):
+        from huggingface_hub import AsyncInferenceClient
+        started = time.monotonic()
+        messages = self._messages(prompt, **kwargs)
+        client = AsyncInferenceClient(api_key=self.token, timeout=kwargs.get("timeout") or self.timeout)
+        try:
+            response = await client.chat_completion(messages=messages, **self._call_args(kwargs))
+        except Exception as e:
+            raise ProviderError(f"hf: {e}") from e
+        return self._result(response, started)
+
+    def stream(self, prompt, **kwargs):
+        from huggingface_hub import InferenceClient
+        messages = self._messages(prompt, **kwargs)
+        client = InferenceClient(api_key=self.token, timeout=kwargs.get("timeout") or self.timeout)
+        upstream = client.chat_completion(messages=messages, stream=True, **self._call_args(kwargs))
+        try:
+            for chunk in upstream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            close = getattr(upstream, "close", None)
+            if close:
+                close()
+
+    def _result(self, response, started):
+        usage = getattr(response, "usage", None)
+        return LLMResult(
+            response.choices[0].message.content,
+            self.name,
+            self.model,
+            latency=time.monotonic() - started,
+            tokens_in=getattr(usage, "prompt_tokens", 0) or 0,
+            tokens_out=getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+
+# --- LOCAL STAND-IN ---
+
+DEFAULT_FAKE_CONFIG = {
+    # Seconds, per kind of call. Lognormal roughly matches observed upstream tails.
+    "latency": {
+        "vision": {"dist": "lognormal", "median": 2.5, "sigma": 0.35},
+        "search": {"dist": "lognormal", "median": 3.0, "sigma": 0.4},
+        "text": {"dist": "lognormal", "median": 1.5, "sigma": 0.3},
+        "chat": {"dist": "lognormal", "median": 1.2, "sigma": 0.3},
+    },
+    "error_rate": 0.0,
+    "responses": {
+        "vision": "No GAN artifacts or lighting inconsistencies found; the photo appears authentic.",
+        "search": "Official ECI and PIB sources do not report this; PIB Fact Check has flagged similar posts as false.",
+        "text": '{"verdict": "FAKE", "reasoning": "Official sources contradict the claim. No credible report supports it.", "confidence": "HIGH", "type": "Misleading"}',
+        "chat": "The Election Commission of India publishes official schedules at eci.gov.in.",
+        # any kind, when the call passes response_schema
+        "structured": '{"verdict": "FAKE", "reasoning": "Official sources contradict the claim. No credible report supports it.", "confidence": "HIGH", "type": "Misleading"}',
+    },
+    # Optional [pattern, response] pairs checked against the prompt first
+    "rules": [],
+    "tokens_per_second": 80,
+}
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic offline provider for latency/throughput measurements.
+
+    Sleeps for a latency drawn from a per-kind distribution (fixed, uniform
+    or lognormal) and returns canned text. Kinds: vision (image given),
+    search (search=True), chat (system prompt given), text (anything else).
+    Config comes from the dict passed in, or the JSON file in FAKE_LLM_CONFIG.
+    """
+
+    name = "fake"
+
+    def __init__(self, config=None, seed=None, timeout=GEMINI_TIMEOUT):
+        super().__init__("fake-model", timeout)
+        if config is None and os.getenv("FAKE_LLM_CONFIG"):
+            with open(os.getenv("FAKE_LLM_CONFIG"), encoding="utf-8") as f:
+                config = json.load(f)
+        merged = json.loads(json.dumps(DEFAULT_FAKE_CONFIG))
+        for key, value in (config or {}).items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key].update(value)
+            else:
+                merged[key] = value
+        self.config = merged
+        self.rules = [(re.compile(p, re.IGNORECASE), r) for p, r in merged["rules"]]
+        seed = seed if seed is not None else int(os.getenv("FAKE_LLM_SEED", 7))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    kind_of = staticmethod(call_kind)
+
+    def _draw(self, kind):
+        spec = self.config["latency"].get(kind, {"dist": "fixed", "value": 0.0})
+        with self._lock:
+            if spec["dist"] == "uniform":
+                return self._rng.uniform(spec["low"], spec["high"])
+            if spec["dist"] == "lognormal":
+                return spec["median"] * self._rng.lognormvariate(0.0, spec["sigma"])
+        return spec.get("value", 0.0)
+
+    def _plan(self, prompt, kwargs):
+        kind = self.kind_of(**kwargs)
+        latency = self._draw(kind)
+        with self._lock:
+            failed = self._rng.random() < self.config["error_rate"]
+        text = self.config["responses"].get(kind, "")
+        if kwargs.get("response_schema") is not None:
+            text = self.config["responses"].get("structured", text)
+        for pattern, response in self.rules:
+            if pattern.search(prompt):
+                text = response
+                break
+        return kind, latency, failed, text
+
+    def _finish(self, kind, latency, failed, text, prompt, timeout):
+        if timeout is not None and latency > timeout:
+            raise ProviderError(f"fake: {kind} call exceeded {timeout}s") from TimeoutError()
+        if failed:
+            raise ProviderError(f"fake: injected {kind} failure") from ConnectionError("injected")
+        return LLMResult(text, self.name, self.model, latency=latency,
+                         urls=["https://www.eci.gov.in/"] if kind == "search" else [],
+                         tokens_in=len(prompt) // 4, tokens_out=len(text) // 4)
+
+    def generate(self, prompt, **kwargs):
+        kind, latency, failed, text = self._plan(prompt, kwargs)
+        timeout = kwargs.get("timeout") or self.timeout
+        time.sleep(min(latency, timeout))
+        return self._finish(kind, latency, failed, text, prompt, timeout)
+
+    async def agenerate(self, prompt, **kwargs):
+        kind, latency, failed, text = self._plan(prompt, kwargs)
+        timeout = kwargs.get("timeout") or self.timeout
+        await asyncio.sleep(min(latency, timeout))
+        return self._finish(kind, latency, failed, text, prompt, timeout)
+
+    def stream(self, prompt, **kwargs):
+        kind, latency, failed, text = self._plan(prompt, kwargs)
+        if failed:
+            raise ProviderError(f"fake: injected {kind} failure") from ConnectionError("injected")
+        # First token after the drawn latency, then a steady token rate
+        time.sleep(latency * 0.3)
+        step = 1.0 / self.config["tokens_per_second"]
+        for word in re.findall(r"\S+\s*", text):
+            yield word
+            time.sleep(step)
+
+    async def astream(self, prompt, **kwargs):
+        kind, latency, failed, text = self._plan(prompt, kwargs)
+        if failed:
+            raise ProviderError(f"fake: injected {kind} failure") from ConnectionError("injected")
+        await asyncio.sleep(latency * 0.3)
+        step = 1.0 / self.config["tokens_per_second"]
+        for word in re.findall(r"\S+\s*", text):
+            yield word
+            await asyncio.sleep(step)
+
+
+# --- FALLBACK ---
+
+_fallback_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_FALLBACK_WORKERS", 32)),
+                                    thread_name_prefix="llm-primary")
+
+
+class FallbackProvider(LLMProvider):
+    """Tries `primary` and switches to `fallback` when it errors or has not
+    answered within `after` seconds. Calls the fallback cannot serve (images
+    for a text-only model) only ever go to the primary."""
+
+    def __init__(self, primary, fallback, after=FALLBACK_AFTER):
+        super().__init__(primary.model, primary.timeout)
+        self.primary = primary
+        self.fallback = fallback
+        self.after = after
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def _can_fall_back(self, kwargs):
+        return kwargs.get("image") is None or self.fallback.name != "hf"
+
+    def generate(self, prompt, **kwargs):
+        if not self._can_fall_back(kwargs):
+            return self.primary.generate(prompt, **kwargs)
+        future = _fallback_pool.submit(self.primary.generate, prompt, **kwargs)
+        try:
+            return future.result(timeout=self.after)
+        except FuturesTimeout:
+            print(f"⏱️ {self.primary.name} slower than {self.after}s, falling back to {self.fallback.name}")
+        except Exception as e:
+            print(f"⚠️ {self.primary.name} failed ({e}), falling back to {self.fallback.name}")
+        return self.fallback.generate(prompt, **kwargs)
+
+    async def agenerate(self, prompt, **kwargs):
+        if not self._can_fall_back(kwargs):
+            return await self.primary.agenerate(prompt, **kwargs)
+        try:
+            return await asyncio.wait_for(self.primary.agenerate(prompt, **kwargs), self.after)
+        except asyncio.TimeoutError:
+            print(f"⏱️ {self.primary.name} slower than {self.after}s, falling back to {self.fallback.name}")
+        except Exception as e:
+            print(f"⚠️ {self.primary.name} failed ({e}), falling back to {self.fallback.name}")
+        return await self.fallback.agenerate(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        try:
+            upstream = self.primary.stream(prompt, **kwargs)
+            first = next(upstream, None)
+        except Exception as e:
+            if not self._can_fall_back(kwargs):
+                raise
+            print(f"⚠️ {self.primary.name} failed ({e}), falling back to {self.fallback.name}")
+            yield from self.fallback.stream(prompt, **kwargs)
+            return
+        try:
+            if first is not None:
+                yield first
+            yield from upstream
+        finally:
+            upstream.close()
+
+    async def astream(self, prompt, **kwargs):
+        upstream = self.primary.astream(prompt, **kwargs)
+        try:
+            first = await anext(upstream, None)
+        except Exception as e:
+            if not self._can_fall_back(kwargs):
+                raise
+            print(f"⚠️ {self.primary.name} failed ({e}), falling back to {self.fallback.name}")
+            async for chunk in self.fallback.astream(prompt, **kwargs):
+                yield chunk
+            return
+        try:
+            if first is not None:
+                yield first
+            async for chunk in upstream:
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+
+def build_provider(model=None):
+    """Provider chosen by LLM_PROVIDER (gemini | hf | fake). With gemini,
+    LLM_FALLBACK=hf adds Llama as a fallback when HF_TOKEN is set.
+
+    Whatever the backend, calls go through the process-wide scheduler and
+    the resilience layer, so they also accept `priority`, `deadline` and
+    `degraded` keywords (see scheduler.py and resilience.py)."""
+    from resilience import ResilientProvider
+    from scheduler import ScheduledProvider
+
+    kind = os.getenv("LLM_PROVIDER", "gemini")
+    if kind == "fake":
+        provider = FakeProvider()
+    elif kind == "hf":
+        provider = HFProvider(model=model or HF_MODEL)
+    else:
+        provider = GeminiProvider(model=model or GEMINI_MODEL)
+        if os.getenv("LLM_FALLBACK") == "hf" and os.getenv("HF_TOKEN"):
+            provider = FallbackProvider(provider, HFProvider())
+    # Retries and hedges are scheduled like any other call
+    return ResilientProvider(ScheduledProvider(provider))
+
+
+@functools.lru_cache(maxsize=None)
+def shared_provider(model=None):
+    """One provider per model for the whole process; the clients are thread-safe."""
+    return build_provider(model)
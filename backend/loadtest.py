@@ -0,0 +1,335 @@
+"""Load test for /chat and /analyze-media against a mock model backend.
+
+    python loadtest.py --worker-class gthread --workers 2 --threads 16 \
+        --concurrency 32 --duration 60 --mix chat=40,text=30,image=15,image_text=15
+
+Starts `gunicorn main:app` with LLM_PROVIDER=fake, so every model call sleeps
+for a latency drawn from FakeProvider's distributions (override them with
+--fake-config, see llm_provider.DEFAULT_FAKE_CONFIG). Then it drives the
+request mix and writes throughput, p50/p95/p99 latency, error rate and a
+per-stage breakdown (from the Server-Timing header) to a JSON file.
+Use --url to target a server that is already running, and --compare to
+diff two result files.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHAT_MESSAGES = [
+    "What is One Nation One Election?",
+    "How do I register to vote?",
+    "What is SIR of electoral rolls?",
+    "When is the next general election?",
+    "How can I check my name in the voter list?",
+]
+CLAIM_TEMPLATES = [
+    "Election in {place} postponed indefinitely",
+    "EVMs in {place} were hacked during counting",
+    "Voters in {place} can now vote through WhatsApp",
+    "Polling in {place} moved to a new date by ECI",
+    "{place} voter ID cards cancelled overnight",
+]
+PLACES = ["Delhi", "Bihar", "Kerala", "Punjab", "Assam", "Goa", "Odisha", "Gujarat"]
+_WORDS = "abcdefghijklmnopqrstuvwxyz"
+
+
+# --- PAYLOADS ---
+
+def _nonce_words():
+    # Random filler so unique claims do not collapse onto each other in the claim cache
+    return " ".join("".join(random.choices(_WORDS, k=7)) for _ in range(5))
+
+
+def make_claim(hot_set, hit_ratio):
+    if hot_set and random.random() < hit_ratio:
+        return random.choice(hot_set)
+    return f"{random.choice(CLAIM_TEMPLATES).format(place=random.choice(PLACES))} {_nonce_words()}"
+
+
+_noise = {}
+
+
+def make_image(size=(640, 480)):
+    """A noise JPEG over a random 9x8 block pattern. The blocks set its dHash,
+    so every image is a miss in the server's near-duplicate image cache."""
+    import PIL.Image
+    import PIL.ImageChops
+    if size not in _noise:
+        # Generating noise is the slow part; a few layers are enough
+        _noise[size] = [PIL.Image.effect_noise(size, 32) for _ in range(8)]
+    blocks = PIL.Image.frombytes("L", (9, 8), random.randbytes(72)).resize(size, PIL.Image.Resampling.NEAREST)
+    img = PIL.ImageChops.add(blocks, random.choice(_noise[size]), scale=2).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def pick_image(hot_set, hit_ratio):
+    if hot_set and random.random() < hit_ratio:
+        return random.choice(hot_set)
+    return make_image()
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: image/jpeg\r\n\r\n'.encode())
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(kind, base_url, hot_images, hot_claims, hit_ratio):
+    if kind == "chat":
+        body = json.dumps({"message": random.choice(CHAT_MESSAGES)}).encode()
+        return urllib.request.Request(f"{base_url}/chat", data=body, headers={"Content-Type": "application/json"})
+
+    fields, files = {}, {}
+    if kind in ("text", "image_text"):
+        fields["text"] = make_claim(hot_claims, hit_ratio)
+    if kind in ("image", "image_text"):
+        files["image"] = ("upload.jpg", pick_image(hot_images, hit_ratio))
+    body, content_type = multipart(fields, files)
+    return urllib.request.Request(f"{base_url}/analyze-media", data=body, headers={"Content-Type": content_type})
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        if name and rest:
+            stages[name] = float(rest) / 1000.0
+    return stages
+
+
+# --- DRIVER ---
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def run_load(base_url, mix, concurrency, duration, max_requests, hit_ratio, timeout):
+    kinds, weights = zip(*mix.items())
+    hot_images = [make_image() for _ in range(10)]
+    hot_claims = [make_claim([], 0) for _ in range(10)]
+
+    samples = []  # (kind, latency, ok, stages)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    issued = [0]
+
+    def worker():
+        while time.monotonic() < stop_at:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            kind = random.choices(kinds, weights)[0]
+            req = build_request(kind, base_url, hot_images, hot_claims, hit_ratio)
+            started = time.monotonic()
+            stages, ok = {}, False
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as resp:
+                    resp.read()
+                    ok = resp.status < 400
+                    stages = parse_server_timing(resp.headers.get("Server-Timing"))
+            except urllib.error.HTTPError as e:
+                e.read()
+                stages = parse_server_timing(e.headers.get("Server-Timing"))
+            except Exception:
+                pass
+            with lock:
+                samples.append((kind, time.monotonic() - started, ok, stages))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.monotonic() - started
+
+    report = {"wall_seconds": round(wall, 3), "requests": len(samples)}
+    report["throughput_rps"] = round(len(samples) / wall, 3) if wall else 0.0
+    report["error_rate"] = round(sum(1 for s in samples if not s[2]) / len(samples), 4) if samples else 0.0
+    report["overall"] = summarize([s[1] for s in samples if s[2]])
+    report["by_kind"] = {}
+    for kind in kinds:
+        subset = [s for s in samples if s[0] == kind]
+        entry = summarize([s[1] for s in subset if s[2]])
+        entry["errors"] = sum(1 for s in subset if not s[2])
+        report["by_kind"][kind] = entry
+    stage_values = {}
+    for _, _, ok, stages in samples:
+        for name, seconds in stages.items():
+            stage_values.setdefault(name, []).append(seconds)
+    report["stages"] = {name: summarize(values) for name, values in sorted(stage_values.items())}
+    return report
+
+
+# --- SERVER ---
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    port = _free_port()
+    env = dict(os.environ, LLM_PROVIDER="fake")
+    if args.fake_config:
+        env["FAKE_LLM_CONFIG"] = os.path.abspath(args.fake_config)
+    cmd = [
+        sys.executable, "-m", "gunicorn", "main:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--worker-class", args.worker_class,
+        "--threads", str(args.threads),
+        "--timeout", "120",
+        "--log-level", "warning",
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/cache/stats", timeout=1).read()
+            return proc, base_url
+        except Exception:
+            if proc.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready within 30s")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("chat", "text", "image", "image_text"):
+            raise argparse.ArgumentTypeError(f"unknown request kind: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def compare(path_a, path_b):
+    with open(path_a) as f:
+        a = json.load(f)
+    with open(path_b) as f:
+        b = json.load(f)
+    print(f"{'metric':<28}{'A':>12}{'B':>12}{'change':>10}")
+    rows = [("throughput_rps", a["results"]["throughput_rps"], b["results"]["throughput_rps"]),
+            ("error_rate", a["results"]["error_rate"], b["results"]["error_rate"])]
+    for pct in ("p50", "p95", "p99"):
+        rows.append((f"overall.{pct}", a["results"]["overall"][pct], b["results"]["overall"][pct]))
+    for name, va, vb in rows:
+        change = f"{(vb - va) / va * 100:+.1f}%" if va and vb is not None else "-"
+        print(f"{name:<28}{va if va is not None else '-':>12.4}{vb if vb is not None else '-':>12.4}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask endpoints against the fake model backend.")
+    parser.add_argument("--url", help="target an already running server instead of starting gunicorn")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class: sync, gthread, gevent, ...")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--fake-config", help="JSON file overriding FakeProvider latencies/responses")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=40,text=30,image=15,image_text=15"))
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--hit-ratio", type=float, default=0.0, help="share of claims and images drawn from a small repeated set")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="result file (default bench_results/<timestamp>_<worker-class>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    random.seed(args.seed)
+    proc = None
+    base_url = args.url
+    if not base_url:
+        proc, base_url = start_server(args)
+    try:
+        print(f"🚀 Driving {base_url} for {args.duration}s at concurrency {args.concurrency}...")
+        results = run_load(base_url, args.mix, args.concurrency, args.duration, args.requests,
+                           args.hit_ratio, args.timeout)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "config": {
+            "url": args.url, "worker_class": args.worker_class, "workers": args.workers,
+            "threads": args.threads, "mix": args.mix, "concurrency": args.concurrency,
+            "duration": args.duration, "hit_ratio": args.hit_ratio, "fake_config": args.fake_config,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(BACKEND_DIR, "bench_results",
+                                   f"{time.strftime('%Y%m%d_%H%M%S')}_{args.worker_class}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+
+    overall = results["overall"]
+    print(f"✅ {results['requests']} requests, {results['throughput_rps']} req/s, "
+          f"errors {results['error_rate'] * 100:.1f}%")
+    if overall["count"]:
+        print(f"   p50 {overall['p50'] * 1000:.0f} ms | p95 {overall['p95'] * 1000:.0f} ms | "
+              f"p99 {overall['p99'] * 1000:.0f} ms")
+    for name, stage in results["stages"].items():
+        print(f"   stage {name:<10} p50 {stage['p50'] * 1000:.0f} ms | p95 {stage['p95'] * 1000:.0f} ms")
+    print(f"📄 Saved: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,92 @@
 import os
 import json
 import random  # Added for random source selection
-import PIL.Image
-from flask import Flask, request, jsonify, make_response
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as StageTimeout
+import re
+import uuid
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from alerts_feed import AlertsFeed, FeedBusy, etag_matches
+from claim_cache import ClaimCache, canonical_key
+from evidence_index import format_passages, open_index
+from faq_index import FAQIndex
+import forensics
+from image_cache import ImageVerdictCache, dhash
+from image_ingest import ImageRejected, MAX_UPLOAD_BYTES, decode_image, read_upload
+from jobs import JobManager, QueueFull
+from known_fakes import KnownFakes
+import media_frames
+import metrics
+from llm_provider import build_provider
+from scheduler import RateLimited
+from singleflight import SingleFlight, TooManyWaiters
+from verdict_store import shared_store
+from verdicts import VERDICT_INSTRUCTIONS, VERDICT_SCHEMA, read_verdict
 
 # Load Environment Variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+# Werkzeug rejects oversized bodies with a 413 before we read them
+app.config["MAX_CONTENT_LENGTH"] = max(MAX_UPLOAD_BYTES, media_frames.MAX_MEDIA_BYTES) + 64 * 1024
+# Albums and videos are decoded in worker processes, forked here before any
+# of the objects below start their threads. MEDIA_WORKERS=0 decodes inline.
+media_pool = media_frames.start_pool()
 
-# Configuration
-API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
+# Configuration: LLM_PROVIDER picks the backend (gemini by default, `fake`
+# for offline load tests); Gemini needs GEMINI_API_KEY. Every call is
+# admitted by the shared scheduler under its priority class.
+llm = build_provider()
 
-client = genai.Client(api_key=API_KEY)
+# Concurrent /analyze-media: image scan and claim search run side by side,
+# each with its own latency budget (seconds). Set ANALYZE_CONCURRENT=0 to
+# fall back to the old one-after-another pipeline.
+CONCURRENT_STAGES = os.getenv("ANALYZE_CONCURRENT", "1") == "1"
+VLM_TIMEOUT = float(os.getenv("VLM_TIMEOUT", "15"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "20"))
+# Whole-pipeline budget, kept under the hosting proxy's request timeout.
+# Retries inside a stage only happen while they still fit in it.
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "45"))
+# With only a claim or only an image, the one evidence call (grounded search
+# or image scan) returns the verdict object itself and the synthesis call is
+# skipped. Claim + image still runs both stages side by side and merges them
+# in a synthesis call. VERDICT_MODE=multi always synthesizes.
+SINGLE_PASS = os.getenv("VERDICT_MODE", "single") == "single"
+stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STAGE_WORKERS", "16")),
+    thread_name_prefix="analyze-stage",
+)
+
+# Debunked claims and images, answered before any cache or model call
+known_fakes = KnownFakes()
+# Vetted answers to the questions /chat gets most, answered without a model call
+faq = FAQIndex()
+# Verdicts we have already produced (near-duplicates included)
+image_cache = ImageVerdictCache()
+claim_cache = ClaimCache()
+# Official circulars, manifestos and notifications, checked before the web.
+# New or changed documents are indexed at startup; EVIDENCE_INDEX=0 disables.
+evidence = open_index() if os.getenv("EVIDENCE_INDEX", "1") == "1" else None
+# Concurrent identical requests attach to a single in-flight pipeline
+inflight = SingleFlight()
+# /jobs/analyze-media runs the same pipeline on a bounded background pool
+jobs = JobManager()
+# Every verdict produced here (not cache hits) is logged for later review
+verdict_store = shared_store()
+# Notifications + debunked fakes for noti.html and fake.html, kept up to date
+# from the verdict store
+alerts_feed = AlertsFeed(verdict_store)
+ALERTS_MAX_AGE = int(os.getenv("ALERTS_MAX_AGE", "10"))
+ALERTS_STREAM_SECONDS = float(os.getenv("ALERTS_STREAM_SECONDS", "300"))
+# Each open /alerts/stream holds a worker thread for up to
+# ALERTS_STREAM_SECONDS; past this many, new streams get a 503. Clients that
+# can poll should use /alerts?since=&wait= instead.
+ALERTS_MAX_STREAMS = int(os.getenv("ALERTS_MAX_STREAMS", "16"))
+alerts_streams = threading.BoundedSemaphore(ALERTS_MAX_STREAMS)
 
 # Define the mandatory sources
 OFFICIAL_SOURCES = [
@@ -27,6 +94,40 @@ OFFICIAL_SOURCES = [
     "https://www.pib.gov.in/"
 ]
 
+# --- REQUEST TRACING ---
+# Every request gets a trace id (the caller's X-Request-Id if it looks sane),
+# a timings dict the handlers fill in, a latency histogram sample and one
+# JSON log line that ties the id to its stage timings.
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{8,64}$")
+
+@app.before_request
+def _start_trace():
+    candidate = request.headers.get("X-Request-Id", "")
+    g.trace_id = candidate if _TRACE_ID_RE.match(candidate) else uuid.uuid4().hex[:16]
+    g.started = time.monotonic()
+    g.timings = {}
+
+@app.after_request
+def _finish_trace(response):
+    # Streaming responses are measured up to their first byte
+    elapsed = time.monotonic() - g.started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    response.headers["X-Request-Id"] = g.trace_id
+    if endpoint != "/metrics":
+        metrics.log_event(
+            "request", trace_id=g.trace_id, method=request.method, path=request.path,
+            status=response.status_code, duration_ms=round(elapsed * 1000, 1), timings=_ms(g.timings),
+        )
+    return response
+
+def _ms(timings):
+    return {name: round(seconds * 1000, 1) for name, seconds in dict(timings).items()}
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # --- SYSTEM PROMPT FOR CIVIC CHAT ---
 # (Kept exactly as provided)
 CIVIC_SYSTEM_PROMPT = """
@@ -71,7 +172,27 @@ Your goal is to empower voters with knowledge, not influence them.
 """
 
 # --- 1. CIVIC CHAT ENDPOINT ---
-# (Kept exactly as provided)
+# `degraded` is what users get while the model upstream is failing
+CHAT_OPTIONS = {
+    "system": CIVIC_SYSTEM_PROMPT,
+    "max_tokens": 500,
+    "priority": "chat",
+    "degraded": "⚠️ I can't reach the verification service right now. For official election "
+                "information please check https://www.eci.gov.in/ or https://www.pib.gov.in/.",
+}
+
+def _faq_answer(user_input):
+    """Local reply from the FAQ index, or None to ask the model."""
+    local = faq.answer(user_input)
+    metrics.CACHE_LOOKUPS.inc(cache="faq", result="hit" if local else "miss")
+    return local
+
+def _faq_miss(user_input, reply):
+    # Model answers to questions the index missed are candidates for it
+    if reply and reply != CHAT_OPTIONS["degraded"]:
+        faq.record_miss(user_input, reply)
+
+# Non-streaming reply, kept for older app builds
 @app.route('/chat', methods=['POST'])
 def handle_chat():
     try:
@@ -80,84 +201,572 @@ def handle_chat():
         if not user_input:
             return jsonify({"reply": "Please enter a message."}), 400
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=CIVIC_SYSTEM_PROMPT,
-                max_output_tokens=500,
-            ),
-            contents=user_input
-        )
+        local = _faq_answer(user_input)
+        if local:
+            return jsonify(local)
+        response = llm.generate(user_input, **CHAT_OPTIONS)
+        _faq_miss(user_input, response.text)
         return jsonify({"reply": response.text})
+    except RateLimited as e:
+        response = jsonify({"reply": "⚠️ The assistant is busy right now. Please try again in a moment."})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
     except Exception as e:
         print(f"Chat Error: {e}")
         return jsonify({"reply": "⚠️ System Error: Unable to process chat request."}), 500
 
 
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Streaming reply as server-sent events: one `data: {"delta": ...}` per chunk,
+# then `event: done`. If the client goes away, the WSGI server closes this
+# generator and we close the upstream stream, which stops generation.
+@app.route('/chat/stream', methods=['POST'])
+def handle_chat_stream():
+    data = request.get_json(silent=True) or {}
+    user_input = data.get("message", "")
+    if not user_input:
+        return jsonify({"reply": "Please enter a message."}), 400
+
+    local = _faq_answer(user_input)
+    if local:
+        return Response(
+            _sse({"delta": local["reply"]}) + _sse({"faq": local["faq"]}, event="done"),
+            mimetype="text/event-stream",
+        )
+
+    def events():
+        upstream = None
+        try:
+            upstream = llm.stream(user_input, **CHAT_OPTIONS)
+            parts = []
+            for text in upstream:
+                parts.append(text)
+                yield _sse({"delta": text})
+            yield _sse({}, event="done")
+            _faq_miss(user_input, "".join(parts))
+        except GeneratorExit:
+            print("Chat stream: client disconnected, stopping generation.")
+            raise
+        except RateLimited as e:
+            yield _sse({"reply": "⚠️ The assistant is busy right now. Please try again in a moment.",
+                        "retry_after": e.retry_after}, event="error")
+        except Exception as e:
+            print(f"Chat Stream Error: {e}")
+            yield _sse({"reply": "⚠️ System Error: Unable to process chat request."}, event="error")
+        finally:
+            if upstream is not None:
+                upstream.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- 2. FORENSIC LAB ENDPOINT ---
+VLM_PROMPT = "Forensic check: Is this AI-generated, a deepfake, or an authentic photo? Look for GAN artifacts."
+# When the local forensic pre-pass is already conclusive, the image scan is
+# skipped next to a claim search, and an image-only check sends a single
+# small tile that the model only has to confirm.
+FORENSICS_SHORT_SIDE = int(os.getenv("FORENSICS_SHORT_SIDE", "384"))
+VLM_CONFIRM_PROMPT = ("Local forensic analysis of this image flagged: {signals}. "
+                      "Confirm or refute that it is manipulated or AI-generated from what you can see.")
+
+# Returned instead of a 500 when the model upstream is down; never cached
+DEGRADED_REPORT = {
+    "verdict": "UNVERIFIED",
+    "reasoning": "Automated verification is temporarily unavailable. Please check official sources before sharing.",
+    "confidence": "LOW",
+    "type": "Unverified",
+}
+
+# Upstream timeouts mirror the stage budgets so an abandoned call does not
+# keep a pool thread busy long after we stopped waiting for it.
+def _vlm_prompt(img, forensic):
+    """(prompt, image) for the image scan, shortened when forensics is conclusive."""
+    if forensic is None:
+        return VLM_PROMPT, img
+    if forensic["strong"]:
+        small = img.copy()
+        small.thumbnail((FORENSICS_SHORT_SIDE, FORENSICS_SHORT_SIDE))
+        prompt = VLM_CONFIRM_PROMPT.format(signals=", ".join(forensic["signals"]))
+        return f"{prompt}\n{forensics.summarize(forensic)}\n", small
+    return f"{VLM_PROMPT}\n{forensics.summarize(forensic)}\n", img
+
+# Each stage is built as (prompt, call options) so the WSGI path (generate)
+# and the ASGI path in asgi.py (agenerate) send the very same calls.
+def _scan_image_call(img, deadline=None, forensic=None):
+    prompt, img = _vlm_prompt(img, forensic)
+    return prompt, dict(
+        image=img, timeout=VLM_TIMEOUT, priority="forensics",
+        deadline=_stage_deadline(deadline, VLM_TIMEOUT),
+        degraded="No evidence from image scan (model unavailable).",
+    )
+
+def _scan_image(img, deadline=None, forensic=None):
+    prompt, options = _scan_image_call(img, deadline, forensic)
+    return llm.generate(prompt, **options).text
+
+def _official_evidence(passages):
+    if not passages:
+        return ""
+    return ("\nHigh-trust evidence from official ECI/PIB documents (prefer it over web results):\n"
+            + format_passages(passages) + "\n")
+
+def _search_claim_call(text_claim, vlm_analysis=None, deadline=None, official=""):
+    contents = f"Fact check this claim: {text_claim}.{official}"
+    if vlm_analysis:
+        contents += f" Context from image scan: {vlm_analysis}."
+    return contents, dict(
+        search=True, timeout=SEARCH_TIMEOUT, priority="forensics",
+        deadline=_stage_deadline(deadline, SEARCH_TIMEOUT),
+        degraded="No evidence from search (model unavailable).",
+    )
+
+def _search_claim(text_claim, vlm_analysis=None, deadline=None, official=""):
+    prompt, options = _search_claim_call(text_claim, vlm_analysis, deadline, official)
+    return llm.generate(prompt, **options).text
+
+def _synthesis_call(final_prompt, deadline=None):
+    return final_prompt, dict(priority="forensics", deadline=deadline,
+                              response_schema=VERDICT_SCHEMA, degraded=json.dumps(DEGRADED_REPORT))
+
+def _synthesize(final_prompt, deadline=None):
+    prompt, options = _synthesis_call(final_prompt, deadline)
+    return llm.generate(prompt, **options)
+
+def _documents_call(text_claim, official, deadline=None):
+    # No search grounding: the official passages are the only evidence
+    return (
+        f"Fact check this claim: {text_claim}.{official}"
+        "Judge it against these documents only; answer UNVERIFIED if they do not settle it." + VERDICT_INSTRUCTIONS,
+        dict(timeout=SEARCH_TIMEOUT, priority="forensics", deadline=_stage_deadline(deadline, SEARCH_TIMEOUT),
+             response_schema=VERDICT_SCHEMA, degraded=json.dumps(DEGRADED_REPORT)),
+    )
+
+def _verdict_from_documents(text_claim, official, deadline=None):
+    prompt, options = _documents_call(text_claim, official, deadline)
+    return llm.generate(prompt, **options)
+
+def _one_pass_call(text_claim, img, deadline=None, official="", forensic=None):
+    if img is not None:
+        prompt, img = _vlm_prompt(img, forensic)
+        return prompt + VERDICT_INSTRUCTIONS, dict(
+            image=img, timeout=VLM_TIMEOUT, priority="forensics",
+            deadline=_stage_deadline(deadline, VLM_TIMEOUT), response_schema=VERDICT_SCHEMA,
+            degraded="No evidence from image scan (model unavailable).",
+        )
+    return f"Fact check this claim: {text_claim}.{official}" + VERDICT_INSTRUCTIONS, dict(
+        search=True, timeout=SEARCH_TIMEOUT, priority="forensics",
+        deadline=_stage_deadline(deadline, SEARCH_TIMEOUT), response_schema=VERDICT_SCHEMA,
+        degraded="No evidence from search (model unavailable).",
+    )
+
+def _verdict_in_one_pass(text_claim, img, deadline=None, official="", forensic=None):
+    prompt, options = _one_pass_call(text_claim, img, deadline, official, forensic)
+    return llm.generate(prompt, **options)
+
+def _stage_deadline(deadline, budget):
+    stage_deadline = time.monotonic() + budget
+    return stage_deadline if deadline is None else min(deadline, stage_deadline)
+
+def _await_stage(name, future, deadline, fallback):
+    """Waits for a stage until its deadline; a late stage yields `fallback`."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except StageTimeout:
+        future.cancel()
+        print(f"⏱️ {name} stage missed its deadline, continuing without it.")
+        return fallback
+
+def _timed(timings, name, fn, *args):
+    started = time.monotonic()
+    try:
+        return fn(*args)
+    finally:
+        timings[name] = time.monotonic() - started
+        metrics.STAGE_SECONDS.observe(timings[name], stage=name)
+
+def _server_timing(timings):
+    # Standard Server-Timing header, read by browsers' devtools and loadtest.py
+    # (copy first: a stage that missed its deadline may still write to it)
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in dict(timings).items())
+
+def _no_progress(event, data=None):
+    pass
+
+def _plan_image_scan(text_claim, img, forensic):
+    """(image to scan or None, placeholder analysis) for the evidence stage."""
+    if forensic is not None and forensic["strong"] and text_claim:
+        # Conclusive local forensics (two independent measures agreeing)
+        # stand in for the image scan
+        metrics.VLM_CALLS.inc(mode="skipped")
+        return None, "Image scan skipped: the local forensic pre-pass was conclusive."
+    if img is not None:
+        metrics.VLM_CALLS.inc(mode="short" if forensic is not None and forensic["strong"] else "full")
+    return img, "No image provided."
+
+def _gather_evidence(text_claim, img, timings, progress=_no_progress, deadline=None, official="", forensic=None):
+    """Returns (search_context, vlm_analysis) for the synthesis prompt."""
+    search_context = "No text claim provided."
+    img, vlm_analysis = _plan_image_scan(text_claim, img, forensic)
+
+    if not CONCURRENT_STAGES:
+        if img is not None:
+            vlm_analysis = _timed(timings, "vlm", _scan_image, img, deadline, forensic)
+            progress("image_scanned")
+        if text_claim:
+            search_context = _timed(timings, "search", _search_claim, text_claim, vlm_analysis, deadline, official)
+        progress("evidence_gathered")
+        return search_context, vlm_analysis
+
+    # Both stages start now; the search uses the raw claim so it does not
+    # have to wait for the image scan.
+    started = time.monotonic()
+    vlm_future = (stage_pool.submit(_timed, timings, "vlm", _scan_image, img, deadline, forensic)
+                  if img is not None else None)
+    search_future = (stage_pool.submit(_timed, timings, "search", _search_claim, text_claim, None, deadline, official)
+                     if text_claim else None)
+
+    if vlm_future:
+        vlm_analysis = _await_stage(
+            "Image scan", vlm_future, started + VLM_TIMEOUT,
+            "No evidence from image scan (timed out)."
+        )
+        progress("image_scanned")
+    if search_future:
+        search_context = _await_stage(
+            "Search", search_future, started + SEARCH_TIMEOUT,
+            "No evidence from search (timed out)."
+        )
+    progress("evidence_gathered")
+    return search_context, vlm_analysis
+
+def _index_stage(text_claim, timings):
+    """(official evidence for the prompts, confident?) from the offline index."""
+    if not text_claim or evidence is None:
+        return "", False
+    passages, confident = _timed(timings, "index", evidence.lookup, text_claim)
+    metrics.EVIDENCE_LOOKUPS.inc(result="confident" if confident else "partial" if passages else "miss")
+    return _official_evidence(passages), confident
+
+def _one_pass_applies(text_claim, img):
+    return SINGLE_PASS and (img is None) != (not text_claim)
+
+def _synthesis_prompt(search_context, official, vlm_analysis, forensic):
+    # FINAL SYNTHESIS - Removed instructions to find links to save tokens
+    local_forensics = forensics.summarize(forensic) if forensic is not None else ""
+    return f"""
+    Evidence: {search_context}{official}
+    Visual: {vlm_analysis}
+    {local_forensics}
+    
+    Task: Create a JSON report.{VERDICT_INSTRUCTIONS}"""
+
+def _keep_local_verdict(report, complete, result, text_claim, image_hash, timings, forensic):
+    """True (and cached) if the documents-only verdict settles the claim."""
+    if complete and report["verdict"] != "UNVERIFIED" and result.provider != "degraded":
+        claim_cache.put(text_claim, report)
+        _store_verdict(report, result, text_claim, image_hash, timings, forensic)
+        return True
+    return False
+
+def _keep_verdict(report, complete, result, text_claim, image_hash, claim_key, timings, forensic):
+    # Degraded or half-parsed answers are placeholders, not verdicts worth caching
+    if complete and result.provider != "degraded":
+        if image_hash is not None:
+            image_cache.put(image_hash, report, claim_key)
+        elif text_claim:
+            claim_cache.put(text_claim, report)
+    _store_verdict(report, result, text_claim, image_hash, timings, forensic)
+
+def run_analysis(text_claim, img, image_hash, claim_key, timings, progress=_no_progress, forensic=None):
+    """Evidence stages + synthesis for one request; caches and returns the report.
+
+    `forensic` is the local pre-pass report for the image, if any.
+    `progress(event)` is told when the image is scanned, the evidence is in
+    and the verdict is ready; async jobs forward these to their subscribers.
+    asgi.py runs the same steps with async model calls.
+    """
+    deadline = time.monotonic() + ANALYZE_DEADLINE
+    complete = False
+
+    official, confident = _index_stage(text_claim, timings)
+    if confident and img is None:
+        # Settled by our own documents: no web search at all
+        result = _timed(timings, "local", _verdict_from_documents, text_claim, official, deadline)
+        report, complete = _timed(timings, "parse", _parse_report, result, "local")
+        if _keep_local_verdict(report, complete, result, text_claim, image_hash, timings, forensic):
+            progress("evidence_gathered")
+            progress("verdict_ready")
+            return report
+        complete = False
+
+    if _one_pass_applies(text_claim, img):
+        stage = "vlm" if img is not None else "search"
+        if img is not None:
+            metrics.VLM_CALLS.inc(mode="short" if forensic is not None and forensic["strong"] else "full")
+        result = _timed(timings, stage, _verdict_in_one_pass, text_claim, img, deadline, official, forensic)
+        if img is not None:
+            progress("image_scanned")
+        progress("evidence_gathered")
+        report, complete = _timed(timings, "parse", _parse_report, result, stage)
+        # Not a usable verdict: its text is still evidence for the synthesis
+        vlm_analysis = result.text if img is not None else "No image provided."
+        search_context = result.text if text_claim else "No text claim provided."
+    else:
+        # Image scan and claim search run side by side
+        search_context, vlm_analysis = _gather_evidence(
+            text_claim, img, timings, progress, deadline, official, forensic
+        )
+
+    if not complete:
+        final_prompt = _synthesis_prompt(search_context, official, vlm_analysis, forensic)
+        result = _timed(timings, "synthesis", _synthesize, final_prompt, deadline)
+        report, complete = _timed(timings, "parse", _parse_report, result, "synthesis")
+
+    _keep_verdict(report, complete, result, text_claim, image_hash, claim_key, timings, forensic)
+    progress("verdict_ready")
+    return report
+
+def _store_verdict(report, result, text_claim, image_hash, timings, forensic):
+    verdict_store.record(
+        "analyze", report, claim=text_claim, image_hash=image_hash, timings=timings,
+        model=f"{result.provider}:{result.model}",
+        forensic_suspicion=forensic["suspicion"] if forensic is not None else None,
+    )
+
+def _parse_report(result, stage):
+    report, complete = read_verdict(result.text)
+    if not complete and result.provider != "degraded":
+        metrics.PARSE_FAILURES.inc(stage=stage)
+        print(f"Incomplete verdict from {stage}: {result.text[:200]!r}")
+    return report, complete
+
+def _read_analysis_request(timings):
+    """Form fields -> (text_claim, img, image_hash, claim_key, forensic, cached report)."""
+    return _prepare_analysis(request.form.get('text', ''), request.files.get('image', None), timings, g.trace_id)
+
+def _prepare_analysis(text_claim, image_file, timings, trace_id=None):
+    """Upload decoding, known-fakes and cache lookups, forensics: everything
+    local that comes before the model calls. The cached report may also be
+    a known-fakes registry match. `forensic` is the local pre-pass over the
+    upload, run only when the image still needs analysing."""
+    img = None
+    image_hash = None
+    forensic = None
+    claim_key = canonical_key(text_claim)
+
+    # CASE 1: IMAGE PROCESSING (decoded in memory, per request)
+    if image_file and image_file.filename != '':
+        data = _timed(timings, "upload", read_upload, image_file)
+        metrics.IMAGE_BYTES.observe(len(data))
+        img = _timed(timings, "decode", decode_image, data)
+        image_hash = dhash(img)
+
+    if not (text_claim or image_hash is not None):
+        return text_claim, img, image_hash, claim_key, forensic, None
+
+    known = _timed(timings, "known", known_fakes.match, text_claim, image_hash)
+    metrics.CACHE_LOOKUPS.inc(cache="known_fakes", result="hit" if known else "miss")
+    if known:
+        metrics.count_verdict(known, "known_fake")
+        verdict_store.record("known_fake", known, claim=text_claim, image_hash=image_hash, timings=timings,
+                             model="known_fakes", trace_id=trace_id)
+        return text_claim, img, image_hash, claim_key, forensic, known
+
+    if image_hash is not None:
+        cached = _timed(timings, "cache", image_cache.get, image_hash, claim_key)
+        metrics.CACHE_LOOKUPS.inc(cache="image", result="hit" if cached else "miss")
+    else:
+        cached = _timed(timings, "cache", claim_cache.get, text_claim)
+        metrics.CACHE_LOOKUPS.inc(cache="claim", result="hit" if cached else "miss")
+    if cached:
+        metrics.count_verdict(cached, "cache")
+    elif img is not None:
+        forensic = _timed(timings, "forensics", forensics.analyze, data, img)
+    return text_claim, img, image_hash, claim_key, forensic, cached
+
+def _analyze_shared(text_claim, img, image_hash, claim_key, timings, progress=_no_progress, forensic=None):
+    # Identical requests already in flight (same claim, same image dHash)
+    # share one pipeline run. Near-duplicates of an image are not coalesced:
+    # they are served by image_cache once the first one has finished.
+    waited = time.monotonic()
+    report, shared = inflight.do(
+        f"{image_hash}|{claim_key}",
+        run_analysis, text_claim, img, image_hash, claim_key, timings, progress, forensic
+    )
+    if shared:
+        timings["coalesced"] = time.monotonic() - waited
+        progress("verdict_ready")
+    return _public_report(report, shared)
+
+def _public_report(report, shared):
+    metrics.count_verdict(report, "coalesced" if shared else "fresh")
+    report = dict(report)
+
+    # MANDATORY OVERRIDE: Always pick one of the two URLs randomly
+    report["sources"] = random.choice(OFFICIAL_SOURCES)
+    return report
+
+# Albums and videos: several `image` fields and/or `video` fields. Uploads
+# are decoded on media_pool, videos cut into scene keyframes, and frames
+# that are near-duplicates collapse into one scene. The scenes go to the
+# model many per call; the synthesis call turns their per-frame findings
+# into one verdict. Model calls grow with distinct scenes, not frames.
+def _media_uploads(files):
+    """(image files, video files) for anything beyond a single image, else None."""
+    images = [f for f in files.getlist('image') if f.filename]
+    videos = [f for f in files.getlist('video') if f.filename]
+    return (images, videos) if len(images) > 1 or videos else None
+
+def _read_media(images, videos):
+    media_frames.check_upload_count(images, videos)
+    stills = [read_upload(f) for f in images]
+    clips = [(media_frames.read_video(f), f.filename) for f in videos]
+    media_frames.check_upload_total([len(d) for d in stills] + [len(d) for d, _ in clips])
+    for data in stills:
+        metrics.IMAGE_BYTES.observe(len(data))
+    return stills, clips
+
+def _match_known_scenes(text_claim, scenes):
+    """(registry report, matching image hash) for the first known scene or the claim."""
+    for scene in scenes:
+        known = known_fakes.match("", scene["hash"])
+        if known:
+            return known, scene["hash"]
+    return (known_fakes.match(text_claim), None) if text_claim else (None, None)
+
+def _media_key(claim_key, scenes):
+    # Only the very same scenes (and claim) share a cached verdict
+    return f"{claim_key}|media:" + ",".join(f"{s['hash']:016x}" for s in scenes)
+
+def _prepare_media(text_claim, images, videos, timings, trace_id=None):
+    """_prepare_analysis for albums and videos -> (scenes, stats, media_key, cached report)."""
+    stills, clips = _timed(timings, "upload", _read_media, images, videos)
+    scenes, stats = _timed(timings, "frames", media_frames.extract, stills, clips, media_pool)
+    media_key = _media_key(canonical_key(text_claim), scenes)
+
+    known, known_hash = _timed(timings, "known", _match_known_scenes, text_claim, scenes)
+    metrics.CACHE_LOOKUPS.inc(cache="known_fakes", result="hit" if known else "miss")
+    if known:
+        metrics.count_verdict(known, "known_fake")
+        verdict_store.record("known_fake", known, claim=text_claim, image_hash=known_hash, timings=timings,
+                             model="known_fakes", trace_id=trace_id)
+        return scenes, stats, media_key, known
+
+    cached = _timed(timings, "cache", image_cache.get, scenes[0]["hash"], media_key)
+    metrics.CACHE_LOOKUPS.inc(cache="image", result="hit" if cached else "miss")
+    if cached:
+        metrics.count_verdict(cached, "cache")
+    else:
+        _timed(timings, "forensics", media_frames.analyze_scenes, scenes, media_pool)
+    return scenes, stats, media_key, cached
+
+def _frames_call(batch, deadline=None):
+    return media_frames.batch_prompt(batch), dict(
+        image=[s["img"] for s in batch], timeout=VLM_TIMEOUT, priority="forensics",
+        deadline=_stage_deadline(deadline, VLM_TIMEOUT), response_schema=media_frames.FRAME_FINDINGS_SCHEMA,
+        degraded="No evidence from image scan (model unavailable).",
+    )
+
+def _scan_frames(batch, deadline=None):
+    prompt, options = _frames_call(batch, deadline)
+    return llm.generate(prompt, **options).text
+
+def _scan_batches(batches, deadline):
+    """Every batch at once; the slowest one sets the stage latency."""
+    started = time.monotonic()
+    futures = [stage_pool.submit(_scan_frames, batch, deadline) for batch in batches]
+    return [
+        _await_stage("Frame scan", future, started + VLM_TIMEOUT, "No evidence from image scan (timed out).")
+        for future in futures
+    ]
+
+def _keep_media_verdict(report, complete, result, text_claim, scenes, stats, media_key, timings):
+    if complete and result.provider != "degraded":
+        image_cache.put(scenes[0]["hash"], report, media_key)
+    suspect = max(scenes, key=lambda s: s["forensic"]["suspicion"] if s.get("forensic") else 0.0)
+    verdict_store.record(
+        "media", report, claim=text_claim, image_hash=suspect["hash"], timings=timings,
+        model=f"{result.provider}:{result.model}", scene_hashes=[f"{s['hash']:016x}" for s in scenes], media=stats,
+    )
+
+def run_media_analysis(text_claim, scenes, stats, media_key, timings, progress=_no_progress):
+    """run_analysis for albums and videos: batched frame scans and the claim
+    search side by side, then one synthesis over the aggregated findings."""
+    deadline = time.monotonic() + ANALYZE_DEADLINE
+    official, _ = _index_stage(text_claim, timings)
+    batches = media_frames.batches(scenes)
+    metrics.VLM_CALLS.inc(len(batches), mode="batched")
+
+    search_future = (stage_pool.submit(_timed, timings, "search", _search_claim, text_claim, None, deadline, official)
+                     if text_claim else None)
+    answers = _timed(timings, "vlm", _scan_batches, batches, deadline)
+    progress("image_scanned")
+    search_context = "No text claim provided."
+    if search_future:
+        search_context = _await_stage(
+            "Search", search_future, deadline, "No evidence from search (timed out)."
+        )
+    progress("evidence_gathered")
+
+    vlm_analysis = media_frames.aggregate(scenes, stats, answers)
+    final_prompt = _synthesis_prompt(search_context, official, vlm_analysis, None)
+    result = _timed(timings, "synthesis", _synthesize, final_prompt, deadline)
+    report, complete = _timed(timings, "parse", _parse_report, result, "synthesis")
+    _keep_media_verdict(report, complete, result, text_claim, scenes, stats, media_key, timings)
+    progress("verdict_ready")
+    return report
+
+def _analyze_media_shared(text_claim, scenes, stats, media_key, timings, progress=_no_progress):
+    waited = time.monotonic()
+    report, shared = inflight.do(
+        media_key, run_media_analysis, text_claim, scenes, stats, media_key, timings, progress
+    )
+    if shared:
+        timings["coalesced"] = time.monotonic() - waited
+        progress("verdict_ready")
+    return dict(_public_report(report, shared), media=stats)
+
 @app.route('/analyze-media', methods=['POST', 'OPTIONS'])
 def analyze_media():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
 
+    timings = g.timings
+    request_started = g.started
     try:
-        text_claim = request.form.get('text', '')
-        image_file = request.files.get('image', None)
-
-        vlm_analysis = "No image provided."
-        search_context = "No text claim provided."
-
-        # CASE 1: IMAGE PROCESSING
-        if image_file and image_file.filename != '':
-            temp_path = "temp_analysis.png"
-            image_file.save(temp_path)
-            img = PIL.Image.open(temp_path)
-            
-            vlm_res = client.models.generate_content(
-                model="gemini-2.0-flash", 
-                contents=[img, "Forensic check: Is this AI-generated, a deepfake, or an authentic photo? Look for GAN artifacts."]
-            )
-            vlm_analysis = vlm_res.text
+        uploads = _media_uploads(request.files)
+        if uploads:
+            text_claim = request.form.get('text', '')
+            scenes, stats, media_key, cached = _prepare_media(text_claim, *uploads, timings, g.trace_id)
+            if cached:
+                return _report_response(dict(_cached_report(cached), media=stats), timings, request_started)
+            report = _analyze_media_shared(text_claim, scenes, stats, media_key, timings)
+            return _report_response(report, timings, request_started)
 
-        # CASE 2: SEARCH/FACT-CHECK
-        if text_claim:
-            search_tool = types.Tool(google_search=types.GoogleSearch())
-            search_res = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=f"Fact check this claim: {text_claim}. Context from image scan: {vlm_analysis}.",
-                config=types.GenerateContentConfig(tools=[search_tool])
-            )
-            search_context = search_res.text
-
-        # FINAL SYNTHESIS - Removed instructions to find links to save tokens
-        final_prompt = f"""
-        Evidence: {search_context}
-        Visual: {vlm_analysis}
-        
-        Task: Create a JSON report.
-        Return ONLY JSON:
-        {{
-          "verdict": "FACT/FAKE/UNVERIFIED",
-          "reasoning": "2 sentences.",
-          "confidence": "HIGH/MEDIUM/LOW",
-          "type": "Deepfake/Authentic/Misleading/AI Generated"
-        }}
-        """
-        
-        verdict_res = client.models.generate_content(model="gemini-2.0-flash", contents=final_prompt)
-        
-        raw_text = verdict_res.text.strip()
-        if "```json" in raw_text:
-            raw_text = raw_text.split("```json")[1].split("```")[0].strip()
-            
-        # Parse the JSON from LLM
-        report = json.loads(raw_text)
-
-        # MANDATORY OVERRIDE: Always pick one of the two URLs randomly
-        report["sources"] = random.choice(OFFICIAL_SOURCES)
+        text_claim, img, image_hash, claim_key, forensic, cached = _read_analysis_request(timings)
+        if cached:
+            return _report_response(_cached_report(cached), timings, request_started)
 
-        return jsonify(report)
+        # CASE 2: SEARCH/FACT-CHECK
+        report = _analyze_shared(text_claim, img, image_hash, claim_key, timings, forensic=forensic)
+        return _report_response(report, timings, request_started)
 
+    except ImageRejected as e:
+        return _error_response(str(e), e.status)
+    except TooManyWaiters:
+        return _error_response(
+            "This item is being checked for many users right now. Please retry shortly.", 429, retry_after=2
+        )
+    except RateLimited as e:
+        return _error_response("The forensic lab is busy right now. Please retry shortly.", 429, retry_after=e.retry_after)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({
@@ -166,6 +775,248 @@ def analyze_media():
             "sources": random.choice(OFFICIAL_SOURCES) # Random source even on error
         }), 500
 
+def _cached_report(cached):
+    report = dict(cached, cached=True)
+    # Registry matches keep the official source that debunked them
+    if "known_fake" not in report:
+        report["sources"] = random.choice(OFFICIAL_SOURCES)
+    return report
+
+def _report_response(report, timings, request_started, status=200):
+    timings["total"] = time.monotonic() - request_started
+    response = jsonify(report)
+    response.status_code = status
+    response.headers["Server-Timing"] = _server_timing(timings)
+    return response
+
+def _error_response(reasoning, status, retry_after=None):
+    metrics.count_verdict({"verdict": "ERROR"}, "error")
+    response = jsonify({
+        "verdict": "ERROR",
+        "reasoning": reasoning,
+        "sources": random.choice(OFFICIAL_SOURCES)
+    })
+    response.status_code = status
+    if retry_after:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+# --- 3. ASYNC FORENSIC JOBS ---
+# Same pipeline as /analyze-media, but the request returns a job id at once
+# and the work runs on the JobManager pool. Clients poll GET /jobs/<id> or
+# subscribe to GET /jobs/<id>/events for stage progress.
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "15"))
+
+def _job_links(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.route('/jobs/analyze-media', methods=['POST', 'OPTIONS'])
+def submit_analysis_job():
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+
+    timings = g.timings
+    try:
+        # Decoding stays on the request thread: the upload stream is gone
+        # once we return, and a bad image should fail here, not in the job.
+        uploads = _media_uploads(request.files)
+        if uploads:
+            text_claim = request.form.get('text', '')
+            scenes, stats, media_key, cached = _prepare_media(text_claim, *uploads, timings, g.trace_id)
+            if cached:
+                job = jobs.finished(dict(_cached_report(cached), media=stats))
+            else:
+                job = jobs.submit(_media_job, g.trace_id, text_claim, scenes, stats, media_key, dict(timings))
+            return _job_accepted(job)
+
+        text_claim, img, image_hash, claim_key, forensic, cached = _read_analysis_request(timings)
+        if cached:
+            job = jobs.finished(_cached_report(cached))
+        else:
+            job = jobs.submit(_analysis_job, g.trace_id, text_claim, img, image_hash, claim_key, forensic,
+                              dict(timings))
+    except ImageRejected as e:
+        return _error_response(str(e), e.status)
+    except QueueFull:
+        return _error_response("The forensic lab is busy right now. Please retry shortly.", 429, retry_after=5)
+    except Exception as e:
+        print(f"Job Submit Error: {e}")
+        return _error_response("System failed to process partial input.", 500)
+    return _job_accepted(job)
+
+def _job_accepted(job):
+    response = jsonify(_job_links(job))
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+def _analysis_job(trace_id, text_claim, img, image_hash, claim_key, forensic, timings, progress=_no_progress):
+    started = time.monotonic()
+    try:
+        return _analyze_shared(text_claim, img, image_hash, claim_key, timings, progress, forensic)
+    finally:
+        metrics.log_event("job", trace_id=trace_id, duration_ms=round((time.monotonic() - started) * 1000, 1),
+                          timings=_ms(timings))
+
+def _media_job(trace_id, text_claim, scenes, stats, media_key, timings, progress=_no_progress):
+    started = time.monotonic()
+    try:
+        return _analyze_media_shared(text_claim, scenes, stats, media_key, timings, progress)
+    finally:
+        metrics.log_event("job", trace_id=trace_id, duration_ms=round((time.monotonic() - started) * 1000, 1),
+                          timings=_ms(timings))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    return jsonify(job.to_dict())
+
+# One SSE event per stage, replayed from the start (or from Last-Event-ID on
+# reconnect); the stream ends after the `done` or `failed` event.
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    try:
+        start = int(request.headers.get("Last-Event-ID", -1)) + 1
+    except ValueError:
+        start = 0
+
+    def events():
+        index = start
+        while True:
+            batch = job.events_since(index, JOB_HEARTBEAT)
+            if not batch:
+                yield ": keep-alive\n\n"
+                continue
+            # Past the end of a finished job, the final event comes back again
+            index = min(index, len(job.events) - len(batch))
+            for event, data in batch:
+                yield f"id: {index}\n" + _sse(data, event=event)
+                index += 1
+                if event in ("done", "failed"):
+                    return
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Upstream quota: queue depth and wait times per priority class
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    return jsonify(llm.scheduler.stats())
+
+# Retries, hedges and circuit breaker state of the model upstream
+@app.route('/resilience/stats', methods=['GET'])
+def resilience_stats():
+    return jsonify(llm.stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "image": image_cache.stats(),
+        "claim": claim_cache.stats(),
+        "known_fakes": known_fakes.stats(),
+        "faq": faq.stats(),
+        "inflight": inflight.stats(),
+        "jobs": jobs.stats(),
+        "evidence": evidence.stats() if evidence is not None else None,
+        "verdicts": verdict_store.stats(),
+        "alerts": alerts_feed.stats(),
+    })
+
+# Alerts feed. Pages: ?kind=fake|notification&limit=&cursor=<next>, cacheable
+# by clients and proxies and revalidated with If-None-Match. Polling:
+# ?since=<head>[&wait=25] returns newer items, waiting for them if asked.
+@app.route('/alerts', methods=['GET'])
+def alerts():
+    kind = request.args.get("kind") or None
+    if kind not in (None, "fake", "notification"):
+        return jsonify({"error": "kind must be fake or notification."}), 400
+    try:
+        limit = int(request.args.get("limit", 20))
+        if request.args.get("since"):
+            mode = "poll"
+            wait = float(request.args.get("wait", 0))
+            rendered = alerts_feed.wait(request.args["since"], kind, limit, wait)
+            cache_control = "no-cache"
+        else:
+            mode = "page"
+            rendered = alerts_feed.page(kind, limit, request.args.get("cursor"))
+            cache_control = f"public, max-age={ALERTS_MAX_AGE}, stale-while-revalidate={ALERTS_MAX_AGE * 3}"
+    except ValueError:
+        return jsonify({"error": "Invalid limit, wait or cursor."}), 400
+    except FeedBusy as e:
+        metrics.ALERT_RESPONSES.inc(mode="poll", result="busy")
+        return jsonify({"error": "Too many clients waiting; retry shortly."}), 503, {"Retry-After": str(e.retry_after)}
+
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("If-None-Match"), rendered.etag):
+        metrics.ALERT_RESPONSES.inc(mode=mode, result="not_modified")
+        return Response(status=304, headers=dict(headers, ETag=rendered.etag))
+    coding, body, etag = rendered.encoded(request.headers.get("Accept-Encoding"))
+    metrics.ALERT_RESPONSES.inc(mode=mode, result=coding or "identity")
+    response = Response(body, mimetype="application/json", headers=dict(headers, ETag=etag))
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    return response
+
+# The same polling as SSE: one `alert` event per new item, its cursor as the
+# event id. Streams end after ALERTS_STREAM_SECONDS; EventSource reconnects
+# with Last-Event-ID and resumes where it left off.
+@app.route('/alerts/stream', methods=['GET'])
+def alerts_stream():
+    kind = request.args.get("kind") or None
+    cursor = request.headers.get("Last-Event-ID") or request.args.get("since") or alerts_feed.head(kind)
+    try:
+        alerts_feed.since(cursor, kind, 1)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor."}), 400
+    if not alerts_streams.acquire(blocking=False):
+        metrics.ALERT_RESPONSES.inc(mode="stream", result="busy")
+        return jsonify({"error": "Too many open alert streams; poll /alerts instead."}), 503, \
+            {"Retry-After": str(int(JOB_HEARTBEAT))}
+
+    def events():
+        position = cursor
+        ends = time.monotonic() + ALERTS_STREAM_SECONDS
+        yield "retry: 2000\n\n"
+        while time.monotonic() < ends:
+            try:
+                rendered = alerts_feed.wait(position, kind, timeout=JOB_HEARTBEAT)
+            except FeedBusy:
+                # No long-poll slot: sit out one heartbeat instead of spinning
+                time.sleep(min(JOB_HEARTBEAT, max(0.0, ends - time.monotonic())))
+                yield ": keep-alive\n\n"
+                continue
+            if rendered.empty:
+                yield ": keep-alive\n\n"
+                continue
+            batch = json.loads(rendered.body)
+            for item in batch["items"]:
+                yield f"id: {item['cursor']}\n" + _sse(item, event="alert")
+            position = batch["head"]
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs however the stream ends, even if it never started
+    response.call_on_close(alerts_streams.release)
+    return response
+
 def _build_cors_preflight_response():
     response = make_response()
     response.headers.add("Access-Control-Allow-Origin", "*")
@@ -1,62 +1,105 @@
 import os
-import datetime
-import PIL.Image
+import json
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from evidence_compaction import cited_sources, compact
+from evidence_index import format_passages, open_index
+from image_cache import dhash
+from image_ingest import decode_image
+from llm_provider import shared_provider
+from search_fanout import search_all
+from verdict_store import shared_store
+from verdicts import VERDICT_SCHEMA, read_verdict
 
 
 load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Official documents we ship, searched before going to the web
+evidence_index = open_index()
 
 INPUT_TEXT = "i saw this viral news on tv about election postponed indefinitely by modi ji ."
 INPUT_IMAGE_PATH = "/Users/aryangupta/college2/projects/govt-support/work/image copy.png" # Ensure this file exists in your directory
 
-def get_timestamped_folder():
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    folder_path = os.path.join(script_dir, f"check_{timestamp}")
-    os.makedirs(folder_path, exist_ok=True)
-    return folder_path
-
-def save_file(folder, name, content):
-    with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
-        f.write(content)
-    print(f"💾 Saved: {name}")
-
 def run_multimodal_pipeline(text, img_path):
-    if not API_KEY:
-        print("❌ Error: GEMINI_API_KEY missing.")
+    try:
+        llm = shared_provider()
+    except ValueError as e:
+        print(f"❌ Error: {e}")
         return
 
-    client = genai.Client(api_key=API_KEY)
-    model_id = "gemini-2.0-flash"
-    out_folder = get_timestamped_folder()
-
     image_context = ""
+    image_hash = None
     
     # --- STAGE 0: IMAGE DESCRIPTION (VLM Analysis) ---
     if img_path and os.path.exists(img_path):
         print("👁️ Stage 0: Performing VLM Visual Analysis...")
-        img = PIL.Image.open(img_path)
+        with open(img_path, "rb") as f:
+            img = decode_image(f.read())
+        image_hash = dhash(img)
         vlm_prompt = """
         Analyze this image with high precision for deepfake or manipulation detection. 
         Describe every detail: lighting consistency, shadows, edge blending, text artifacts, 
         and the specific subject matter. If this is a famous location or person, identify them.
         Provide a forensic-level description to be used for fact-checking.
         """
-        vlm_res = client.models.generate_content(model=model_id, contents=[img, vlm_prompt])
+        vlm_res = llm.generate(vlm_prompt, image=img)
         image_context = vlm_res.text
-        save_file(out_folder, "image_desc.txt", image_context)
     else:
         print("⏩ No image found, skipping VLM stage.")
 
     # Combine text and image context for the claim
     full_claim_context = f"Text Claim: {text}\nVisual Context: {image_context}"
 
-    # --- STAGE 1: SYNTHETIC QUERIES ---
-    print("🕒 Stage 1: Generating evidence-seeking queries...")
+    # --- STAGE 1: OFFICIAL DOCUMENTS ---
+    passages, confident = evidence_index.lookup(text) if text else ([], False)
+    official_text = ""
+    if passages:
+        official_text = "\nHigh-trust evidence from official ECI/PIB documents:\n" + format_passages(passages) + "\n"
+    if confident:
+        print("📚 Stage 1: Settled by official documents, skipping web search.")
+        queries = []
+        evidence = {"text": official_text, "sources": [p["url"] for p in passages if p["url"]]}
+    else:
+        queries, evidence = _search_evidence(llm, text, full_claim_context)
+        evidence["text"] = official_text + evidence["text"]
+    evidence_corpus = evidence["text"]
+
+    # --- STAGE 4: FINAL VERDICT ---
+    print("🕒 Stage 4: Synthesizing final answer...")
+    final_prompt = f"""
+    CLAIM CONTEXT: {full_claim_context}
+    COLLECTED EVIDENCE: {evidence_corpus}
+    
+    Decide if this is FACT or FAKE.
+    Return ONLY a JSON object with keys verdict, reasoning, confidence, type, sources:
+    - verdict: FACT, FAKE or UNVERIFIED
+    - reasoning: precise 1-2 sentence logic
+    - confidence: HIGH, MEDIUM or LOW
+    - type: for fakes, the kind of fake (phishing, deepfake, etc.); for real
+      claims, the kind of information (election notification, campaign, etc.)
+    - sources: 1-2 official source URLs from the evidence's Sources list for
+      authentic claims, ["Not Found As it is Fake"] for fakes
+    """
+    final_res = llm.generate(final_prompt, response_schema=VERDICT_SCHEMA)
+    report, _ = read_verdict(final_res.text)
+    if "sources" in report:
+        # Only URLs that actually came back with the evidence
+        report["sources"] = cited_sources(report["sources"], evidence["sources"]) or evidence["sources"][:1]
+    verdict = json.dumps(report, ensure_ascii=False, indent=2)
+    shared_store().record(
+        "image", report, claim=text, image_hash=image_hash, model=final_res.model,
+        image_description=image_context, queries=queries, urls=evidence["sources"], official=len(passages),
+    )
+
+    # --- TERMINAL OUTPUT ---
+    print("\n" + "="*50)
+    print("FINAL VERDICT")
+    print("="*50)
+    print(verdict)
+    print("="*50)
+
+def _search_evidence(llm, text, full_claim_context):
+    # --- STAGE 2: SYNTHETIC QUERIES ---
+    print("🕒 Stage 2: Generating evidence-seeking queries...")
     query_prompt = f"""
     Based on this context:
     {full_claim_context}
@@ -69,71 +112,18 @@ def run_multimodal_pipeline(text, img_path):
     Return ONLY the queries, one per line.
     
     """
-    q_res = client.models.generate_content(model=model_id, contents=query_prompt)
+    q_res = llm.generate(query_prompt)
     queries = [q.strip() for q in q_res.text.strip().split('\n') if q.strip()]
-    save_file(out_folder, "synthetic_queries.txt", "\n".join(queries))
 
-    # --- STAGE 2: SEARCH GROUNDING ---
-    evidence_corpus = ""
-    found_urls = []
-    
-    for q in queries:
-        print(f"🔍 Searching: {q}")
-        search_tool = types.Tool(google_search=types.GoogleSearch())
-        response = client.models.generate_content(
-            model=model_id,
-            contents=q,
-            config=types.GenerateContentConfig(tools=[search_tool])
-        )
-        
-        # Collect Metadata URLs
-        meta = response.candidates[0].grounding_metadata
-        if meta.grounding_chunks:
-            for chunk in meta.grounding_chunks:
-                if chunk.web: found_urls.append(chunk.web.uri)
-        
-        evidence_corpus += f"\n--- Evidence for {q} ---\n{response.text}\n"
-
-    save_file(out_folder, "urls.txt", "\n".join(list(set(found_urls))))
-
-    # --- STAGE 3: FINAL VERDICT ---
-    print("🕒 Stage 3: Synthesizing final answer...")
-    final_prompt = f"""
-    CLAIM CONTEXT: {full_claim_context}
-    COLLECTED EVIDENCE: {evidence_corpus}
-    
-    Decide if this is FACT or FAKE.
-    FINAL ANSWER STRUCTURE:
-    VERDICT: [FACT/FAKE/UNVERIFIED]
-    REASONING: [Precise 1-2 sentence logic]
-    SOURCES: [1-2 official source URLs]
-    Return strict json
-    
-    Final Answer structure:
-    VERDICT: [FACT/FAKE/UNVERIFIED]
-    REASONING: [Short and precise logic]
-    Type:
-    SOURCES: [1-2 URLs]
-    STRICT JSON
-    give source as "Not Found As it is Fake" for fake facts
-    and for real give few links for that authentic
-    
-    type of fake it is like phisisng deepfake etc for fake 
-    and for real it is like election notification campaign etc
-
-    return a json with keys verdict reasoning sources
-    """
-    final_res = client.models.generate_content(model=model_id, contents=final_prompt)
-    verdict = final_res.text.strip()
-    save_file(out_folder, "ans.txt", verdict)
+    # --- STAGE 3: SEARCH GROUNDING (all queries in parallel) ---
+    print(f"🔍 Stage 3: Searching {len(queries)} queries...")
+    results, _ = search_all(llm, queries)
 
-    # --- TERMINAL OUTPUT ---
-    print("\n" + "="*50)
-    print("FINAL VERDICT")
-    print("="*50)
-    print(verdict)
-    print("="*50)
-    print(f"📂 Results folder: {out_folder}")
+    # Deduplicated, claim-relevant passages within the token budget
+    evidence = compact(text or full_claim_context, results)
+    print(f"🗜️ Evidence: {evidence['stats']['tokens_in']} -> {evidence['stats']['tokens_out']} tokens, "
+          f"{evidence['stats']['duplicates']} duplicate passages dropped")
+    return queries, evidence
 
 if __name__ == "__main__":
     run_multimodal_pipeline(INPUT_TEXT, INPUT_IMAGE_PATH)
\ No newline at end of file
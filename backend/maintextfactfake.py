@@ -1,100 +1,110 @@
-import os
 import json
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from claim_cache import ClaimCache
+from evidence_compaction import cited_sources, compact
+from evidence_index import format_passages, open_index
+from known_fakes import KnownFakes
+from llm_provider import shared_provider
+from search_fanout import search_all
+from verdict_store import shared_store
+from verdicts import VERDICT_SCHEMA, read_verdict
 
 # Load Environment Variables
 load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY")
-
-def safe_save(folder, filename, content):
-    """Ensures folder exists and writes content safely."""
-    os.makedirs(folder, exist_ok=True)
-    filepath = os.path.join(folder, filename)
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(content)
-    print(f"📄 Saved: {filepath}")
-
-def fact_check_pipeline(claim):
-    if not API_KEY:
-        print("❌ Error: GEMINI_API_KEY not found in .env")
+
+# Debunked rumours are answered from the registry without a model call
+known_fakes = KnownFakes()
+# Repeated rumours (same claim, different spelling/order) reuse a recent verdict
+claim_cache = ClaimCache()
+# Official documents we ship, searched before going to the web
+evidence = open_index()
+
+def fact_check_pipeline(claim, pipeline="text"):
+    """Checks one claim. Every verdict produced goes to the verdict store,
+    labelled with `pipeline` (the batch runner passes "batch")."""
+    known = known_fakes.match(claim)
+    if known:
+        verdict = json.dumps(known, ensure_ascii=False, indent=2)
+        print(f"\n🛡️ Known fake ({known['known_fake']}): '{claim}'")
+        print(verdict)
+        shared_store().record(pipeline, known, claim=claim, model="known_fakes")
+        return verdict
+
+    try:
+        llm = shared_provider()
+    except ValueError as e:
+        print(f"❌ Error: {e}")
         return
 
-    client = genai.Client(api_key=API_KEY)
-    model_id = "gemini-2.0-flash"
-    folder_name = "fact_check_results"
+    cached = claim_cache.get(claim)
+    if cached:
+        print(f"\n♻️ Reusing cached verdict for: '{claim}'")
+        print(cached)
+        return cached
 
     print(f"\n🧐 Analyzing Claim: '{claim}'")
 
+    # --- STEP 0: OFFICIAL DOCUMENTS ---
+    passages, confident = evidence.lookup(claim)
+    official_text = ""
+    if passages:
+        official_text = "\nHigh-trust evidence from official ECI/PIB documents:\n" + format_passages(passages) + "\n"
+    if confident:
+        print("📚 Settled by official documents, skipping web search.")
+        return _final_verdict(llm, claim, official_text, pipeline, official=len(passages))
+
     # --- STEP 1: GENERATE QUERIES ---
     query_prompt = f"Generate 3-4 search queries to verify this claim: '{claim}'. Return ONLY the queries, one per line."
-    q_res = client.models.generate_content(model=model_id, contents=query_prompt)
+    q_res = llm.generate(query_prompt)
     synthetic_queries = [q.strip() for q in q_res.text.strip().split('\n') if q.strip()]
-    
-    # Save Step 1
-    safe_save(folder_name, "synthetic_queries.txt", "\n".join(synthetic_queries))
-
-    # --- STEP 2: SEARCH & FETCH ---
-    all_urls = []
-    evidence_text = ""
-    
-    for query in synthetic_queries:
-        print(f"🔍 Searching: {query}...")
-        # Use the updated Google Search tool for 2026
-        search_tool = types.Tool(google_search=types.GoogleSearch())
-        response = client.models.generate_content(
-            model=model_id,
-            contents=query,
-            config=types.GenerateContentConfig(tools=[search_tool])
-        )
-        
-        # Collect URLs from grounding metadata
-        metadata = response.candidates[0].grounding_metadata
-        if metadata.grounding_chunks:
-            for chunk in metadata.grounding_chunks:
-                if chunk.web:
-                    all_urls.append(chunk.web.uri)
-        
-        evidence_text += f"\nQuery: {query}\nEvidence: {response.text}\n"
-
-    # Save Step 2
-    unique_urls = list(set(all_urls))
-    safe_save(folder_name, "urls.txt", "\n".join(unique_urls))
 
+    # --- STEP 2: SEARCH & FETCH (all queries in parallel) ---
+    print(f"🔍 Searching {len(synthetic_queries)} queries...")
+    results, _ = search_all(llm, synthetic_queries)
+
+    # Deduplicated, claim-relevant passages within the token budget
+    compacted = compact(claim, results)
+    print(f"🗜️ Evidence: {compacted['stats']['tokens_in']} -> {compacted['stats']['tokens_out']} tokens, "
+          f"{compacted['stats']['duplicates']} duplicate passages dropped")
+    evidence_text = official_text + compacted["text"]
+
+    return _final_verdict(llm, claim, evidence_text, pipeline, compacted["sources"],
+                          queries=synthetic_queries, urls=compacted["sources"], official=len(passages))
+
+def _final_verdict(llm, claim, evidence_text, pipeline, sources=None, **provenance):
     # --- STEP 3: FINAL VERDICT ---
     final_prompt = f"""
     Based on this evidence: {evidence_text}
     Verify the claim: {claim}
-    Return strict json
-    
-    Final Answer structure:
-    VERDICT: [FACT/FAKE/UNVERIFIED]
-    REASONING: [Short and precise logic]
-    Type:
-    SOURCES: [1-2 URLs]
-    STRICT JSON
-    give source as "Not Found As it is Fake" for fake facts
-    and for real give few links for that authentic
-    
-    type of fake it is like phisisng deepfake etc for fake 
-    and for real it is like election notification ,campaign, political informationm,general ,etc, etc
-
-    return a json with keys verdict reasoning sources
+
+    Return ONLY a JSON object with keys verdict, reasoning, confidence, type, sources:
+    - verdict: FACT, FAKE or UNVERIFIED
+    - reasoning: short and precise logic
+    - confidence: HIGH, MEDIUM or LOW
+    - type: for fakes, the kind of fake (phishing, deepfake, etc.); for real
+      claims, the kind of information (election notification, campaign,
+      political information, general, etc.)
+    - sources: 1-2 URLs from the evidence's Sources list for authentic claims,
+      ["Not Found As it is Fake"] for fakes
     """
-    # TYPE OF FAKE
-    #SOURCE: FAKE- NOT FOUND , REAL: GIVE
-    
-    final_res = client.models.generate_content(model=model_id, contents=final_prompt)
-    verdict = final_res.text.strip()
-    
-    # Save Step 3
-    safe_save(folder_name, "ans.txt", verdict)
+
+    # Schema-constrained where the model supports it; read leniently either way
+    final_res = llm.generate(final_prompt, response_schema=VERDICT_SCHEMA)
+    report, complete = read_verdict(final_res.text)
+    if sources is not None and "sources" in report:
+        # Only URLs that actually came back with the evidence
+        report["sources"] = cited_sources(report["sources"], sources) or sources[:1]
+    verdict = json.dumps(report, ensure_ascii=False, indent=2)
+
+    shared_store().record(pipeline, report, claim=claim, model=final_res.model, **provenance)
+    if complete:
+        claim_cache.put(claim, verdict)
 
     # Final Terminal Output
     print("\n" + "="*40)
     print(verdict)
     print("="*40)
+    return verdict
 
 if __name__ == "__main__":
     user_input = input("Enter the claim: ")
@@ -0,0 +1,397 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as DecodeTimeout
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import PIL.Image
+import PIL.ImageSequence
+
+try:
+    import cv2
+except ImportError:  # optional: without it only animated GIF/WebP "videos" are read
+    cv2 = None
+
+import forensics
+from image_cache import HASH_DISTANCE, dhash, hamming
+from image_ingest import MODEL_IMAGE_SIDE, ImageRejected, decode_image
+from json_extract import extract_json
+from scheduler import IMAGE_TOKENS
+
+# Albums and short clips for /analyze-media. Every upload is decoded into
+# frames in a worker process: stills as they are, videos sampled at
+# SAMPLE_FPS with a frame kept only when the scene changes. Frames that are
+# near-duplicates by dHash (across all uploads) collapse into one scene, so
+# the model sees each distinct picture once, many per call.
+MAX_MEDIA_FILES = int(os.getenv("MAX_MEDIA_FILES", 8))
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_BYTES", 40 * 1024 * 1024))
+MAX_MEDIA_BYTES = int(os.getenv("MAX_MEDIA_BYTES", 64 * 1024 * 1024))
+MAX_VIDEO_SECONDS = float(os.getenv("MAX_VIDEO_SECONDS", 180))
+SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", 2))
+# Mean absolute difference (0-1) between 32x32 grey thumbnails that starts a new scene
+SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", 0.08))
+# Distinct scenes sent to the model; beyond that they are picked evenly
+MAX_SCENES = int(os.getenv("MAX_SCENES", 24))
+# Image tokens per batched vision call; one frame is one 768px tile
+BATCH_TOKENS = int(os.getenv("VLM_BATCH_TOKENS", 8000))
+FRAMES_PER_CALL = max(1, BATCH_TOKENS // IMAGE_TOKENS)
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", min(4, os.cpu_count() or 1)))
+# Longest one request's uploads may take to decode (or get forensics) in the pool
+DECODE_TIMEOUT = float(os.getenv("MEDIA_DECODE_TIMEOUT", 60))
+
+ASSESSMENTS = ("AUTHENTIC", "EDITED", "AI_GENERATED", "UNCLEAR")
+SUSPECT = ("EDITED", "AI_GENERATED")
+
+FRAME_FINDINGS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "frames": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "frame": {"type": "STRING"},
+                    "assessment": {"type": "STRING", "enum": list(ASSESSMENTS)},
+                    "finding": {"type": "STRING"},
+                },
+                "required": ["frame", "assessment", "finding"],
+            },
+        },
+    },
+    "required": ["frames"],
+}
+
+FRAMES_PROMPT = """Forensic check of {count} pictures from one social media post, in order: {labels}.
+For each one, say whether it looks authentic, edited (spliced, retouched, altered text or captions) or
+AI-generated / deepfaked. Look for GAN artifacts, warped faces or hands, lip-sync glitches, mismatched
+lighting and pasted-in text. Note when a picture contradicts the others.
+{forensics}Return ONLY JSON: {{"frames": [{{"frame": "F1", "assessment": "AUTHENTIC/EDITED/AI_GENERATED/UNCLEAR", "finding": "1 sentence."}}]}}
+"""
+
+
+# --- UPLOADS ---
+
+def read_video(file_storage):
+    """Reads an uploaded video into memory, refusing more than MAX_VIDEO_BYTES."""
+    data = file_storage.stream.read(MAX_VIDEO_BYTES + 1)
+    if len(data) > MAX_VIDEO_BYTES:
+        raise ImageRejected(f"Video is larger than {MAX_VIDEO_BYTES // (1024 * 1024)} MB.", 413)
+    if not data:
+        raise ImageRejected("Uploaded video is empty.")
+    return data
+
+
+def check_upload_count(images, videos):
+    if len(images) + len(videos) > MAX_MEDIA_FILES:
+        raise ImageRejected(f"At most {MAX_MEDIA_FILES} images and videos per check.", 413)
+
+
+def check_upload_total(sizes):
+    if sum(sizes) > MAX_MEDIA_BYTES:
+        raise ImageRejected(f"Uploads are larger than {MAX_MEDIA_BYTES // (1024 * 1024)} MB in total.", 413)
+
+
+# --- FRAMES (worker processes) ---
+
+def _thumb(img):
+    return np.asarray(img.convert("L").resize((32, 32), PIL.Image.Resampling.BILINEAR), dtype=np.float32) / 255
+
+
+def _frame(img, source, t=None):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((MODEL_IMAGE_SIDE, MODEL_IMAGE_SIDE), PIL.Image.Resampling.LANCZOS)
+    return {"source": source, "t": t, "img": img, "hash": dhash(img)}
+
+
+def _keyframes(samples, source):
+    """(time, image) samples -> the ones that start a new scene, plus the sample count.
+
+    The whole clip is read. Whenever MAX_SCENES * 4 scenes are kept, every
+    other one is dropped and from then on only every other scene change is
+    kept, so the keyframes stay spread evenly to the end of a long clip.
+    """
+    kept = []
+    last = None
+    count = 0
+    changes = 0
+    stride = 1
+    for t, img in samples:
+        count += 1
+        thumb = _thumb(img)
+        if last is None or float(np.abs(thumb - last).mean()) >= SCENE_THRESHOLD:
+            last = thumb
+            if changes % stride == 0:
+                kept.append(_frame(img, source, round(t, 1)))
+                if len(kept) >= MAX_SCENES * 4:
+                    kept = kept[::2]
+                    stride *= 2
+            changes += 1
+    return _spread(kept, MAX_SCENES * 2), count
+
+
+def _animated_samples(img):
+    """Animated GIF/WebP frames, one every 1/SAMPLE_FPS seconds."""
+    t = 0.0
+    next_sample = 0.0
+    for frame in PIL.ImageSequence.Iterator(img):
+        if t > MAX_VIDEO_SECONDS:
+            raise ImageRejected(f"Videos longer than {MAX_VIDEO_SECONDS:.0f} seconds are not supported.", 413)
+        if t >= next_sample:
+            next_sample += 1 / SAMPLE_FPS
+            yield t, frame.convert("RGB")
+        t += (frame.info.get("duration") or 100) / 1000
+
+
+def _video_samples(path):
+    """Decoded frames, one every 1/SAMPLE_FPS seconds; the rest are only grabbed."""
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ImageRejected("Uploaded file is not a supported video.")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        if frames / fps > MAX_VIDEO_SECONDS:
+            raise ImageRejected(f"Videos longer than {MAX_VIDEO_SECONDS:.0f} seconds are not supported.", 413)
+        step = max(1, round(fps / SAMPLE_FPS))
+        index = 0
+        while index / fps <= MAX_VIDEO_SECONDS and capture.grab():
+            if index % step == 0:
+                ok, bgr = capture.retrieve()
+                if ok:
+                    yield index / fps, PIL.Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+
+
+def decode_still(data, source):
+    """Image bytes -> ([frame], 1)."""
+    return [_frame(decode_image(data), source)], 1
+
+
+def decode_video(data, source, suffix=""):
+    """Video bytes -> (scene keyframes, frames sampled)."""
+    try:
+        img = PIL.Image.open(io.BytesIO(data))
+        if getattr(img, "n_frames", 1) > 1:
+            return _keyframes(_animated_samples(img), source)
+    except (PIL.UnidentifiedImageError, OSError):
+        pass
+    if cv2 is None:
+        raise ImageRejected("Video uploads are not supported on this server.", 415)
+    # OpenCV only reads from a path
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(data)
+        f.flush()
+        frames, count = _keyframes(_video_samples(f.name), source)
+    if not count:
+        raise ImageRejected("Uploaded video has no readable frames.")
+    return frames, count
+
+
+def _ping():
+    return os.getpid()
+
+
+class MediaPool:
+    """Worker processes for decoding and forensics.
+
+    A pool whose worker died (the OOM killer, a crash in a decoder) is
+    rebuilt and the request retried once on the new one. A request that
+    runs past DECODE_TIMEOUT is refused, and the pool, whose workers may
+    still be stuck on it, is rebuilt.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self):
+        # Replacements are forked from a threaded process too. The workers
+        # only run the decoders, which share no locks with the server's
+        # threads; spawn or forkserver would re-import main.py in each one
+        # under `python main.py`.
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        executor.submit(_ping).result()
+        return executor
+
+    def _restart(self, broken, reason):
+        with self._lock:
+            if self._executor is not broken:
+                return  # another request already replaced it
+            print(f"⚠️ Media pool {reason}; restarting it.")
+            # Workers stuck on a decode would hold the old pool open
+            for process in list((getattr(broken, "_processes", None) or {}).values()):
+                process.terminate()
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._start()
+            self.restarts += 1
+
+    def run(self, calls):
+        """[(fn, args)] -> their results, in order."""
+        for attempt in (1, 2):
+            executor = self._executor
+            deadline = time.monotonic() + DECODE_TIMEOUT
+            try:
+                futures = [executor.submit(fn, *args) for fn, args in calls]
+                return [f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures]
+            except BrokenProcessPool:
+                self._restart(executor, "lost a worker")
+                if attempt == 2:
+                    raise ImageRejected("Uploaded media could not be decoded.") from None
+            except DecodeTimeout:
+                self._restart(executor, f"took over {DECODE_TIMEOUT:.0f}s on one request")
+                raise ImageRejected("Uploaded media took too long to process.", 413) from None
+
+    def map(self, fn, *iterables):
+        return self.run([(fn, args) for args in zip(*iterables)])
+
+
+def start_pool(workers=MEDIA_WORKERS):
+    """A MediaPool, or None (MEDIA_WORKERS=0: decode inline).
+
+    Forked at once, so call it before the process starts any threads.
+    """
+    if workers <= 0:
+        return None
+    return MediaPool(workers)
+
+
+# --- SCENES ---
+
+def dedupe(frames, distance=HASH_DISTANCE):
+    """Near-duplicate frames (by dHash) fold into the first one, which counts them."""
+    scenes = []
+    for frame in frames:
+        twin = next((s for s in scenes if hamming(s["hash"], frame["hash"]) <= distance), None)
+        if twin is None:
+            frame["repeats"] = 1
+            scenes.append(frame)
+        else:
+            twin["repeats"] += 1
+    return scenes
+
+
+def _spread(scenes, limit):
+    if len(scenes) <= limit:
+        return scenes
+    step = len(scenes) / limit
+    return [scenes[int(i * step)] for i in range(limit)]
+
+
+def extract(stills, videos, pool=None):
+    """Decodes every upload and reduces them to distinct scenes.
+
+    `stills` is a list of image bytes, `videos` a list of (bytes, filename).
+    Returns (scenes, stats); each scene is a dict with the model-sized
+    `img`, its `hash`, `source` ("image 2", "video 1"), `t` (seconds into
+    the video) and `repeats`, and for stills the upload `data`.
+    """
+    jobs = [(decode_still, (data, f"image {i}")) for i, data in enumerate(stills, 1)]
+    jobs += [(decode_video, (data, f"video {i}", os.path.splitext(name or "")[1]))
+             for i, (data, name) in enumerate(videos, 1)]
+    results = [fn(*args) for fn, args in jobs] if pool is None else pool.run(jobs)
+
+    frames = []
+    sampled = 0
+    for (fn, args), (decoded, count) in zip(jobs, results):
+        if fn is decode_still:
+            decoded[0]["data"] = args[0]
+        frames.extend(decoded)
+        sampled += count
+    scenes = _spread(dedupe(frames), MAX_SCENES)
+    for i, scene in enumerate(scenes, 1):
+        scene["label"] = f"F{i}"
+    return scenes, {
+        "images": len(stills),
+        "videos": len(videos),
+        "frames_sampled": sampled,
+        "keyframes": len(frames),
+        "scenes": len(scenes),
+    }
+
+
+def analyze_scenes(scenes, pool=None):
+    """Local forensic pre-pass over each scene, stored as scene["forensic"]."""
+    args = ([s.get("data", b"") for s in scenes], [s["img"] for s in scenes])
+    reports = list(pool.map(forensics.analyze, *args) if pool is not None else map(forensics.analyze, *args))
+    for scene, report in zip(scenes, reports):
+        scene["forensic"] = report
+
+
+def describe(scene):
+    where = f" @ {scene['t']}s" if scene["t"] is not None else ""
+    repeats = f", seen {scene['repeats']}x" if scene["repeats"] > 1 else ""
+    return f"{scene['label']} ({scene['source']}{where}{repeats})"
+
+
+# --- BATCHED SCAN ---
+
+def batches(scenes, per_call=FRAMES_PER_CALL):
+    """Fewest calls of at most `per_call` frames, split evenly so none lags."""
+    if not scenes:
+        return []
+    calls = -(-len(scenes) // per_call)
+    size = -(-len(scenes) // calls)
+    return [scenes[i:i + size] for i in range(0, len(scenes), size)]
+
+
+def batch_prompt(batch):
+    flagged = [f"{s['label']}: {', '.join(s['forensic']['signals'])} (suspicion {s['forensic']['suspicion']})"
+               for s in batch if s.get("forensic") and s["forensic"]["signals"]]
+    notes = "Local forensic signals: " + "; ".join(flagged) + "\n" if flagged else ""
+    return FRAMES_PROMPT.format(count=len(batch), labels=", ".join(describe(s) for s in batch), forensics=notes)
+
+
+def read_findings(text):
+    """Batch answer -> {label: (assessment, finding)}; empty if unreadable."""
+    try:
+        found = extract_json(text)
+    except ValueError:
+        return {}
+    findings = {}
+    for item in found.get("frames") or []:
+        if not isinstance(item, dict) or not item.get("frame"):
+            continue
+        assessment = str(item.get("assessment", "")).strip().upper()
+        findings[str(item["frame"]).strip()] = (
+            assessment if assessment in ASSESSMENTS else "UNCLEAR",
+            str(item.get("finding", "")).strip(),
+        )
+    return findings
+
+
+def aggregate(scenes, stats, answers):
+    """Per-frame findings of every batch -> one evidence text for the verdict.
+
+    `answers` is the raw answer text of each batch, in order; a batch whose
+    answer is not readable JSON still contributes its text.
+    """
+    findings = {}
+    loose = []
+    for text in answers:
+        parsed = read_findings(text)
+        findings.update(parsed)
+        if not parsed and text:
+            loose.append(text)
+
+    suspect = [s for s in scenes if findings.get(s["label"], ("UNCLEAR",))[0] in SUSPECT]
+    lines = [
+        f"Media: {stats['images']} image(s), {stats['videos']} video(s); {stats['frames_sampled']} frames sampled, "
+        f"{stats['scenes']} distinct scene(s) checked in {len(answers)} call(s).",
+        f"Flagged as edited or AI-generated: {len(suspect)} of {len(scenes)} scene(s)"
+        + (f" ({', '.join(describe(s) for s in suspect)})." if suspect else "."),
+    ]
+    for scene in scenes:
+        assessment, finding = findings.get(scene["label"], ("UNCLEAR", "no per-frame finding"))
+        local = scene.get("forensic")
+        signals = f" Local signals: {', '.join(local['signals'])}." if local and local["signals"] else ""
+        lines.append(f"- {describe(scene)}: {assessment}. {finding}{signals}")
+    lines.extend(loose)
+    return "\n".join(lines)
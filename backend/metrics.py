@@ -0,0 +1,157 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+
+# Prometheus text exposition without the client library. Values are per
+# process: with several gunicorn workers each /metrics scrape sees one
+# worker, so scrape them individually or run a single worker with threads.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+BYTE_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+REQUEST_LOG = os.getenv("REQUEST_LOG", "1") == "1"
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(zip(self.labels, key))} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if slot < len(self.buckets):
+                series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            pairs = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(pairs + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(float(series[-2]))}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {series[-1]}")
+        return lines
+
+
+def render():
+    """All metrics in Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- METRICS ---
+
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Time to produce a response, by route.",
+                         labels=("endpoint", "method", "status"))
+STAGE_SECONDS = Histogram("pipeline_stage_duration_seconds", "Time spent in each analysis stage.",
+                          labels=("stage",))
+LLM_SECONDS = Histogram("llm_call_duration_seconds", "Model call latency, retries and hedges included.",
+                        labels=("kind", "provider"))
+LLM_TOKENS = Histogram("llm_tokens", "Upstream tokens per model call.",
+                       buckets=TOKEN_BUCKETS, labels=("kind", "direction"))
+LLM_ERRORS = Counter("llm_errors_total", "Model calls that raised.", labels=("kind", "error"))
+IMAGE_BYTES = Histogram("image_upload_bytes", "Size of uploaded images.", buckets=BYTE_BUCKETS)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Verdict cache lookups.", labels=("cache", "result"))
+VERDICTS = Counter("verdicts_total", "Verdicts returned, by outcome.", labels=("verdict", "source"))
+EVIDENCE_LOOKUPS = Counter("evidence_lookups_total", "Offline evidence index lookups, by outcome.",
+                           labels=("result",))
+VLM_CALLS = Counter("vlm_calls_total",
+                    "Image scans by mode: full, short (forensics conclusive), skipped or batched (album/video frames).",
+                    labels=("mode",))
+ALERT_RESPONSES = Counter("alert_responses_total", "Alerts feed responses, by mode and outcome.",
+                         labels=("mode", "result"))
+PARSE_FAILURES = Counter("parse_failures_total", "Model answers that were not the JSON we asked for.",
+                         labels=("stage",))
+
+
+def observe_llm_call(kind, result, seconds):
+    LLM_SECONDS.observe(seconds, kind=kind, provider=result.provider)
+    if result.tokens_in:
+        LLM_TOKENS.observe(result.tokens_in, kind=kind, direction="in")
+    if result.tokens_out:
+        LLM_TOKENS.observe(result.tokens_out, kind=kind, direction="out")
+
+
+def count_verdict(report, source):
+    verdict = str(report.get("verdict", "")).upper() if isinstance(report, dict) else ""
+    if verdict not in ("FACT", "FAKE", "UNVERIFIED", "ERROR"):
+        verdict = "OTHER"
+    VERDICTS.inc(verdict=verdict, source=source)
+
+
+# --- STRUCTURED LOGS ---
+
+def log_event(event, **fields):
+    """One JSON object per line on stdout, next to the existing print logs."""
+    if not REQUEST_LOG:
+        return
+    record = {"ts": round(time.time(), 3), "event": event}
+    record.update(fields)
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,506 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import metrics
+from llm_provider import LLMProvider, LLMResult, ProviderError, call_kind
+from scheduler import RateLimited
+
+# Retries: only for failures where asking again is safe and may help
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))
+RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", 0.25))   # seconds, doubled per attempt
+RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", 4))
+MIN_ATTEMPT = 0.5  # not worth starting an attempt with less time than this left
+
+# Hedging (off by default): if a call is slower than the p95 for its kind,
+# race a second copy, for at most HEDGE_BUDGET of all calls
+HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", 0.1))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Circuit breaker over upstream failures
+BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", 30))       # seconds of history
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 20))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", 0.5))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 15))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Second copies only; first attempts never queue here
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", 32)),
+                                 thread_name_prefix="llm-hedge")
+
+
+def _run_into(future, fn, *args, **kwargs):
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except BaseException as e:
+        future.set_exception(e)
+
+
+class CircuitOpen(ProviderError):
+    """The upstream is failing too often; calls are refused without trying."""
+
+
+class DeadlineExceeded(ProviderError):
+    """No time left in the caller's deadline for another attempt."""
+
+
+def is_transient(exc):
+    """True for failures a retry can fix: timeouts, dropped connections,
+    upstream 408/429/5xx. Bad requests and our own rate limiting are not."""
+    if isinstance(exc, (RateLimited, CircuitOpen, DeadlineExceeded)):
+        return False
+    cause = exc.__cause__ or exc
+    status = getattr(cause, "code", None)
+    if not isinstance(status, int):
+        status = getattr(getattr(cause, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    if isinstance(cause, (TimeoutError, ConnectionError, FuturesTimeout, asyncio.TimeoutError)):
+        return True
+    # httpx / requests exception names (ReadTimeout, ConnectError, ...)
+    name = type(cause).__name__
+    return any(part in name for part in ("Timeout", "Connect", "RemoteProtocol"))
+
+
+def backoff(attempt):
+    """Full jitter: uniform in [0, base * 2^attempt], capped."""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Recent successful latencies per call kind, for the hedge delay."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self._window)).append(seconds)
+
+    def p95(self, kind):
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+
+class CircuitBreaker:
+    """closed -> open when the recent error rate passes `error_rate`;
+    open -> half-open after `cooldown`, where one probe call decides."""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes = deque()  # (time, ok)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half-open":
+                self._probing = False
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, good in self._outcomes if not good)
+            if (self.state == "closed" and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._open(now)
+
+    def release(self):
+        """Gives back a half-open probe that ended without an outcome: it
+        never reached the upstream, ran out of deadline or was cancelled."""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        print(f"🔌 Model circuit opened; failing fast for {self.cooldown:.0f}s.")
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, int(self.cooldown - (time.monotonic() - self.opened_at)) + 1)
+
+
+class ResilientProvider(LLMProvider):
+    """Deadlines, retries, hedging and a circuit breaker around `inner`.
+
+    Extra keywords on generate/agenerate/stream:
+      deadline  absolute time.monotonic() by which the caller needs an
+                answer; every attempt's timeout is cut down to fit in it.
+      degraded  text to answer with (provider "degraded") instead of raising
+                when the circuit is open or every attempt failed.
+    """
+
+    def __init__(self, inner, retries=LLM_RETRIES, hedge=HEDGE, breaker=None):
+        super().__init__(inner.model, inner.timeout)
+        self.inner = inner
+        self.name = inner.name
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                          "degraded": 0, "fast_failures": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def scheduler(self):
+        return self.inner.scheduler
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _attempt_timeout(self, kwargs, deadline):
+        timeout = kwargs.get("timeout") or self.inner.timeout
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining < MIN_ATTEMPT:
+            raise DeadlineExceeded(f"{self.name}: deadline passed")
+        return min(timeout, remaining)
+
+    def _degrade(self, degraded, error):
+        if degraded is None:
+            raise error
+        self._count("degraded")
+        print(f"⚠️ Answering degraded: {error}")
+        return LLMResult(degraded, "degraded", self.model)
+
+    def _not_retryable(self, error):
+        if isinstance(error, ProviderError) and not isinstance(error, RateLimited):
+            self.breaker.record(True)  # the upstream answered; the request was bad
+        else:
+            self.breaker.release()  # never reached the upstream
+
+    def _hedge_room(self):
+        with self._lock:
+            return self._counters["hedges"] < HEDGE_BUDGET * self._counters["calls"]
+
+    def _take_hedge(self):
+        """Counts a hedge if the budget has room for it."""
+        with self._lock:
+            if self._counters["hedges"] >= HEDGE_BUDGET * self._counters["calls"]:
+                return False
+            self._counters["hedges"] += 1
+            return True
+
+    def _hedge_delay(self, kind, timeout):
+        """Seconds after which a second copy may be raced, or None."""
+        if not self.hedge or not self._hedge_room():
+            return None
+        delay = self.latency.p95(kind)
+        return delay if delay is not None and delay < timeout else None
+
+    def _refuse(self):
+        self._count("fast_failures")
+        return CircuitOpen(f"{self.name}: circuit open, retry in {self.breaker.retry_after()}s")
+
+    # --- sync ---
+
+    def generate(self, prompt, deadline=None, degraded=None, **kwargs):
+        kind = call_kind(**kwargs)
+        started = time.monotonic()
+        try:
+            result = self._generate(prompt, kind, deadline, degraded, kwargs)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, error=type(e).__name__)
+            raise
+        metrics.observe_llm_call(kind, result, time.monotonic() - started)
+        return result
+
+    def _generate(self, prompt, kind, deadline, degraded, kwargs):
+        self._count("calls")
+        error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                return self._degrade(degraded, self._refuse())
+            try:
+                timeout = self._attempt_timeout(kwargs, deadline)
+            except DeadlineExceeded as e:
+                self.breaker.release()
+                return self._degrade(degraded, error or e)
+            started = time.monotonic()
+            try:
+                result = self._hedged(prompt, dict(kwargs, timeout=timeout), kind, timeout)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # Cancelled (asyncio.wait_for) or interrupted: no outcome to record
+                    self.breaker.release()
+                    raise
+                error = e
+                if not is_transient(e):
+                    self._not_retryable(e)
+                    raise
+                self.breaker.record(False)
+                if attempt < self.retries:
+                    self._count("retries")
+                    pause = backoff(attempt)
+                    if deadline is None or time.monotonic() + pause + MIN_ATTEMPT < deadline:
+                        print(f"🔁 {kind} call failed ({e}); retrying in {pause:.2f}s")
+                        time.sleep(pause)
+                        continue
+                break
+            self.breaker.record(True)
+            self.latency.record(kind, time.monotonic() - started)
+            return result
+        return self._degrade(degraded, error)
+
+    def _hedged(self, prompt, kwargs, kind, timeout):
+        delay = self._hedge_delay(kind, timeout)
+        if delay is None:
+            return self.inner.generate(prompt, **kwargs)
+
+        # A blocking call cannot be raced from the thread making it, so the
+        # first attempt gets a thread of its own: it never waits behind
+        # other calls' copies in the hedge pool.
+        first = Future()
+        threading.Thread(target=_run_into, args=(first, self.inner.generate, prompt), kwargs=kwargs,
+                         name="llm-call", daemon=True).start()
+        try:
+            return first.result(timeout=delay)
+        except FuturesTimeout:
+            pass
+        if not self._take_hedge():
+            try:
+                return first.result(timeout=timeout - delay)
+            except FuturesTimeout:
+                raise ProviderError(f"{self.name}: {kind} call timed out") from TimeoutError()
+        second = _hedge_pool.submit(self.inner.generate, prompt, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise ProviderError(f"{self.name}: hedged {kind} call timed out") from TimeoutError()
+            for future in done:
+                try:
+                    result = future.result()
+                except ProviderError as e:
+                    error = error or e
+                    continue
+                if future is second:
+                    self._count("hedge_wins")
+                return result  # the slower copy finishes on its own timeout
+        raise error
+
+    # --- async ---
+
+    async def agenerate(self, prompt, deadline=None, degraded=None, **kwargs):
+        kind = call_kind(**kwargs)
+        started = time.monotonic()
+        try:
+            result = await self._agenerate(prompt, kind, deadline, degraded, kwargs)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, error=type(e).__name__)
+            raise
+        metrics.observe_llm_call(kind, result, time.monotonic() - started)
+        return result
+
+    async def _agenerate(self, prompt, kind, deadline, degraded, kwargs):
+        self._count("calls")
+        error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                return self._degrade(degraded, self._refuse())
+            try:
+                timeout = self._attempt_timeout(kwargs, deadline)
+            except DeadlineExceeded as e:
+                self.breaker.release()
+                return self._degrade(degraded, error or e)
+            started = time.monotonic()
+            try:
+                result = await self._ahedged(prompt, dict(kwargs, timeout=timeout), kind, timeout)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # Cancelled (asyncio.wait_for) or interrupted: no outcome to record
+                    self.breaker.release()
+                    raise
+                error = e
+                if not is_transient(e):
+                    self._not_retryable(e)
+                    raise
+                self.breaker.record(False)
+                if attempt < self.retries:
+                    self._count("retries")
+                    pause = backoff(attempt)
+                    if deadline is None or time.monotonic() + pause + MIN_ATTEMPT < deadline:
+                        await asyncio.sleep(pause)
+                        continue
+                break
+            self.breaker.record(True)
+            self.latency.record(kind, time.monotonic() - started)
+            return result
+        return self._degrade(degraded, error)
+
+    async def _ahedged(self, prompt, kwargs, kind, timeout):
+        delay = self._hedge_delay(kind, timeout)
+        if delay is None:
+            return await self.inner.agenerate(prompt, **kwargs)
+
+        first = asyncio.ensure_future(self.inner.agenerate(prompt, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self._take_hedge():
+            return await first
+        second = asyncio.ensure_future(self.inner.agenerate(prompt, **kwargs))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise ProviderError(f"{self.name}: hedged {kind} call timed out") from TimeoutError()
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is second:
+                        self._count("hedge_wins")
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # --- streaming ---
+
+    def stream(self, prompt, deadline=None, degraded=None, **kwargs):
+        # Only the wait for the first chunk can be retried; after that the
+        # caller has already shown part of the answer.
+        self._count("calls")
+        error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                yield self._degrade(degraded, self._refuse()).text
+                return
+            try:
+                timeout = self._attempt_timeout(kwargs, deadline)
+            except DeadlineExceeded as e:
+                self.breaker.release()
+                yield self._degrade(degraded, error or e).text
+                return
+            upstream = self.inner.stream(prompt, **dict(kwargs, timeout=timeout))
+            try:
+                first = next(upstream, None)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.breaker.release()
+                    upstream.close()
+                    raise
+                upstream.close()
+                error = e
+                if not is_transient(e):
+                    self._not_retryable(e)
+                    raise
+                self.breaker.record(False)
+                if attempt < self.retries:
+                    self._count("retries")
+                    time.sleep(backoff(attempt))
+                    continue
+                break
+            self.breaker.record(True)
+            try:
+                if first is not None:
+                    yield first
+                yield from upstream
+            finally:
+                upstream.close()
+            return
+        yield self._degrade(degraded, error).text
+
+    async def astream(self, prompt, deadline=None, degraded=None, **kwargs):
+        self._count("calls")
+        error = None
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                yield self._degrade(degraded, self._refuse()).text
+                return
+            try:
+                timeout = self._attempt_timeout(kwargs, deadline)
+            except DeadlineExceeded as e:
+                self.breaker.release()
+                yield self._degrade(degraded, error or e).text
+                return
+            upstream = self.inner.astream(prompt, **dict(kwargs, timeout=timeout))
+            try:
+                first = await anext(upstream, None)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.breaker.release()
+                    await upstream.aclose()
+                    raise
+                await upstream.aclose()
+                error = e
+                if not is_transient(e):
+                    self._not_retryable(e)
+                    raise
+                self.breaker.record(False)
+                if attempt < self.retries:
+                    self._count("retries")
+                    await asyncio.sleep(backoff(attempt))
+                    continue
+                break
+            self.breaker.record(True)
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in upstream:
+                    yield chunk
+            finally:
+                await upstream.aclose()
+            return
+        yield self._degrade(degraded, error).text
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["breaker"] = self.breaker.state
+        counters["breaker_trips"] = self.breaker.trips
+        counters["hedging"] = self.hedge
+        counters["hedge_budget"] = HEDGE_BUDGET
+        counters["hedge_after"] = {
+            kind: round(self.latency.p95(kind), 3)
+            for kind in ("vision", "search", "text", "chat")
+            if self.latency.p95(kind) is not None
+        }
+        return counters
@@ -0,0 +1,388 @@
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from llm_provider import LLMProvider, ProviderError
+
+# Upstream quota shared by every model call in this process. Set either to
+# 0 to switch that limit off. With several gunicorn workers each one gets
+# its own scheduler, so divide the account quota by the worker count.
+LLM_RPM = float(os.getenv("LLM_RPM", 2000))
+LLM_TPM = float(os.getenv("LLM_TPM", 4_000_000))
+# How much unused quota may pile up for a burst, in seconds of traffic
+BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", 10))
+DEFAULT_PRIORITY = os.getenv("LLM_PRIORITY", "forensics")
+
+# Weighted fair queueing between classes. `slo` is the longest a request of
+# that class may wait for quota; past it we answer 429 rather than time out.
+PRIORITY_CLASSES = {
+    "chat": {"weight": 6, "slo": float(os.getenv("LLM_SLO_CHAT", 3))},
+    "forensics": {"weight": 3, "slo": float(os.getenv("LLM_SLO_FORENSICS", 15))},
+    "batch": {"weight": 1, "slo": float(os.getenv("LLM_SLO_BATCH", 300))},
+}
+
+# Rough token estimates, reconciled with the real usage after each call
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258       # one 768px tile
+OUTPUT_TOKENS = 400      # when max_tokens is not given
+SEARCH_TOKENS = 500      # grounded answers pull in search results
+
+WAIT_EWMA_ALPHA = 0.2
+
+
+class RateLimited(ProviderError):
+    """Quota is exhausted for longer than the caller's class may wait."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+def estimate_tokens(prompt, system=None, history=None, image=None, search=False, max_tokens=None, **_):
+    chars = len(prompt or "") + len(system or "")
+    chars += sum(len(turn["text"]) for turn in history or [])
+    tokens = chars // CHARS_PER_TOKEN + (max_tokens or OUTPUT_TOKENS)
+    if image is not None:
+        tokens += IMAGE_TOKENS * (len(image) if isinstance(image, list) else 1)
+    if search:
+        tokens += SEARCH_TOKENS
+    return tokens
+
+
+class TokenBucket:
+    """Refills at `per_minute` and holds BURST_SECONDS worth at most.
+    `per_minute` <= 0 means unlimited."""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.unlimited = per_minute <= 0
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def clamp(self, cost):
+        # A call bigger than the whole bucket waits for a full bucket instead of forever
+        return min(cost, self.capacity)
+
+    def has(self, cost):
+        return self.unlimited or self.level >= self.clamp(cost)
+
+    def take(self, cost):
+        if not self.unlimited:
+            self.level -= self.clamp(cost)
+
+    def debit(self, amount):
+        """Corrects an earlier estimate; may leave the bucket below zero."""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level - amount)
+
+    def time_until(self, cost):
+        if self.unlimited:
+            return 0.0
+        return max(0.0, (self.clamp(cost) - self.level) / self.rate)
+
+
+class _Ticket:
+    __slots__ = ("priority", "tokens", "tag", "start", "enqueued", "deadline", "granted", "waker")
+
+    def __init__(self, priority, tokens, start, tag, slo):
+        self.priority = priority
+        self.tokens = tokens
+        self.start = start
+        self.tag = tag
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + slo
+        self.granted = False
+        self.waker = None  # set by async waiters, called when granted
+
+
+class Scheduler:
+    """Admission control in front of the model provider.
+
+    A call needs one request token and its estimated model tokens. If the
+    buckets cannot cover it, it queues in its priority class; classes are
+    served by weighted fair queueing (smallest virtual finish tag first,
+    with cost = estimated tokens / class weight), so a flood of cheap chat
+    calls cannot starve forensics or the other way round. A call whose
+    expected wait exceeds its class SLO is refused with RateLimited.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, classes=PRIORITY_CLASSES):
+        self.classes = classes
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._queues = {name: deque() for name in classes}
+        self._queued_tokens = {name: 0 for name in classes}
+        self._last_tag = {name: 0.0 for name in classes}
+        self._vtime = 0.0
+        self._retry_in = 0.0
+        self._cond = threading.Condition()
+        self._counters = {
+            name: {"admitted": 0, "rejected": 0, "avg_wait": 0.0, "max_wait": 0.0}
+            for name in classes
+        }
+
+    def acquire(self, priority, tokens):
+        """Blocks until the call may go upstream; returns seconds waited."""
+        if priority not in self.classes:
+            priority = DEFAULT_PRIORITY
+        with self._cond:
+            ticket = self._admit(priority, tokens)
+            if ticket is None:
+                return 0.0
+            while True:
+                waited = self._poll(ticket)
+                if waited is not None:
+                    return waited
+                self._cond.wait(self._pause(ticket))
+
+    async def aacquire(self, priority, tokens):
+        """acquire() for the event loop. The wait holds no thread, and a
+        caller cancelled while queued leaves the queue; one cancelled just
+        after its grant gives the quota back."""
+        if priority not in self.classes:
+            priority = DEFAULT_PRIORITY
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        with self._cond:
+            ticket = self._admit(priority, tokens)
+            if ticket is None:
+                return 0.0
+            ticket.waker = functools.partial(loop.call_soon_threadsafe, granted.set)
+        try:
+            while True:
+                with self._cond:
+                    waited = self._poll(ticket)
+                    if waited is not None:
+                        return waited
+                    pause = self._pause(ticket)
+                # Grants from other threads reach us via call_soon_threadsafe,
+                # so nothing can set the event between this and the wait
+                granted.clear()
+                try:
+                    await asyncio.wait_for(granted.wait(), pause)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket.granted:
+                    self._refund(ticket)
+                else:
+                    self._drop(ticket)
+            raise
+
+    def settle(self, estimated, actual):
+        """Charges the difference between the estimate and the real usage."""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens.debit(actual - estimated)
+            if actual < estimated:
+                self._dispatch(time.monotonic())
+
+    # --- internals (caller holds self._cond) ---
+
+    def _admit(self, priority, tokens):
+        """Grants at once (returns None), refuses, or queues a ticket."""
+        self._refill(time.monotonic())
+        backlog = any(self._queues.values())
+        if not backlog and self.requests.has(1) and self.tokens.has(tokens):
+            self._grant_now(priority, tokens)
+            self._record_wait(priority, 0.0)
+            return None
+
+        slo = self.classes[priority]["slo"]
+        expected = self._expected_wait(priority, tokens)
+        if expected > slo:
+            self._counters[priority]["rejected"] += 1
+            raise RateLimited(f"{priority} queue expects a {expected:.1f}s wait", expected - slo)
+        return self._enqueue(priority, tokens)
+
+    def _poll(self, ticket):
+        """Seconds waited once `ticket` is granted, else None; RateLimited
+        once it is past its class SLO."""
+        now = time.monotonic()
+        self._dispatch(now)
+        if ticket.granted:
+            return now - ticket.enqueued
+        if now >= ticket.deadline:
+            self._drop(ticket)
+            priority = ticket.priority
+            self._counters[priority]["rejected"] += 1
+            raise RateLimited(f"{priority} call waited {self.classes[priority]['slo']:.0f}s for quota",
+                              self._expected_wait(priority, ticket.tokens))
+        return None
+
+    def _pause(self, ticket):
+        return min(ticket.deadline - time.monotonic(), max(self._retry_in, 0.01))
+
+    def _refund(self, ticket):
+        self.requests.debit(-1)
+        self.tokens.debit(-self.tokens.clamp(ticket.tokens))
+        self._counters[ticket.priority]["admitted"] -= 1
+        self._dispatch(time.monotonic())
+
+    def _refill(self, now):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def _grant_now(self, priority, tokens):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self._counters[priority]["admitted"] += 1
+
+    def _enqueue(self, priority, tokens):
+        weight = self.classes[priority]["weight"]
+        start = max(self._vtime, self._last_tag[priority])
+        ticket = _Ticket(priority, tokens, start, start + tokens / weight, self.classes[priority]["slo"])
+        self._last_tag[priority] = ticket.tag
+        self._queues[priority].append(ticket)
+        self._queued_tokens[priority] += tokens
+        return ticket
+
+    def _drop(self, ticket):
+        queue = self._queues[ticket.priority]
+        queue.remove(ticket)
+        self._queued_tokens[ticket.priority] -= ticket.tokens
+        if not queue:
+            self._last_tag[ticket.priority] = self._vtime
+
+    def _dispatch(self, now):
+        self._refill(now)
+        granted = False
+        while True:
+            heads = [queue[0] for queue in self._queues.values() if queue]
+            if not heads:
+                self._retry_in = 0.0
+                break
+            ticket = min(heads, key=lambda t: t.tag)
+            if not (self.requests.has(1) and self.tokens.has(ticket.tokens)):
+                self._retry_in = max(self.requests.time_until(1), self.tokens.time_until(ticket.tokens))
+                break
+            self._queues[ticket.priority].popleft()
+            self._queued_tokens[ticket.priority] -= ticket.tokens
+            self._vtime = ticket.start
+            self._grant_now(ticket.priority, ticket.tokens)
+            self._record_wait(ticket.priority, now - ticket.enqueued)
+            ticket.granted = True
+            granted = True
+            if ticket.waker is not None:
+                try:
+                    ticket.waker()
+                except RuntimeError:
+                    pass  # its event loop has closed
+        if granted:
+            self._cond.notify_all()
+
+    def _record_wait(self, priority, waited):
+        counters = self._counters[priority]
+        counters["avg_wait"] += WAIT_EWMA_ALPHA * (waited - counters["avg_wait"])
+        counters["max_wait"] = max(counters["max_wait"], waited)
+
+    def _expected_wait(self, priority, tokens):
+        # A backlogged class gets weight / (sum of backlogged weights) of the
+        # quota, and has to get through its own queue first.
+        active = {name for name, queue in self._queues.items() if queue} | {priority}
+        share = self.classes[priority]["weight"] / sum(self.classes[n]["weight"] for n in active)
+        waits = [0.0]
+        if not self.requests.unlimited:
+            needed = len(self._queues[priority]) + 1 - self.requests.level
+            waits.append(needed / (self.requests.rate * share))
+        if not self.tokens.unlimited:
+            needed = self._queued_tokens[priority] + self.tokens.clamp(tokens) - self.tokens.level
+            waits.append(needed / (self.tokens.rate * share))
+        return max(waits)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            classes = {}
+            for name, queue in self._queues.items():
+                classes[name] = dict(
+                    self._counters[name],
+                    depth=len(queue),
+                    queued_tokens=self._queued_tokens[name],
+                    oldest_wait=round(now - queue[0].enqueued, 3) if queue else 0.0,
+                    expected_wait=round(self._expected_wait(name, OUTPUT_TOKENS), 3),
+                )
+                classes[name]["avg_wait"] = round(classes[name]["avg_wait"], 3)
+                classes[name]["max_wait"] = round(classes[name]["max_wait"], 3)
+            return {
+                "requests_available": None if self.requests.unlimited else round(self.requests.level, 1),
+                "tokens_available": None if self.tokens.unlimited else round(self.tokens.level),
+                "classes": classes,
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def shared_scheduler():
+    """One scheduler per process: every provider draws on the same quota."""
+    return Scheduler()
+
+
+class ScheduledProvider(LLMProvider):
+    """Puts every call through the scheduler before it reaches `inner`.
+
+    Callers pick a class with `priority="chat" | "forensics" | "batch"`;
+    without one, `default_priority` applies.
+    """
+
+    def __init__(self, inner, scheduler=None, default_priority=DEFAULT_PRIORITY):
+        super().__init__(inner.model, inner.timeout)
+        self.inner = inner
+        self.scheduler = scheduler or shared_scheduler()
+        self.default_priority = default_priority
+        self.name = inner.name
+
+    def _admit(self, prompt, kwargs):
+        priority = kwargs.pop("priority", None) or self.default_priority
+        estimated = estimate_tokens(prompt, **kwargs)
+        return priority, estimated
+
+    def _settle(self, estimated, result):
+        used = result.tokens_in + result.tokens_out
+        if used:
+            self.scheduler.settle(estimated, used)
+
+    def generate(self, prompt, **kwargs):
+        priority, estimated = self._admit(prompt, kwargs)
+        self.scheduler.acquire(priority, estimated)
+        result = self.inner.generate(prompt, **kwargs)
+        self._settle(estimated, result)
+        return result
+
+    async def agenerate(self, prompt, **kwargs):
+        priority, estimated = self._admit(prompt, kwargs)
+        await self.scheduler.aacquire(priority, estimated)
+        result = await self.inner.agenerate(prompt, **kwargs)
+        self._settle(estimated, result)
+        return result
+
+    def stream(self, prompt, **kwargs):
+        # Streams report no usage, so the estimate stands
+        priority, estimated = self._admit(prompt, kwargs)
+        self.scheduler.acquire(priority, estimated)
+        upstream = self.inner.stream(prompt, **kwargs)
+        try:
+            yield from upstream
+        finally:
+            upstream.close()
+
+    async def astream(self, prompt, **kwargs):
+        priority, estimated = self._admit(prompt, kwargs)
+        await self.scheduler.aacquire(priority, estimated)
+        upstream = self.inner.astream(prompt, **kwargs)
+        try:
+            async for chunk in upstream:
+                yield chunk
+        finally:
+            await upstream.aclose()
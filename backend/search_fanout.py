@@ -0,0 +1,57 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as SearchTimeout
+
+# Fan-out limits for the multi-query pipelines
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", 4))
+QUERY_TIMEOUT = float(os.getenv("SEARCH_QUERY_TIMEOUT", 20))
+
+
+def grounded_search(llm, query, timeout=QUERY_TIMEOUT):
+    result = llm.generate(query, search=True, timeout=timeout)
+    return result.text, result.urls
+
+
+def search_all(llm, queries, concurrency=SEARCH_CONCURRENCY, timeout=QUERY_TIMEOUT):
+    """Runs grounded searches for all queries concurrently.
+
+    Returns (evidence, urls): `evidence` is a list of (query, text, urls)
+    in the original query order, with text None (and no urls) for a query
+    that failed or timed out; `urls` are all of them deduplicated in the
+    order results arrived.
+    """
+    if not queries:
+        return [], []
+
+    workers = max(1, min(concurrency, len(queries)))
+    # Queries beyond the pool size start in later waves
+    deadline = timeout * math.ceil(len(queries) / workers) + 1
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    futures = {
+        pool.submit(grounded_search, llm, q, timeout): i
+        for i, q in enumerate(queries)
+    }
+
+    texts = [None] * len(queries)
+    query_urls = [[] for _ in queries]
+    urls = {}
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            i = futures[future]
+            try:
+                text, found = future.result()
+            except Exception as e:
+                print(f"⚠️ Search failed for '{queries[i]}': {e}")
+                continue
+            print(f"✅ Evidence in: {queries[i]}")
+            texts[i] = text
+            query_urls[i] = list(found)
+            for url in found:
+                urls.setdefault(url, None)
+    except SearchTimeout:
+        missing = [queries[i] for i in range(len(queries)) if texts[i] is None]
+        print(f"⏱️ Search deadline hit, continuing without: {missing}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return list(zip(queries, texts, query_urls)), list(urls)
@@ -0,0 +1,143 @@
+import abc
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Per-session chat memory limits
+MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", 6))              # user+model pairs kept verbatim
+SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_CHARS", 600))     # condensed older turns
+SESSION_IDLE_TTL = int(os.getenv("CHAT_SESSION_TTL", 30 * 60))
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 10_000))
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+")
+
+
+def new_session():
+    return {"summary": "", "turns": []}
+
+
+def resolve_session_id(candidate):
+    """Keeps a well-formed client session id, otherwise issues a new one."""
+    if candidate and _SESSION_ID_RE.match(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+class SessionStore(abc.ABC):
+    """Where chat sessions live between requests.
+
+    A session is a JSON-serialisable dict: {"summary": str, "turns": [...]}.
+    Implementations must expire sessions that have been idle for `ttl`.
+    """
+
+    @abc.abstractmethod
+    def load(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def save(self, session_id, session):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, session_id):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store: LRU-capped, idle sessions expire. Default backend."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # id -> (last_seen, session)
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            item = self._sessions.get(session_id)
+            if item is None:
+                return None
+            last_seen, session = item
+            if time.time() - last_seen > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = (time.time(), session)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Shared store for several workers. Works with any client exposing
+    Redis-style get/setex/delete (redis-py, fakeredis, a local stand-in)."""
+
+    def __init__(self, client, ttl=SESSION_IDLE_TTL, prefix="chat:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis  # optional dependency, only needed for this backend
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def load(self, session_id):
+        raw = self.client.get(self.prefix + session_id)
+        return json.loads(raw) if raw else None
+
+    def save(self, session_id, session):
+        # setex refreshes the idle timer on every turn
+        self.client.setex(self.prefix + session_id, self.ttl, json.dumps(session, ensure_ascii=False))
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+def store_from_env():
+    backend = os.getenv("CHAT_SESSION_BACKEND", "memory")
+    if backend == "redis":
+        return RedisSessionStore.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return InMemorySessionStore()
+
+
+def _first_sentence(text, limit=160):
+    sentence = _SENTENCE_RE.split(text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+
+def record_turn(session, user_text, model_text, max_turns=MAX_TURNS, summary_chars=SUMMARY_CHARS):
+    """Appends a turn, folding anything past the window into the summary."""
+    session["turns"].append({"user": user_text, "model": model_text})
+    while len(session["turns"]) > max_turns:
+        old = session["turns"].pop(0)
+        note = f"User asked: {_first_sentence(old['user'])} Assistant: {_first_sentence(old['model'])}"
+        summary = f"{session['summary']} {note}".strip()
+        # Keep the most recent part when the summary outgrows its budget
+        session["summary"] = summary[-summary_chars:]
+    return session
+
+
+def build_history(session):
+    """Session -> `history` turns for LLMProvider.generate."""
+    history = []
+    if session["summary"]:
+        history.append({"role": "user", "text": f"Summary of our earlier conversation: {session['summary']}"})
+        history.append({"role": "model", "text": "Understood."})
+    for turn in session["turns"]:
+        history.append({"role": "user", "text": turn["user"]})
+        history.append({"role": "model", "text": turn["model"]})
+    return history
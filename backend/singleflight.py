@@ -0,0 +1,75 @@
+import os
+import threading
+
+MAX_WAITERS = int(os.getenv("SINGLEFLIGHT_MAX_WAITERS", 64))
+
+
+class TooManyWaiters(RuntimeError):
+    """Too many requests are already waiting on the same in-flight key."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block and receive the same result, or the same exception.
+    Once the call finishes the key is released, so later callers start a
+    fresh execution (caching finished results is someone else's job).
+    """
+
+    def __init__(self, max_waiters=MAX_WAITERS):
+        self.max_waiters = max_waiters
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns (result, shared); `shared` is True for coalesced callers."""
+        leader = False
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                if call.waiters >= self.max_waiters:
+                    self.rejected += 1
+                    raise TooManyWaiters(f"{call.waiters} requests already waiting on this key")
+                call.waiters += 1
+                self.coalesced += 1
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
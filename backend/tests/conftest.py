@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend is a flat set of modules run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
@@ -0,0 +1,41 @@
+import pytest
+
+from claim_cache import ClaimCache
+
+CLAIM = "Lok Sabha elections 2024 will be held in 7 phases starting April 19"
+
+
+@pytest.fixture
+def cache():
+    cache = ClaimCache()
+    cache.put(CLAIM, {"verdict": "FACT"})
+    return cache
+
+
+@pytest.mark.parametrize("claim", [
+    CLAIM,
+    "lok sabha elections 2024 will be held in 7 phases starting april 19!!",
+    "Lok Sabha electons 2024 will be held in 7 phases starting April 19",
+    "BREAKING: Lok Sabha elections 2024 will be held in 7 phases starting April 19",
+])
+def test_reuses_verdict_for_rewording(cache, claim):
+    assert cache.get(claim) == {"verdict": "FACT"}
+
+
+@pytest.mark.parametrize("claim", [
+    "Lok Sabha elections 2024 will be held in 5 phases starting April 19",
+    "Lok Sabha elections 2024 will be held in seven phases starting April 19",
+    "Lok Sabha elections 2029 will be held in 7 phases starting April 19",
+    "Lok Sabha elections 2024 will be held in 7 phases starting April 29",
+    "Rajya Sabha elections 2024 will be held in 7 phases starting April 19",
+    "rajya sabha elections 2024 will be held in 7 phases starting april 19",
+    "Lok Sabha elections 2024 will not be held in 7 phases starting April 19",
+])
+def test_never_reuses_verdict_for_a_different_fact(cache, claim):
+    assert cache.get(claim) is None
+
+
+def test_transliterated_hinglish_matches():
+    cache = ClaimCache()
+    cache.put("चुनाव अनिश्चितकाल के लिए स्थगित", {"verdict": "FAKE"})
+    assert cache.get("chunaav anishchitkaal ke liye sthagit") == {"verdict": "FAKE"}
@@ -0,0 +1,37 @@
+from evidence_compaction import compact
+
+CLAIM = "Lok Sabha elections will be held in seven phases"
+
+
+def test_rewordings_of_one_fact_merge_as_corroboration():
+    results = [
+        ("q1", "The Lok Sabha elections will be held in seven phases, the Election Commission (ECI) said.",
+         ["https://eci.gov.in/press"]),
+        ("q2", "Lok Sabha elections will be held in seven phases, the Election Commission (ECI) announced.",
+         ["https://pib.gov.in/release"]),
+    ]
+    out = compact(CLAIM, results)
+    assert out["stats"]["duplicates"] == 1
+    assert out["passages"][0]["urls"] == ["https://eci.gov.in/press", "https://pib.gov.in/release"]
+
+
+def test_contradicting_numbers_are_kept_apart():
+    results = [
+        ("q1", "Lok Sabha elections will be held in seven phases, the Election Commission (ECI) said.",
+         ["https://eci.gov.in/press"]),
+        ("q2", "Lok Sabha elections will be held in five phases, the Election Commission (ECI) said.",
+         ["https://fake.example/post"]),
+    ]
+    out = compact(CLAIM, results)
+    assert out["stats"]["duplicates"] == 0
+    by_text = {p["text"]: p["urls"] for p in out["passages"]}
+    assert by_text[results[0][1]] == ["https://eci.gov.in/press"]
+    assert by_text[results[1][1]] == ["https://fake.example/post"]
+
+
+def test_different_sources_named_are_kept_apart():
+    results = [
+        ("q1", "Polling for the Lok Sabha elections will be held in seven phases, according to ECI.", ["https://a.example"]),
+        ("q2", "Polling for the Lok Sabha elections will be held in seven phases, according to WhatsApp.", ["https://b.example"]),
+    ]
+    assert compact(CLAIM, results)["stats"]["duplicates"] == 0
@@ -0,0 +1,41 @@
+import threading
+
+import evidence_index
+from evidence_index import Document, EvidenceIndex
+
+
+def _documents(version):
+    # One document changes per version, so every update adds a segment and merges follow
+    return [
+        Document(f"doc{i}", f"Notice {i}", "https://www.eci.gov.in/", "notice",
+                 f"{i}-{version if i == version % 5 else 0}",
+                 lambda i=i: f"revision of the electoral roll, notice {i} " * 40)
+        for i in range(5)
+    ]
+
+
+def test_loading_during_merges_never_misses_a_segment(tmp_path):
+    index = EvidenceIndex(str(tmp_path))
+    errors = []
+    done = threading.Event()
+
+    def load():
+        while not done.is_set():
+            try:
+                EvidenceIndex(str(tmp_path))
+            except OSError as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=load) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for version in range(evidence_index.MAX_SEGMENTS * 3):
+            index.update(_documents(version))
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert index.search("electoral roll revision")
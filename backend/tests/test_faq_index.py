@@ -0,0 +1,34 @@
+import pytest
+
+from faq_index import FAQIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FAQIndex(log_path="")
+
+
+@pytest.mark.parametrize("question", [
+    "how to delete name from voter list",
+    "how to remove name from voter list",
+    "how to object to a name in voter list",
+    "how to correct name in voter list",
+    "who won the election",
+])
+def test_one_different_word_is_not_a_match(index, question):
+    entry, _ = index.match(question)
+    assert entry is None
+
+
+@pytest.mark.parametrize("question, entry_id", [
+    ("How to register to vote", "voter-registration"),
+    ("minimum age to vote", "voting-age"),
+    ("voter list mein naam kaise check kare", "check-name-in-roll"),
+    ("is my name in the voter list", "check-name-in-roll"),
+    ("where is my polling booth", "find-polling-booth"),
+    ("can i vote without voter id", "vote-without-voter-id"),
+    ("nota kya hai", "nota"),
+])
+def test_paraphrases_still_match(index, question, entry_id):
+    entry, _ = index.match(question)
+    assert entry is not None and entry["id"] == entry_id
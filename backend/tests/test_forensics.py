@@ -0,0 +1,73 @@
+import io
+import random
+
+import PIL.Image
+import PIL.ImageDraw
+import pytest
+
+import forensics
+
+
+def chat_screenshot(fmt, seed=0):
+    """A WhatsApp-style chat screenshot: flat background, bubbles, text."""
+    rnd = random.Random(seed)
+    img = PIL.Image.new("RGB", (720, 1280), (236, 229, 221))
+    draw = PIL.ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 720, 110), fill=(7, 94, 84))
+    draw.text((110, 40), "Election Updates Group", fill=(255, 255, 255))
+    words = ["election", "postponed", "ECI", "vote", "booth", "forward", "breaking", "today"]
+    y = 150
+    while y < 1150:
+        lines = rnd.randint(1, 4)
+        width, height = rnd.randint(260, 560), 30 + 24 * lines
+        mine = rnd.random() < 0.5
+        x = 720 - width - 20 if mine else 20
+        draw.rounded_rectangle((x, y, x + width, y + height), 12,
+                               fill=(220, 248, 198) if mine else (255, 255, 255))
+        for i in range(lines):
+            text = " ".join(rnd.choice(words) for _ in range(rnd.randint(4, 9)))
+            draw.text((x + 14, y + 12 + 24 * i), text, fill=(20, 20, 20))
+        draw.text((x + width - 60, y + height - 18), f"10:4{rnd.randint(0, 9)}", fill=(120, 120, 120))
+        y += height + 16
+    buf = io.BytesIO()
+    img.save(buf, fmt, **({"quality": 80} if fmt == "JPEG" else {}))
+    data = buf.getvalue()
+    return data, PIL.Image.open(io.BytesIO(data)).convert("RGB")
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+@pytest.mark.parametrize("seed", range(4))
+def test_plain_screenshot_is_not_flagged(fmt, seed):
+    report = forensics.analyze(*chat_screenshot(fmt, seed))
+    assert report["graphic"]
+    assert not report["strong"]
+    assert "localized error-level hotspot (possible splice)" not in report["signals"]
+    assert report["suspicion"] < forensics.STRONG_SUSPICION
+
+
+def test_error_level_is_finite_on_flat_image():
+    data, img = chat_screenshot("PNG")
+    luma, _, _ = forensics._luma(data, img)
+    assert forensics.error_level(luma)["spread"] < 10
+
+
+def test_one_measure_is_never_strong(monkeypatch):
+    # However high, a single measure does not make the pre-pass conclusive
+    monkeypatch.setattr(forensics, "noise_residual", lambda luma: ({
+        "level": 0.0, "inconsistency": 9.0, "flat": 0.0, "heatmap": "0000/0000/0000/0000",
+    }, luma))
+    data, img = chat_screenshot("PNG")
+    report = forensics.analyze(data, img)
+    assert report["suspicion"] == 1.0
+    assert not report["strong"]
+
+
+@pytest.mark.parametrize("size", [(20, 600), (31, 400), (16, 16), (32, 32)])
+def test_tiny_image_does_not_crash(size):
+    img = PIL.Image.effect_noise(size, 40).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    report = forensics.analyze(buf.getvalue(), img)
+    assert not report["strong"]
+    assert report.get("too_small", False) == (min(size) < forensics.MIN_SIDE)
+    assert forensics.summarize(report)
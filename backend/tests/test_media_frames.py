@@ -0,0 +1,56 @@
+import os
+
+import PIL.Image
+import pytest
+
+import media_frames
+from image_ingest import ImageRejected
+
+
+def _clip(scenes, per_scene=2):
+    """(time, image) samples of `scenes` solid shades, each held for `per_scene` samples."""
+    for i in range(scenes * per_scene):
+        shade = (i // per_scene) * 97 % 256
+        yield i * 0.5, PIL.Image.new("RGB", (64, 64), (shade, 255 - shade, shade // 2))
+
+
+def test_keyframes_cover_the_whole_clip():
+    scenes = media_frames.MAX_SCENES * 10
+    frames, count = media_frames._keyframes(_clip(scenes), "video 1")
+    assert count == scenes * 2
+    assert len(frames) <= media_frames.MAX_SCENES * 2
+    # The last kept scene is near the end of the clip, not cut off early
+    assert frames[-1]["t"] > 0.9 * (scenes * 2 * 0.5)
+
+
+def _die():
+    os._exit(1)
+
+
+def _hang():
+    import time
+    time.sleep(30)
+
+
+def test_broken_pool_is_rebuilt():
+    pool = media_frames.MediaPool(1)
+    try:
+        with pytest.raises(ImageRejected):
+            pool.run([(_die, ())])
+        assert pool.restarts == 2
+        assert pool.run([(media_frames._ping, ())])[0] > 0
+    finally:
+        pool._executor.shutdown()
+
+
+def test_slow_decode_times_out(monkeypatch):
+    monkeypatch.setattr(media_frames, "DECODE_TIMEOUT", 0.5)
+    pool = media_frames.MediaPool(1)
+    try:
+        with pytest.raises(ImageRejected) as raised:
+            pool.run([(_hang, ())])
+        assert raised.value.status == 413
+        assert pool.restarts == 1
+        assert pool.run([(media_frames._ping, ())])[0] > 0
+    finally:
+        pool._executor.shutdown()
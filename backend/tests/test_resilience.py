@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_provider import LLMProvider, LLMResult
+from resilience import CircuitBreaker, ResilientProvider
+
+
+class SlowProvider(LLMProvider):
+    name = "slow"
+
+    def __init__(self, delay=0.0):
+        super().__init__("slow-model", 5)
+        self.delay = delay
+
+    def generate(self, prompt, **kwargs):
+        time.sleep(self.delay)
+        return LLMResult("ok", self.name, self.model)
+
+    async def agenerate(self, prompt, **kwargs):
+        await asyncio.sleep(self.delay)
+        return LLMResult("ok", self.name, self.model)
+
+    async def astream(self, prompt, **kwargs):
+        await asyncio.sleep(self.delay)
+        yield "ok"
+
+
+def _half_open():
+    breaker = CircuitBreaker(min_calls=1, error_rate=0.5, cooldown=0.0)
+    breaker.record(False)
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_probe_past_its_deadline_is_released():
+    breaker = _half_open()
+    provider = ResilientProvider(SlowProvider(), retries=0, breaker=breaker)
+
+    result = provider.generate("hi", deadline=time.monotonic() + 0.1, degraded="later")
+    assert result.provider == "degraded"
+
+    # The next call gets to probe and closes the breaker
+    assert provider.generate("hi").text == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_is_released():
+    breaker = _half_open()
+    provider = ResilientProvider(SlowProvider(delay=1.0), retries=0, breaker=breaker)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(provider.agenerate("hi"), 0.05)
+        provider.inner.delay = 0.0
+        return await provider.agenerate("hi")
+
+    assert asyncio.run(run()).text == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_stream_probe_is_released():
+    breaker = _half_open()
+    provider = ResilientProvider(SlowProvider(delay=1.0), retries=0, breaker=breaker)
+
+    async def first_chunk():
+        upstream = provider.astream("hi")
+        try:
+            return await anext(upstream)
+        finally:
+            await upstream.aclose()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(first_chunk(), 0.05)
+        provider.inner.delay = 0.0
+        return await first_chunk()
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from scheduler import RateLimited, Scheduler
+
+CLASSES = {"chat": {"weight": 1, "slo": 5.0}}
+
+
+def _drained(rpm=60):
+    scheduler = Scheduler(rpm=rpm, tpm=0, classes=CLASSES)
+    scheduler.requests.level = 0.0
+    return scheduler
+
+
+def test_async_acquire_waits_for_quota():
+    scheduler = _drained(rpm=600)  # one request every 0.1s
+
+    async def run():
+        return await scheduler.aacquire("chat", 10)
+
+    waited = asyncio.run(run())
+    assert 0.05 < waited < 1.0
+    assert scheduler.stats()["classes"]["chat"]["depth"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    scheduler = _drained()
+
+    async def run():
+        waiter = asyncio.ensure_future(scheduler.aacquire("chat", 10))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["classes"]["chat"]["depth"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["classes"]["chat"]["depth"] == 0
+    assert stats["classes"]["chat"]["admitted"] == 0
+
+
+def test_grant_to_a_cancelled_waiter_is_refunded():
+    scheduler = _drained()
+
+    async def run():
+        waiter = asyncio.ensure_future(scheduler.aacquire("chat", 10))
+        await asyncio.sleep(0.05)
+        # Quota arrives and is granted, but the caller is cancelled before it resumes
+        with scheduler._cond:
+            scheduler.requests.level = 1.0
+            scheduler._dispatch(scheduler.requests.updated)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
+    assert scheduler.requests.level >= 1.0
+    assert scheduler.stats()["classes"]["chat"]["admitted"] == 0
+
+
+def test_async_acquire_refuses_past_the_slo():
+    scheduler = Scheduler(rpm=1, tpm=0, classes=CLASSES)
+    scheduler.requests.level = 0.0
+
+    with pytest.raises(RateLimited):
+        asyncio.run(scheduler.aacquire("chat", 10))
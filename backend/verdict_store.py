@@ -0,0 +1,300 @@
+import atexit
+import functools
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from claim_cache import canonical_key
+
+# Every verdict any pipeline produces, in one SQLite database (WAL mode, so
+# readers never wait for the writer). Requests only enqueue the record; a
+# single writer thread commits whatever has queued up in one transaction,
+# so storing a verdict adds nothing to request latency.
+VERDICT_DB = os.getenv("VERDICT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "verdicts.db"))
+WRITE_QUEUE = int(os.getenv("VERDICT_WRITE_QUEUE", 10_000))
+# The writer waits this long (seconds) for more records before committing
+GROUP_COMMIT_WINDOW = float(os.getenv("VERDICT_GROUP_COMMIT", 0.05))
+MAX_BATCH = 500
+# Rows older than this are folded into daily counts and deleted
+RETENTION_DAYS = int(os.getenv("VERDICT_RETENTION_DAYS", 90))
+COMPACT_EVERY = int(os.getenv("VERDICT_COMPACT_EVERY", 3600))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    id          INTEGER PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    pipeline    TEXT NOT NULL,
+    claim       TEXT,
+    claim_hash  TEXT,
+    image_hash  TEXT,
+    verdict     TEXT,
+    confidence  TEXT,
+    type        TEXT,
+    reasoning   TEXT,
+    sources     TEXT,
+    timings     TEXT,
+    model       TEXT,
+    trace_id    TEXT,
+    extra       TEXT
+);
+CREATE INDEX IF NOT EXISTS verdicts_claim_hash ON verdicts (claim_hash, created_at);
+CREATE INDEX IF NOT EXISTS verdicts_image_hash ON verdicts (image_hash, created_at);
+CREATE INDEX IF NOT EXISTS verdicts_verdict ON verdicts (verdict, created_at);
+CREATE INDEX IF NOT EXISTS verdicts_created ON verdicts (created_at);
+CREATE TABLE IF NOT EXISTS verdict_rollups (
+    day       TEXT NOT NULL,
+    pipeline  TEXT NOT NULL,
+    verdict   TEXT NOT NULL,
+    count     INTEGER NOT NULL,
+    PRIMARY KEY (day, pipeline, verdict)
+);
+"""
+
+_COLUMNS = ("created_at", "pipeline", "claim", "claim_hash", "image_hash", "verdict", "confidence",
+            "type", "reasoning", "sources", "timings", "model", "trace_id", "extra")
+_JSON_COLUMNS = ("sources", "timings", "extra")
+
+
+def claim_hash(claim):
+    """Stable id for a claim: rewordings with the same canonical form share it."""
+    key = canonical_key(claim or "")
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] if key else None
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class VerdictStore:
+    """Append-only verdict log with indexed lookups and daily rollups."""
+
+    def __init__(self, path=VERDICT_DB, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        conn = _connect(path)
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE)
+        self._local = threading.local()
+        self._stopped = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._listeners = []
+        self._writer = threading.Thread(target=self._write_loop, name="verdict-store", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # --- WRITES ---
+
+    def record(self, pipeline, report, claim=None, image_hash=None, timings=None, model=None,
+               trace_id=None, **extra):
+        """Queues one verdict; never blocks. Returns False if the queue is full."""
+        report = report if isinstance(report, dict) else {"reasoning": str(report)}
+        row = (
+            time.time(),
+            pipeline,
+            claim or None,
+            claim_hash(claim),
+            f"{image_hash:016x}" if isinstance(image_hash, int) else image_hash,
+            report.get("verdict"),
+            report.get("confidence"),
+            report.get("type"),
+            report.get("reasoning"),
+            json.dumps(report.get("sources"), ensure_ascii=False) if report.get("sources") else None,
+            json.dumps({k: round(v, 4) for k, v in dict(timings).items()}) if timings else None,
+            model,
+            trace_id,
+            json.dumps(extra, ensure_ascii=False, default=str) if extra else None,
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        next_compaction = time.monotonic() + 60
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                rows = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                rows = []
+            # Group commit: whatever arrives within the window joins this batch
+            window_ends = time.monotonic() + GROUP_COMMIT_WINDOW
+            while rows and len(rows) < MAX_BATCH:
+                try:
+                    rows.append(self._queue.get(timeout=max(0.0, window_ends - time.monotonic())))
+                except queue.Empty:
+                    break
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(
+                            f"INSERT INTO verdicts ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                            rows,
+                        )
+                    self.written += len(rows)
+                    self.batches += 1
+                except sqlite3.Error as e:
+                    self.dropped += len(rows)
+                    print(f"⚠️ Verdict store write failed ({len(rows)} rows): {e}")
+                else:
+                    for listener in self._listeners:
+                        # A failing listener must not stop the writer
+                        try:
+                            listener()
+                        except Exception as e:
+                            print(f"⚠️ Verdict store listener failed: {e}")
+                for _ in rows:
+                    self._queue.task_done()
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + COMPACT_EVERY
+                try:
+                    self._compact(conn)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Verdict store compaction failed: {e}")
+        conn.close()
+
+    def on_commit(self, listener):
+        """Calls `listener()` (on the writer thread) after each committed batch.
+        Listeners should be quick; exceptions are logged and ignored. Other
+        processes sharing the file are not told; they have to poll."""
+        self._listeners.append(listener)
+
+    def flush(self):
+        """Blocks until everything queued so far is committed."""
+        self._queue.join()
+
+    def close(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._writer.join(timeout=10)
+
+    def _compact(self, conn):
+        """Folds rows past the retention window into verdict_rollups."""
+        cutoff = time.time() - self.retention_days * 86400
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO verdict_rollups (day, pipeline, verdict, count)
+                SELECT date(created_at, 'unixepoch'), pipeline, COALESCE(verdict, 'NONE'), COUNT(*)
+                FROM verdicts WHERE created_at < ?
+                GROUP BY 1, 2, 3
+                ON CONFLICT (day, pipeline, verdict) DO UPDATE SET count = count + excluded.count
+                """,
+                (cutoff,),
+            )
+            removed = conn.execute("DELETE FROM verdicts WHERE created_at < ?", (cutoff,)).rowcount
+        if removed:
+            conn.execute("PRAGMA incremental_vacuum")
+            print(f"🗜️ Verdict store: rolled up {removed} records older than {self.retention_days} days")
+        return removed
+
+    def compact(self):
+        """Runs a compaction now (also done hourly by the writer)."""
+        conn = _connect(self.path)
+        try:
+            return self._compact(conn)
+        finally:
+            conn.close()
+
+    # --- READS ---
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    @staticmethod
+    def _row(row):
+        record = dict(row)
+        for column in _JSON_COLUMNS:
+            if record.get(column):
+                record[column] = json.loads(record[column])
+        return record
+
+    def recent(self, limit=50, verdict=None, before_id=None, since=None):
+        """Newest first. `before_id` pages backwards; `since` is a unix time."""
+        clauses, params = [], []
+        if verdict:
+            clauses.append("verdict = ?")
+            params.append(verdict.upper())
+        if before_id:
+            clauses.append("id < ?")
+            params.append(int(before_id))
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(float(since))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT * FROM verdicts {where} ORDER BY id DESC LIMIT ?", (*params, int(limit))
+        )
+        return [self._row(r) for r in rows]
+
+    def after(self, after_id, verdict=None, limit=500):
+        """Oldest first, ids above `after_id`: for tailing the log."""
+        clause, params = ("AND verdict = ?", (verdict.upper(),)) if verdict else ("", ())
+        rows = self._reader().execute(
+            f"SELECT * FROM verdicts WHERE id > ? {clause} ORDER BY id LIMIT ?",
+            (int(after_id), *params, int(limit)),
+        )
+        return [self._row(r) for r in rows]
+
+    def by_claim(self, claim, limit=20):
+        rows = self._reader().execute(
+            "SELECT * FROM verdicts WHERE claim_hash = ? ORDER BY created_at DESC LIMIT ?",
+            (claim_hash(claim), int(limit)),
+        )
+        return [self._row(r) for r in rows]
+
+    def by_image(self, image_hash, limit=20):
+        value = f"{image_hash:016x}" if isinstance(image_hash, int) else image_hash
+        rows = self._reader().execute(
+            "SELECT * FROM verdicts WHERE image_hash = ? ORDER BY created_at DESC LIMIT ?",
+            (value, int(limit)),
+        )
+        return [self._row(r) for r in rows]
+
+    def counts(self, since=None):
+        """{verdict: count} over live rows (since a unix time) plus rollups."""
+        conn = self._reader()
+        totals = {}
+        query = "SELECT COALESCE(verdict, 'NONE'), COUNT(*) FROM verdicts"
+        rows = conn.execute(query + " WHERE created_at >= ? GROUP BY 1", (since,)) if since else \
+            conn.execute(query + " GROUP BY 1")
+        for verdict, count in rows:
+            totals[verdict] = totals.get(verdict, 0) + count
+        if not since:
+            for verdict, count in conn.execute("SELECT verdict, SUM(count) FROM verdict_rollups GROUP BY 1"):
+                totals[verdict] = totals.get(verdict, 0) + count
+        return totals
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "written": self.written,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def shared_store():
+    """One store (and one writer thread) per process."""
+    return VerdictStore()
@@ -0,0 +1,68 @@
+import re
+
+from json_extract import extract_json
+
+# The report shape /analyze-media returns (plus "sources", set by main.py)
+VERDICTS = ("FACT", "FAKE", "UNVERIFIED")
+CONFIDENCE = ("HIGH", "MEDIUM", "LOW")
+
+# Structured-output schema (Gemini OpenAPI subset). Verdict comes first so a
+# cut-off answer still carries it.
+VERDICT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "verdict": {"type": "STRING", "enum": list(VERDICTS)},
+        "reasoning": {"type": "STRING"},
+        "confidence": {"type": "STRING", "enum": list(CONFIDENCE)},
+        "type": {"type": "STRING"},
+        "sources": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["verdict", "reasoning", "confidence", "type"],
+    "propertyOrdering": ["verdict", "reasoning", "confidence", "type", "sources"],
+}
+
+# Same contract spelled out in the prompt, for calls where the schema cannot
+# be enforced (grounded search on models without tools + schema support)
+VERDICT_INSTRUCTIONS = """
+    Return ONLY JSON:
+    {
+      "verdict": "FACT/FAKE/UNVERIFIED",
+      "reasoning": "2 sentences.",
+      "confidence": "HIGH/MEDIUM/LOW",
+      "type": "Deepfake/Authentic/Misleading/AI Generated"
+    }
+"""
+
+_JSON_BLOCK_RE = re.compile(r"```(?:json)?.*?(```|$)|\{.*", re.DOTALL)
+
+
+def _prose(text, limit=300):
+    """The answer's own words, without any JSON attempt, for a reasoning line."""
+    prose = " ".join(_JSON_BLOCK_RE.sub(" ", text or "").split())
+    return prose if len(prose) <= limit else prose[:limit].rstrip() + "…"
+
+
+def read_verdict(text):
+    """Model answer -> (report, complete).
+
+    Recovers whatever fields the answer holds, even from truncated or sloppy
+    JSON. `complete` is False unless all four fields came back valid; the
+    gaps are then filled in (UNVERIFIED, LOW) and the report should not be
+    cached.
+    """
+    try:
+        found = extract_json(text)
+    except ValueError:
+        found = {}
+
+    report = dict(found)
+    verdict = str(found.get("verdict", "")).strip().upper()
+    reasoning = str(found.get("reasoning", "")).strip()
+    confidence = str(found.get("confidence", "")).strip().upper()
+    complete = verdict in VERDICTS and bool(reasoning) and confidence in CONFIDENCE and bool(found.get("type"))
+
+    report["verdict"] = verdict if verdict in VERDICTS else "UNVERIFIED"
+    report["reasoning"] = reasoning or _prose(text) or "The automated check returned no usable reasoning."
+    report["confidence"] = confidence if confidence in CONFIDENCE else "LOW"
+    report["type"] = found.get("type") or "Unverified"
+    return report, complete
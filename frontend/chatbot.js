@@ -75,9 +75,15 @@
     document.body.insertAdjacentHTML('beforeend', botHTML);
 
     // 3. Logic: All functions bound to window to ensure HTML attributes work
+    const API_BASE = 'https://bharat-mat.onrender.com';
+    let activeStream = null; // AbortController of the reply being streamed
+
     window.toggleBot = () => {
         const win = document.getElementById('bot-window');
-        win.style.display = (win.style.display === 'flex') ? 'none' : 'flex';
+        const closing = win.style.display === 'flex';
+        win.style.display = closing ? 'none' : 'flex';
+        // Closing the widget cancels the stream so the server stops generating
+        if (closing && activeStream) activeStream.abort();
     };
 
     window.handleChip = (text) => {
@@ -104,26 +110,96 @@
             </div>`;
         container.scrollTop = container.scrollHeight;
 
+        const removeThinking = () => {
+            const thinkingEl = document.getElementById(thinkingId);
+            if(thinkingEl) thinkingEl.remove();
+        };
+
+        let bubble = null;
+        // Errors the server reported (busy, bad request) are shown as they
+        // are; only a missing or unreachable stream endpoint falls back
+        const serverError = (reply) => Object.assign(new Error(reply), { fromServer: true });
+        const controller = new AbortController();
+        activeStream = controller;
+
         try {
-            // REAL BACKEND CALL
-            const response = await fetch('https://bharat-mat.onrender.com/chat', {
+            // REAL BACKEND CALL (streamed as server-sent events)
+            const response = await fetch(`${API_BASE}/chat/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: val })
+                body: JSON.stringify({ message: val }),
+                signal: controller.signal
             });
+            if (response.status === 404 || (response.ok && !response.body)) throw new Error('stream unavailable');
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                throw serverError(data.reply || data.error || `Server error (${response.status}).`);
+            }
 
-            const data = await response.json();
-            
-            const thinkingEl = document.getElementById(thinkingId);
-            if(thinkingEl) thinkingEl.remove();
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE events are separated by a blank line
+                let split;
+                while ((split = buffer.indexOf('\n\n')) !== -1) {
+                    const raw = buffer.slice(0, split);
+                    buffer = buffer.slice(split + 2);
+                    const event = (raw.match(/^event: (.*)$/m) || [])[1] || 'message';
+                    const dataLine = (raw.match(/^data: (.*)$/m) || [])[1];
+                    if (!dataLine) continue;
+                    const payload = JSON.parse(dataLine);
+
+                    if (event === 'error') throw serverError(payload.reply);
+                    if (payload.delta) {
+                        if (!bubble) {
+                            removeThinking();
+                            container.insertAdjacentHTML('beforeend', '<div class="msg bot"></div>');
+                            bubble = container.lastElementChild;
+                        }
+                        text += payload.delta;
+                        bubble.innerHTML = text;
+                        container.scrollTop = container.scrollHeight;
+                    }
+                }
+            }
+            removeThinking();
 
-            // Append response from Python/Gemini
-            container.innerHTML += `<div class="msg bot">${data.reply}</div>`;
-            
         } catch (error) {
-            const thinkingEl = document.getElementById(thinkingId);
-            if(thinkingEl) thinkingEl.remove();
-            container.innerHTML += `<div class="msg bot"><strong>Error:</strong> Backend unreachable. Please start your Python server.</div>`;
+            if (error.name === 'AbortError') { removeThinking(); return; }
+            if (error.fromServer) {
+                removeThinking();
+                if (bubble) bubble.innerHTML += `<br><strong>Error:</strong> ${error.message}`;
+                else container.innerHTML += `<div class="msg bot"><strong>Error:</strong> ${error.message}</div>`;
+                return;
+            }
+            if (bubble) {
+                bubble.innerHTML += '<br><strong>Error:</strong> Reply was interrupted.';
+                return;
+            }
+            // Older deployments only have the one-shot endpoint
+            try {
+                const response = await fetch(`${API_BASE}/chat`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ message: val })
+                });
+                const data = await response.json();
+                removeThinking();
+                container.innerHTML += `<div class="msg bot">${data.reply}</div>`;
+            } catch (fallbackError) {
+                removeThinking();
+                container.innerHTML += `<div class="msg bot"><strong>Error:</strong> Backend unreachable. Please start your Python server.</div>`;
+            }
+        } finally {
+            // A newer message may already have its own stream
+            if (activeStream === controller) activeStream = null;
         }
         
         container.scrollTop = container.scrollHeight;